@@ -0,0 +1,136 @@
+import argparse
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+WEAPON_FIELDS = ['rifle_kills', 'sniper_kills', 'smg_kills', 'pistol_kills', 'grenade_kills', 'other_kills']
+
+# Campos de agrupamento das coleções resumidas; uma mudança em qualquer jogador só afeta
+# os grupos dos valores antigos e novos destes campos
+GROUP_FIELDS = ['country', 'age', 'current_team']
+
+# ======================
+# Coleções resumidas
+# ======================
+# Os resumos por idade e por time têm uma linha por valor da chave, então não crescem com o número de
+# jogadores. Os resumos por país guardam também o valor filtrado (maps_played ou o percentual de vitórias),
+# para responder a qualquer limite: têm uma linha por par (país, valor) distinto e crescem com a coleção
+# (no CSV atual, 795 e 627 linhas para 811 jogadores). O ganho deles está em documentos pequenos, lidos
+# pelo índice no valor filtrado, e não no número de linhas.
+
+ROLLUPS = {
+    # Média de kills por país, para qualquer limite de maps_played
+    'summary_country_maps': {
+        'scope': 'country',
+        'group_id': {'country': '$country', 'maps_played': '$stats.maps_played'},
+        'accumulators': {
+            'players': {'$sum': 1},
+            'sum_total_kills': {'$sum': '$stats.total_kills'},
+            'count_total_kills': {'$sum': {'$cond': [{'$isNumber': '$stats.total_kills'}, 1, 0]}},
+        },
+        'indexes': [IndexModel([('_id.maps_played', ASCENDING)])],
+    },
+    # Média do percentual de vitórias após o primeiro kill por país, para qualquer limite
+    'summary_country_win_percent': {
+        'scope': 'country',
+        'group_id': {'country': '$country', 'win_percent': '$stats.team_win_percent_after_first_kill'},
+        'accumulators': {
+            'players': {'$sum': 1},
+        },
+        'indexes': [IndexModel([('_id.win_percent', ASCENDING)])],
+    },
+    # K/D por idade; as faixas etárias são montadas na consulta
+    'summary_age': {
+        'scope': 'age',
+        'group_id': '$age',
+        'accumulators': {
+            'players': {'$sum': 1},
+            'sum_kills_per_death': {'$sum': '$stats.kills_per_death'},
+            'count_kills_per_death': {'$sum': {'$cond': [{'$isNumber': '$stats.kills_per_death'}, 1, 0]}},
+        },
+        'indexes': [],
+    },
+    # Kills por arma por time
+    'summary_team': {
+        'scope': 'current_team',
+        'group_id': '$current_team',
+        'accumulators': {
+            field: {'$sum': f'$kills_breakdown.{field}'} for field in WEAPON_FIELDS
+        },
+        'indexes': [IndexModel([('rifle_kills', DESCENDING)])],
+    },
+}
+
+
+def _scope_path(rollup):
+    """Caminho da chave de agrupamento (país, idade ou time) dentro do _id do resumo."""
+    group_id = rollup['group_id']
+    return f"_id.{rollup['scope']}" if isinstance(group_id, dict) else '_id'
+
+
+def refresh_rollup(db, name, keys=None, players_collection='players'):
+    """Recalcula um resumo com $merge. Com keys, recalcula apenas os grupos desses valores."""
+    rollup = ROLLUPS[name]
+    token = ObjectId()
+    match = {} if keys is None else {rollup['scope']: {'$in': list(keys)}}
+    db[players_collection].aggregate([
+        {'$match': match},
+        {'$group': {'_id': rollup['group_id'], **rollup['accumulators']}},
+        {'$set': {'refresh_token': token}},
+        {'$merge': {'into': name, 'on': '_id', 'whenMatched': 'replace', 'whenNotMatched': 'insert'}},
+    ])
+    # Grupos que deixaram de existir não foram tocados pelo $merge desta execução
+    stale = {'refresh_token': {'$ne': token}}
+    if keys is not None:
+        stale[_scope_path(rollup)] = {'$in': list(keys)}
+    db[name].delete_many(stale)
+
+
+def ensure_rollup_indexes(db):
+    """Cria os índices usados pelas consultas sobre os resumos."""
+    for name, rollup in ROLLUPS.items():
+        if rollup['indexes']:
+            db[name].create_indexes(rollup['indexes'])
+
+
+def refresh_all(db, players_collection='players'):
+    """Recalcula todos os resumos a partir da coleção inteira (usado após cargas completas)."""
+    for name in ROLLUPS:
+        refresh_rollup(db, name, players_collection=players_collection)
+    ensure_rollup_indexes(db)
+    print(f"{len(ROLLUPS)} resumos recalculados.")
+
+
+def refresh_groups(db, affected_groups, players_collection='players'):
+    """Recalcula apenas os grupos afetados por uma carga incremental.
+
+    affected_groups mapeia cada campo de GROUP_FIELDS para os valores (antigos e novos)
+    dos jogadores alterados, inseridos ou removidos.
+    """
+    refreshed = 0
+    for name, rollup in ROLLUPS.items():
+        keys = affected_groups.get(rollup['scope'])
+        if keys:
+            refresh_rollup(db, name, keys, players_collection)
+            refreshed += 1
+    ensure_rollup_indexes(db)
+    print(f"{refreshed} resumos atualizados incrementalmente.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalcula as coleções resumidas usadas pelo dashboard.")
+    parser.add_argument('--uri', default="mongodb://localhost:27017/")
+    args = parser.parse_args()
+
+    # Import local para reaproveitar a conexão do carregador
+    from insercao_banco import connect_to_mongodb
+
+    client = connect_to_mongodb(args.uri)
+    try:
+        refresh_all(client['csgo_db'])
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import argparse
+import math
+import os
+import time
+
+import queries_async
+from backend_colunar import AGE_BOUNDARIES
+from cache_consultas import META_COLLECTION, read_collection_version, read_collection_version_async
+
+# Configuração da amostra (pode ser sobrescrita por variáveis de ambiente)
+SAMPLE_COLLECTION = 'sample_players'
+SAMPLE_DOC_ID = 'sample'
+SAMPLE_RATE = float(os.getenv("CSGO_SAMPLE_RATE", "0.05"))
+# Países pequenos entram inteiros (ou com pelo menos este número de jogadores), para que cada estimativa
+# por país tenha uma margem de erro utilizável
+MIN_PER_STRATUM = int(os.getenv("CSGO_SAMPLE_MIN_PER_STRATUM", "30"))
+# Tamanho do $sample usado enquanto a amostra mantida não está na versão atual dos dados
+FALLBACK_SAMPLE_SIZE = int(os.getenv("CSGO_SAMPLE_SIZE", "2000"))
+# Intervalo de confiança de 95%
+CONFIDENCE_Z = 1.96
+CONFIDENCE_DELTA = 0.05
+# Campos copiados para a amostra: os lidos pelas consultas aproximadas
+SAMPLE_FIELDS = ['country', 'age', 'stats.maps_played', 'stats.total_kills', 'stats.kills_per_death']
+
+# ======================
+# Amostra estratificada
+# ======================
+# A amostra é estratificada por país: cada jogador entra com probabilidade proporcional ao tamanho
+# desejado do seu país, e guarda o peso _weight (jogadores do país / jogadores do país na amostra).
+# As consultas aproximadas são somas ponderadas sobre ela, com a margem de erro calculada pela
+# variância da amostra. É recalculada por insercao_banco.py ao fim de cada carga.
+
+
+# Estrato de cada jogador: o país como texto, com ausente/null no estrato '' (e NaN em 'NaN', via $toString).
+# A mesma expressão agrupa a população, sorteia a amostra e atribui os pesos, então as chaves sempre batem
+STRATUM = {'$ifNull': [{'$toString': '$country'}, '']}
+
+
+def _by_stratum(values):
+    """Valor do dicionário (estrato -> valor) correspondente ao estrato do documento (ausente se não houver)."""
+    # $filter sobre pares em vez de $getField: antes do 7.2 o campo de $getField precisa ser constante
+    pairs = [{'k': stratum, 'v': value} for stratum, value in values.items()]
+    return {'$arrayElemAt': [
+        {'$map': {'input': {'$filter': {'input': {'$literal': pairs}, 'cond': {'$eq': ['$$this.k', STRATUM]}}},
+                  'in': '$$this.v'}},
+        0
+    ]}
+
+
+def refresh_sample(db, rate=SAMPLE_RATE, min_per_stratum=MIN_PER_STRATUM, players_collection='players'):
+    """Recalcula a amostra estratificada por país em duas passadas pela coleção, sem trazer os jogadores ao cliente.
+
+    Usa $rand e atualização com pipeline (MongoDB 5.0+).
+    """
+    players = db[players_collection]
+    population = {row['_id']: row['players'] for row in players.aggregate([
+        {'$group': {'_id': STRATUM, 'players': {'$sum': 1}}}
+    ])}
+    if not population:
+        print("Coleção de jogadores vazia; amostra não gerada.")
+        return 0
+    probabilities = {
+        stratum: min(1.0, max(min_per_stratum, rate * players) / players)
+        for stratum, players in population.items()
+    }
+    players.aggregate([
+        {'$match': {'$expr': {'$lt': [{'$rand': {}}, {'$ifNull': [_by_stratum(probabilities), 1]}]}}},
+        {'$project': {field: 1 for field in SAMPLE_FIELDS}},
+        {'$out': SAMPLE_COLLECTION},
+    ])
+
+    # Peso de cada estrato pelo tamanho que a amostra realmente teve, gravado em uma única atualização
+    sample = db[SAMPLE_COLLECTION]
+    sampled = {row['_id']: row['sampled'] for row in sample.aggregate([
+        {'$group': {'_id': STRATUM, 'sampled': {'$sum': 1}}}
+    ])}
+    weights = {stratum: population[stratum] / count for stratum, count in sampled.items()}
+    sample.update_many({}, [{'$set': {'_weight': _by_stratum(weights)}}])
+    size = sum(sampled.values())
+    db[META_COLLECTION].update_one(
+        {'_id': SAMPLE_DOC_ID},
+        {'$set': {'version': read_collection_version(db), 'size': size, 'population': sum(population.values()),
+                  'strata': len(population)}, '$currentDate': {'updated_at': True}},
+        upsert=True
+    )
+    print(f"Amostra com {size:,} de {sum(population.values()):,} jogadores ({len(population)} países).")
+    return size
+
+
+async def _aggregate_sample(stages):
+    """Executa os estágios sobre a amostra mantida ou, se ela estiver desatualizada, sobre um $sample da coleção."""
+    db = queries_async.get_client()[queries_async.DB_NAME]
+    info = await db[META_COLLECTION].find_one({'_id': SAMPLE_DOC_ID})
+    if info is not None and info.get('version') == await read_collection_version_async(db):
+        cursor = await db[SAMPLE_COLLECTION].aggregate(stages)
+    else:
+        # Amostra aleatória simples: todos os jogadores com o mesmo peso
+        players = db['players']
+        population = await players.estimated_document_count()
+        size = min(FALLBACK_SAMPLE_SIZE, population)
+        if not size:
+            return []
+        cursor = await players.aggregate([{'$sample': {'size': size}}, {'$set': {'_weight': population / size}}] + stages)
+    return await cursor.to_list()
+
+# ======================
+# Estimadores
+# ======================
+
+def _moments(path):
+    """Acumuladores das somas ponderadas de um campo numérico (ignorando os ausentes)."""
+    value = f'${path}'
+    is_number = {'$isNumber': value}
+    return {
+        'weight': {'$sum': '$_weight'},
+        'sampled': {'$sum': 1},
+        'n_x': {'$sum': {'$cond': [is_number, 1, 0]}},
+        'w_x': {'$sum': {'$cond': [is_number, '$_weight', 0]}},
+        'ww_x': {'$sum': {'$cond': [is_number, {'$multiply': ['$_weight', '$_weight']}, 0]}},
+        'wx': {'$sum': {'$cond': [is_number, {'$multiply': ['$_weight', value]}, 0]}},
+        'wxx': {'$sum': {'$cond': [is_number, {'$multiply': ['$_weight', value, value]}, 0]}},
+    }
+
+
+def _estimate_mean(row):
+    """Média ponderada e margem de erro (95%) a partir das somas de _moments."""
+    if not row['w_x']:
+        return None, None
+    mean = row['wx'] / row['w_x']
+    if row['n_x'] < 2:
+        return mean, None
+    variance = max(row['wxx'] / row['w_x'] - mean ** 2, 0.0) * row['n_x'] / (row['n_x'] - 1)
+    # Tamanho efetivo da amostra com pesos diferentes (Kish)
+    effective_size = row['w_x'] ** 2 / row['ww_x']
+    # Correção para população finita: um país que entrou inteiro na amostra não tem erro
+    finite_population = max(0.0, 1 - row['n_x'] / row['w_x'])
+    return mean, CONFIDENCE_Z * math.sqrt(variance / effective_size * finite_population)
+
+
+def _approximate_query(func):
+    """Aplica cache e instrumentação às consultas aproximadas (sem o backend colunar, que já é exato e rápido)."""
+    return queries_async.query_monitor.instrumented(queries_async.query_cache.cached(func))
+
+
+def _sort_by(results, field):
+    return sorted(results, key=lambda row: (row[field] is None, -(row[field] or 0)))
+
+
+@_approximate_query
+async def approximate_average_kills_by_country(min_maps_played):
+    rows = await _aggregate_sample([
+        {'$match': {'stats.maps_played': {'$gt': min_maps_played}}},
+        {'$group': {'_id': '$country', **_moments('stats.total_kills')}},
+    ])
+    results = []
+    for row in rows:
+        mean, margin = _estimate_mean(row)
+        results.append({'_id': row['_id'], 'average_kills': mean, 'margin': margin,
+                        'total_players': round(row['weight']), 'sampled_players': row['sampled'], 'approximate': True})
+    return _sort_by(results, 'average_kills')
+
+
+@_approximate_query
+async def approximate_kd_ratio_by_age_group():
+    rows = await _aggregate_sample([
+        {'$bucket': {'groupBy': '$age', 'boundaries': AGE_BOUNDARIES, 'default': 'Other',
+                     'output': _moments('stats.kills_per_death')}},
+    ])
+    results = []
+    for row in rows:
+        mean, margin = _estimate_mean(row)
+        results.append({'_id': row['_id'], 'average_kd_ratio': mean, 'margin': margin,
+                        'total_players': round(row['weight']), 'sampled_players': row['sampled'], 'approximate': True})
+    return _sort_by(results, 'average_kd_ratio')
+
+
+@_approximate_query
+async def approximate_kill_difference_among_players_with_maps_above(threshold):
+    rows = await _aggregate_sample([
+        {'$match': {'stats.maps_played': {'$gt': threshold}}},
+        {'$group': {'_id': None, 'max_kills': {'$max': '$stats.total_kills'},
+                    'min_kills': {'$min': '$stats.total_kills'}, 'sampled': {'$sum': 1}}},
+    ])
+    if not rows or rows[0]['max_kills'] is None:
+        return []
+    row = rows[0]
+    difference = row['max_kills'] - row['min_kills']
+    # O maior e o menor valor da amostra estão, com 95% de confiança, além dos quantis
+    # coverage e 1 - coverage da população; a diferença real nunca é menor que a da amostra
+    coverage = min(0.5, math.log(2 / CONFIDENCE_DELTA) / row['sampled'])
+    return [{'_id': None, 'kill_difference': difference, 'lower_bound': difference,
+             'quantile_coverage': [coverage, 1 - coverage], 'sampled_players': row['sampled'], 'approximate': True}]
+
+
+# Consulta exata -> versão aproximada
+APPROXIMATE = {
+    'average_kills_by_country': approximate_average_kills_by_country,
+    'kd_ratio_by_age_group': approximate_kd_ratio_by_age_group,
+    'kill_difference_among_players_with_maps_above': approximate_kill_difference_among_players_with_maps_above,
+}
+
+
+def refine(name, *args):
+    """Dispara a consulta exata em segundo plano e retorna um Future com o resultado.
+
+    O resultado exato fica no cache, então a próxima execução da mesma consulta já o encontra.
+    """
+    return queries_async.submit(getattr(queries_async, name)(*args))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mantém a amostra estratificada e compara as consultas aproximadas com as exatas.")
+    parser.add_argument('--uri', default=os.getenv("MONGO_URI", "mongodb://localhost:27017/"))
+    parser.add_argument('--db', default=os.getenv("MONGO_DB", "csgo_db"))
+    parser.add_argument('--refresh', action='store_true', help="Recalcula a amostra estratificada")
+    parser.add_argument('--compare', action='store_true', help="Compara estimativas e resultados exatos")
+    args = parser.parse_args()
+
+    if args.refresh:
+        from pymongo import MongoClient
+        client = MongoClient(args.uri)
+        try:
+            refresh_sample(client[args.db])
+        finally:
+            client.close()
+
+    if args.compare:
+        queries_async.MONGO_URI = args.uri
+        queries_async.DB_NAME = args.db
+        # Sem cache, para medir cada consulta de fato
+        queries_async.query_cache.ttl = 0
+        cases = [('average_kills_by_country', (500,)), ('kd_ratio_by_age_group', ()),
+                 ('kill_difference_among_players_with_maps_above', (500,))]
+        try:
+            for name, query_args in cases:
+                start = time.perf_counter()
+                estimate = queries_async.run(APPROXIMATE[name](*query_args))
+                approximate_ms = (time.perf_counter() - start) * 1000
+                start = time.perf_counter()
+                exact = queries_async.run(getattr(queries_async, name)(*query_args))
+                exact_ms = (time.perf_counter() - start) * 1000
+                print(f"\n{name}{query_args}: aproximada {approximate_ms:.1f} ms, exata {exact_ms:.1f} ms")
+                exact_by_id = {row['_id']: row for row in exact}
+                for row in estimate[:10]:
+                    value_field = next(field for field in ('average_kills', 'average_kd_ratio', 'kill_difference')
+                                       if field in row)
+                    margin = f" ± {row['margin']:.2f}" if row.get('margin') is not None else ''
+                    exact_value = exact_by_id.get(row['_id'], {}).get(value_field)
+                    print(f"  {row['_id']}: {row[value_field]}{margin} (exato: {exact_value})")
+        finally:
+            queries_async.close_client()
+
+
+if __name__ == "__main__":
+    main()
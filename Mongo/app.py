@@ -1,7 +1,14 @@
 # app.py
+import os
+
 import streamlit as st
 import plotly.express as px
+import amostragem
+import atualizacao_ao_vivo
+import historico
+import percentis
 import queries
+import queries_async
 
 # Configurações iniciais da página
 st.set_page_config(page_title="CS:GO Player Stats Dashboard", layout="wide")
@@ -9,13 +16,23 @@ st.set_page_config(page_title="CS:GO Player Stats Dashboard", layout="wide")
 # Título da aplicação
 st.title("📊 Dashboard de Análise de Jogadores de CS:GO")
 
+# Aba de diagnóstico oculta: aparece com ?diagnostics=1 na URL ou CSGO_DIAGNOSTICS=1
+show_diagnostics = st.query_params.get("diagnostics") == "1" or os.getenv("CSGO_DIAGNOSTICS") == "1"
+# Atualização ao vivo por change stream (exige replica set): ligada com CSGO_LIVE_REFRESH=1
+live_refresh = os.getenv("CSGO_LIVE_REFRESH") == "1"
+LIVE_POLL_SECONDS = float(os.getenv("CSGO_LIVE_POLL_SECONDS", "2"))
+
 # Organização do layout usando abas
-tab1, tab2, tab3, tab4= st.tabs([
-    "🔹 Mapas com Mais de X Kills",
+tab_names = [
+    "🔹 Rounds com Mais de X Kills",
     "🏆 Ranking de Jogadores",
     "⚔️ Diferença de Kills",
     "🔫 Top Kills por Categoria",
-])
+    "📈 Percentis",
+]
+if show_diagnostics:
+    tab_names.append("🩺 Diagnóstico")
+tab1, tab2, tab3, tab4, tab5, *diagnostics_tab = st.tabs(tab_names)
 
 # Defina as cores para cada categoria
 category_colors = {
@@ -38,36 +55,197 @@ category_emojis = {
 
 
 # ----------------------------
-# Aba 1: Porcentagem de Mapas
+# Aba 1: Comparação de jogadores (rounds com mais de X kills)
 # ----------------------------
 with tab1:
-    st.header("1. Porcentagem de Mapas com Mais de X Kills")
-    col1, col2, col3 = st.columns([1, 1, 2])
+    st.header("1. Porcentagem de Rounds com Mais de X Kills")
+    col1, col2, col3 = st.columns([2, 1, 1])
 
     with col1:
-        # Lista de IDs de jogadores (exemplo)
-        player_ids = [11893, 7998, 20113, 13156,13779, 2023]  # Insira a lista de IDs reais dos jogadores
-        player_id = st.selectbox("🔍 ID do Jogador", player_ids)
+        # Busca por nickname, nome real, time ou ID (ver busca_jogadores.py); os resultados entram como
+        # opções da seleção, ao lado dos jogadores já escolhidos
+        search_text = st.text_input("🔍 Buscar jogador", placeholder="nickname, nome, time ou ID")
+        player_labels = st.session_state.setdefault('player_labels', {})
+        search_options = []
+        if search_text.strip():
+            try:
+                for player in queries.search_players(search_text, 20):
+                    player_labels[player['player_id']] = (
+                        f"{player['nickname']} ({player['real_name']}, {player['current_team']})")
+                    search_options.append(player['player_id'])
+            except Exception as e:
+                st.error(f"Erro na busca de jogadores: {e}")
+        selected = st.session_state.get('selected_players', [])
+        player_ids = st.multiselect(
+            "Jogadores",
+            selected + [player_id for player_id in search_options if player_id not in selected],
+            key='selected_players',
+            format_func=lambda player_id: player_labels.get(player_id, str(player_id))
+        )
 
     with col2:
-        kill_threshold = st.number_input("🔢 Limiar de Kills", value=1000, step=100, min_value=0)
+        kill_threshold = st.number_input("🔢 Mais de X kills no round", value=1, step=1, min_value=0, max_value=5)
 
     with col3:
-        if st.button("📈 Atualizar"):
-            with st.spinner("Calculando..."):
-                percentage = queries.percentage_maps_with_kills_above(player_id, kill_threshold)
-            if percentage is not None:
-                st.success(f"Jogador ID: {player_id} - **{percentage:.2f}%** dos mapas têm mais de {kill_threshold} kills.")
-            else:
-                st.error("Dados insuficientes para calcular a porcentagem.")
+        update_percentage = st.button("📈 Comparar")
+
+# -----------------------------------------------------------------
+# Aba 3: Diferença de Kills (Jogadores com mais de X Mapas)
+# -----------------------------------------------------------------
+with tab3:
+    st.header("3. Diferença de Kills (Jogadores com mais de X Mapas)")
+    maps_threshold = st.number_input("🔢 Mapas Mínimos", value=500, step=10, min_value=0)
+    # Estimativa sobre a amostra (ver amostragem.py), trocada pelo valor exato quando ele fica pronto
+    approximate_difference = st.toggle("⚡ Resultado aproximado enquanto o exato é calculado")
+    calculate_difference = st.button("⚔️ Calcular Diferença")
+
+# --------------------------------------------------------
+# Aba 4: Jogadores com Mais Kills por Categoria
+# --------------------------------------------------------
+with tab4:
+    st.header("4. Jogadores com Mais Kills por Categoria")
+    col1, col2 = st.columns([1, 3])
+
+    with col1:
+        top_k = st.number_input("🏅 Top K", value=1, step=1, min_value=1, max_value=20)
+
+    with col2:
+        categories = st.multiselect(
+            "📊 Categorias",
+            queries.LEADERBOARD_FIELDS,
+            default=list(category_colors),
+            format_func=lambda category: category.replace('_', ' ').title()
+        )
+
+# --------------------------------------------------------
+# Aba 5: Percentis de um jogador em cada estatística
+# --------------------------------------------------------
+with tab5:
+    st.header("5. Percentis dos Jogadores")
+    col1, col2 = st.columns([1, 3])
+
+    with col1:
+        percentile_player = st.number_input("🔍 ID do jogador", value=11893, step=1, min_value=0)
+
+    with col2:
+        percentile_fields = st.multiselect(
+            "📊 Estatísticas",
+            percentis.RANKED_FIELDS,
+            default=['rating', 'kills_per_round', 'headshot_percentage', 'kills_per_death'],
+            format_func=lambda field: field.replace('_', ' ').title()
+        )
+
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        range_field = st.selectbox("📈 Estatística da faixa", percentis.RANKED_FIELDS,
+                                   index=percentis.RANKED_FIELDS.index('rating'))
+    with col2:
+        percentile_range = st.slider("🎚️ Faixa de percentis", 0.0, 100.0, (90.0, 100.0), step=0.5)
+
+# --------------------------------------------------------
+# Consultas de todas as abas disparadas ao mesmo tempo: a página espera
+# apenas a mais lenta, e não a soma de todas
+# --------------------------------------------------------
+# Os parâmetros dos botões ficam na sessão, para que o resultado continue na tela quando a página é
+# executada de novo (outra interação ou uma atualização ao vivo)
+if update_percentage and player_ids:
+    st.session_state['player_stats_args'] = (player_ids, kill_threshold)
+if calculate_difference or approximate_difference:
+    # No modo aproximado o resultado acompanha o campo, sem precisar do botão
+    st.session_state['kill_difference_args'] = (maps_threshold,)
+
+# Consultas exibidas nesta execução: chave -> (função de queries_async, argumentos)
+displayed = {'ranking': ('ranking_kills_assists', ())}
+if 'player_stats_args' in st.session_state:
+    # Todos os jogadores em uma única consulta
+    displayed['player_stats'] = ('player_stats', st.session_state['player_stats_args'])
+if 'kill_difference_args' in st.session_state:
+    kill_difference_args = st.session_state['kill_difference_args']
+    if approximate_difference:
+        displayed['kill_difference'] = ('approximate_kill_difference_among_players_with_maps_above',
+                                        kill_difference_args)
+        # O exato roda em segundo plano; só é disparado de novo quando o limite muda
+        if st.session_state.get('kill_difference_exact', (None,))[0] != kill_difference_args:
+            st.session_state['kill_difference_exact'] = (
+                kill_difference_args,
+                amostragem.refine('kill_difference_among_players_with_maps_above', *kill_difference_args)
+            )
+    else:
+        displayed['kill_difference'] = ('kill_difference_among_players_with_maps_above', kill_difference_args)
+if categories:
+    # Todas as categorias são buscadas em uma única ida ao servidor
+    displayed['leaderboard'] = ('leaderboard', (categories, top_k))
+if percentile_fields:
+    displayed['percentiles'] = ('player_percentiles', (percentile_player, percentile_fields))
+    displayed['stat_history'] = ('player_stat_history', (percentile_player, percentile_fields))
+displayed['percentile_range'] = ('players_between_percentiles', (range_field, *percentile_range))
+
+if live_refresh:
+    refresher = atualizacao_ao_vivo.get_refresher()
+    # Lida antes das consultas: um lote aplicado durante a execução também provoca uma nova
+    st.session_state['live_sequence'] = refresher.sequence
+
+
+
+def query_function(name):
+    """Função assíncrona de uma consulta, procurada em queries_async.py e nos módulos que a estendem."""
+    for module in (queries_async, amostragem, percentis, historico):
+        if hasattr(module, name):
+            return getattr(module, name)
+    raise AttributeError(name)
+
+
+calls = {key: query_function(name)(*args) for key, (name, args) in displayed.items()}
+with st.spinner("Calculando..."):
+    results = queries_async.run_concurrently(calls)
+
+
+with tab1:
+    if 'player_stats' in results:
+        stats = results['player_stats']
+        kill_threshold = st.session_state['player_stats_args'][1]
+        # Uma consulta que falha não impede a exibição das outras abas
+        if isinstance(stats, Exception):
+            st.error(f"Erro ao consultar o MongoDB: {stats}")
+        else:
+            found = [player for player in stats.values() if not player['missing']]
+            missing = [str(player['player_id']) for player in stats.values() if player['missing']]
+            if missing:
+                st.warning(f"Jogadores não encontrados: {', '.join(missing)}")
+            if found:
+                fig = px.bar(
+                    x=[player['nickname'] for player in found],
+                    y=[player['percentage_rounds_above'] for player in found],
+                    labels={'x': 'Jogador', 'y': f'% dos rounds com mais de {kill_threshold} kills'},
+                    title=f"Rounds com mais de {kill_threshold} kills",
+                    color=[player['percentage_rounds_above'] for player in found],
+                    color_continuous_scale='Blues'
+                )
+                fig.update_layout(template='plotly_white', title_x=0.5)
+                st.plotly_chart(fig, use_container_width=True)
+                st.dataframe(
+                    [{
+                        'ID': player['player_id'],
+                        'Nickname': player['nickname'],
+                        'Time': player['current_team'],
+                        'Mapas': player['maps_played'],
+                        'Rounds': player['rounds_played'],
+                        f'Rounds com mais de {kill_threshold} kills': player['rounds_above_threshold'],
+                        '%': player['percentage_rounds_above'],
+                        'Rating': player['rating'],
+                    } for player in found],
+                    use_container_width=True
+                )
 
 # --------------------------------------------------------
 # Aba 2: Ranking de Jogadores (Kills/Assistências por Round)
 # --------------------------------------------------------
 with tab2:
     st.header("2. Ranking de Jogadores (Kills/Assistências por Round)")
-    ranking = queries.ranking_kills_assists()
-    if ranking:
+    ranking = results['ranking']
+    if isinstance(ranking, Exception):
+        st.error(f"Erro ao consultar o MongoDB: {ranking}")
+    elif ranking:
         df = {
             'Nickname': [player['nickname'] for player in ranking],
             'Kills + Assistências por Round': [player['kills_assists_ratio'] for player in ranking],
@@ -92,51 +270,68 @@ with tab2:
     else:
         st.error("Nenhum dado disponível para o ranking.")
 
-# -----------------------------------------------------------------
-# Aba 3: Diferença de Kills (Jogadores com mais de X Mapas)
-# -----------------------------------------------------------------
+def show_kill_difference(result, maps_threshold):
+    if isinstance(result, Exception):
+        st.error(f"Erro ao consultar o MongoDB: {result}")
+    elif result and result[0].get('approximate'):
+        estimate = result[0]
+        low, high = estimate['quantile_coverage']
+        st.info(f"Estimativa para jogadores com mais de **{maps_threshold}** mapas jogados: pelo menos "
+                f"**{estimate['kill_difference']}** ({estimate['sampled_players']} jogadores na amostra; com 95% "
+                f"de confiança cobre do quantil {low:.1%} ao {high:.1%}). Calculando o valor exato...")
+    elif result:
+        kill_diff = result[0].get('kill_difference', 'N/A')
+        st.success(f"Diferença de kills entre jogadores com mais de **{maps_threshold}** mapas jogados: **{kill_diff}**.")
+    else:
+        st.error("Nenhum resultado encontrado.")
+
+
 with tab3:
-    st.header("3. Diferença de Kills (Jogadores com mais de X Mapas)")
-    maps_threshold = st.number_input("🔢 Mapas Mínimos", value=500, step=10, min_value=0)
-    
-    if st.button("⚔️ Calcular Diferença"):
-        with st.spinner("Calculando..."):
-            result = queries.kill_difference_among_players_with_maps_above(maps_threshold)
-        if result:
-            kill_diff = result[0].get('kill_difference', 'N/A')
-            st.success(f"Diferença de kills entre jogadores com mais de **{maps_threshold}** mapas jogados: **{kill_diff}**.")
+    if 'kill_difference' in results:
+        maps_threshold = st.session_state['kill_difference_args'][0]
+        exact = st.session_state['kill_difference_exact'][1] if approximate_difference else None
+        if exact is not None and exact.done():
+            show_kill_difference(exact.exception() or exact.result(), maps_threshold)
+        elif exact is not None:
+            # Mostra a estimativa até a consulta em segundo plano terminar; aí a página é executada de
+            # novo, já com o valor exato e sem o fragmento periódico
+            @st.fragment(run_every=0.5)
+            def wait_kill_difference():
+                if exact.done():
+                    st.rerun()
+                show_kill_difference(results['kill_difference'], maps_threshold)
+
+            wait_kill_difference()
         else:
-            st.error("Nenhum resultado encontrado.")
+            show_kill_difference(results['kill_difference'], maps_threshold)
 
-# --------------------------------------------------------
-# Aba 4: Jogador com Mais Kills por Categoria
-# --------------------------------------------------------
 with tab4:
-    st.header("4. Jogador com Mais Kills por Categoria")
-    top_killers = queries.get_top_killers()
-    
-    if top_killers:
-        for category, player in top_killers.items():
+    top_players = results.get('leaderboard', {})
+
+    if isinstance(top_players, Exception):
+        st.error(f"Erro ao consultar o MongoDB: {top_players}")
+    elif top_players:
+        for category, players in top_players.items():
             # Obter o nome da categoria e o emoji correspondente
             category_name = category.replace('_', ' ').title()
             emoji = category_emojis.get(category, '🔫')  # Emoji padrão caso não esteja no dicionário
-            kills = player.get(category, 0) if player else 0
-            
+
             # Exibir o título com o emoji
             st.markdown(f"### {emoji} {category_name}")
-            
-            if player:
-                st.write(f"**Top Killer:** {player['nickname']} com **{kills}** kills")
-                
+
+            if players:
+                leader = players[0]
+                st.write(f"**Top Killer:** {leader['nickname']} com **{leader['value']}** {category_name.lower()}")
+
                 # Definir a cor com base na categoria
                 color = category_colors.get(category, '#95a5a6')  # Cor padrão cinza
-                
+
                 # Criação do gráfico de barras
                 fig = px.bar(
-                    x=[player['nickname']],
-                    y=[kills],
-                    labels={'x': 'Jogador', 'y': 'Número de Kills'},
-                    title=f"{category_name} - Top Killer",
+                    x=[player['nickname'] for player in players],
+                    y=[player['value'] for player in players],
+                    labels={'x': 'Jogador', 'y': category_name},
+                    title=f"{category_name} - Top {top_k}",
                     color_discrete_sequence=[color]
                 )
                 fig.update_layout(template='plotly_white')
@@ -146,4 +341,140 @@ with tab4:
     else:
         st.error("Nenhum dado disponível para os top killers.")
 
+# --------------------------------------------------------
+# Aba 5: Percentis
+# --------------------------------------------------------
+with tab5:
+    if 'percentiles' in results:
+        profile = results['percentiles']
+        if isinstance(profile, Exception):
+            st.error(f"Erro ao calcular os percentis: {profile}")
+        elif profile is None:
+            st.warning(f"Jogador {percentile_player} não encontrado.")
+        else:
+            ranked = [entry for entry in profile.values() if entry['rank'] is not None]
+            if ranked:
+                st.markdown(f"### {ranked[0]['nickname']}")
+                fig = px.bar(
+                    x=[entry['field'].replace('_', ' ').title() for entry in ranked],
+                    y=[entry['percentile'] for entry in ranked],
+                    labels={'x': 'Estatística', 'y': 'Percentil'},
+                    range_y=[0, 100],
+                    color=[entry['percentile'] for entry in ranked],
+                    color_continuous_scale='Blues'
+                )
+                fig.update_layout(template='plotly_white')
+                st.plotly_chart(fig, use_container_width=True)
+            st.dataframe(
+                [{
+                    'Estatística': entry['field'],
+                    'Valor': entry['value'],
+                    'Rank': entry['rank'],
+                    'Jogadores': entry['players'],
+                    'Percentil': entry['percentile'],
+                } for entry in profile.values()],
+                use_container_width=True
+            )
+
+    if 'stat_history' in results:
+        st.subheader("Evolução entre as cargas")
+        series = results['stat_history']
+        if isinstance(series, Exception):
+            st.error(f"Erro ao consultar o histórico: {series}")
+        elif len(series) > 1:
+            fig = px.line(
+                series,
+                x='version',
+                y=percentile_fields,
+                markers=True,
+                labels={'version': 'Versão dos dados', 'value': 'Valor', 'variable': 'Estatística'},
+                hover_data=['recorded_at']
+            )
+            fig.update_layout(template='plotly_white')
+            st.plotly_chart(fig, use_container_width=True)
+        else:
+            st.write("Ainda não há mais de uma versão registrada para este jogador.")
+
+    st.subheader(f"Jogadores entre os percentis {percentile_range[0]:g} e {percentile_range[1]:g} de {range_field}")
+    in_range = results['percentile_range']
+    if isinstance(in_range, Exception):
+        st.error(f"Erro ao calcular os percentis: {in_range}")
+    elif in_range:
+        st.dataframe(
+            [{
+                'Rank': entry['rank'],
+                'Nickname': entry['nickname'],
+                'ID': entry['player_id'],
+                range_field: entry['value'],
+                'Percentil': entry['percentile'],
+            } for entry in in_range],
+            use_container_width=True
+        )
+    else:
+        st.write("Nenhum jogador nessa faixa.")
+
+# --------------------------------------------------------
+# Contadores do cache de consultas (cada acerto evita uma ida ao MongoDB)
+# --------------------------------------------------------
+cache_stats = queries.cache_stats()
+st.sidebar.caption(
+    f"Cache de consultas: {cache_stats['hits']} acertos, {cache_stats['misses']} falhas"
+    f" ({cache_stats['hit_rate']:.0%} de acerto)"
+)
 
+# --------------------------------------------------------
+# Atualização ao vivo: a cada poucos segundos a página pergunta ao change stream do processo
+# (sem ir ao banco) se algum lote alterou campos lidos pelas consultas exibidas
+# --------------------------------------------------------
+if live_refresh:
+    @st.fragment(run_every=LIVE_POLL_SECONDS)
+    def watch_changes():
+        if refresher.changed_since(list(displayed.values()), st.session_state['live_sequence']):
+            st.rerun()
+
+    watch_changes()
+    live_status = refresher.status()
+    st.sidebar.caption(
+        f"Atualização ao vivo: {'conectada' if live_status['connected'] else 'desconectada'}"
+        f" ({live_status['batches']} lotes, {live_status['events']} alterações)"
+    )
+
+# --------------------------------------------------------
+# Aba oculta: Diagnóstico das consultas (ver instrumentacao.py)
+# --------------------------------------------------------
+if show_diagnostics:
+    with diagnostics_tab[0]:
+        st.header("Diagnóstico das Consultas")
+        stats = queries.query_stats()
+        if stats:
+            st.dataframe(
+                [{'função': name, **{key: value for key, value in data.items() if key != 'histogram'}}
+                 for name, data in stats.items()],
+                use_container_width=True
+            )
+
+            selected = st.selectbox("📊 Histograma de latência", list(stats))
+            histogram = stats[selected]['histogram']
+            fig = px.bar(
+                x=list(histogram),
+                y=list(histogram.values()),
+                labels={'x': 'Latência', 'y': 'Chamadas'},
+                title=f"{selected} - últimas {stats[selected]['window']} chamadas"
+            )
+            fig.update_layout(template='plotly_white')
+            st.plotly_chart(fig, use_container_width=True)
+        else:
+            st.info("Nenhuma consulta executada ainda.")
+
+        st.subheader(f"Consultas lentas (acima de {queries.query_monitor.slow_query_ms:.0f} ms)")
+        if queries.query_monitor.slow_queries:
+            st.dataframe(list(queries.query_monitor.slow_queries)[::-1], use_container_width=True)
+        else:
+            st.write("Nenhuma consulta lenta registrada.")
+
+        st.download_button(
+            "⬇️ Baixar estatísticas (JSON)",
+            queries.query_monitor.dump_json(),
+            file_name="instrumentacao.json",
+            mime="application/json"
+        )
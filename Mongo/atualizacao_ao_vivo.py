@@ -0,0 +1,363 @@
+import argparse
+import os
+import threading
+import time
+from collections import deque
+
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure
+
+import agregados
+import queries_async
+import registro_consultas
+
+# Configuração (pode ser sobrescrita por variáveis de ambiente)
+# Eventos que chegam dentro deste intervalo são aplicados juntos (uma carga gera milhares deles)
+DEBOUNCE_SECONDS = float(os.getenv("CSGO_LIVE_DEBOUNCE", "0.5"))
+MAX_BATCH_EVENTS = int(os.getenv("CSGO_LIVE_MAX_BATCH", "5000"))
+# Recalcular os grupos afetados dos resumos a cada lote (além do recálculo feito pelo carregador)
+REFRESH_ROLLUPS = os.getenv("CSGO_LIVE_REFRESH_ROLLUPS", "1") == "1"
+# Lotes lembrados para responder changed_since; sessões mais antigas que isso simplesmente recarregam
+HISTORY_SIZE = 256
+RETRY_SECONDS = 5
+
+# ======================
+# Atualização ao vivo
+# ======================
+# Um único change stream por processo acompanha a coleção de jogadores. A cada lote de eventos, apenas
+# os grupos afetados dos resumos são recalculados e apenas as entradas do cache cujas consultas leem os
+# campos alterados são descartadas. Os dashboards abertos no processo perguntam ao LiveRefresher, sem ir
+# ao banco, se algo que eles exibem mudou. Change streams exigem um replica set (pode ser de um membro só).
+
+
+def _touches(dependencies, changed):
+    """Indica se algum dos caminhos alterados afeta os campos de que uma consulta depende (None = todos)."""
+    if dependencies is None or changed is None:
+        return True
+    return any(dependency == path or dependency.startswith(f'{path}.') or path.startswith(f'{dependency}.')
+               for dependency in dependencies for path in changed)
+
+
+def changed_paths(event):
+    """Caminhos alterados por um evento do change stream; None quando o documento inteiro mudou."""
+    if event['operationType'] != 'update':
+        # insert, replace e delete mudam o documento inteiro; drop/rename/invalidate, a coleção
+        return None
+    description = event.get('updateDescription', {})
+    return {*description.get('updatedFields', {}), *description.get('removedFields', []),
+            *(array['field'] for array in description.get('truncatedArrays', []))}
+
+
+def query_dependencies(name, args=(), kwargs=None):
+    """Campos lidos por uma consulta com esses argumentos (None quando não dá para saber)."""
+    try:
+        return registro_consultas.plan_dependencies(name, *args, **dict(kwargs or {}))
+    except Exception:
+        # Consulta fora do registro ou argumentos inválidos: trata como dependente de tudo
+        return None
+
+
+class LiveRefresher:
+    """Acompanha o change stream da coleção de jogadores e atualiza resumos e cache de forma incremental."""
+
+    def __init__(self, uri=None, db_name=None, cache=None, players_collection=registro_consultas.PLAYERS_COLLECTION,
+                 refresh_rollups=REFRESH_ROLLUPS, debounce=DEBOUNCE_SECONDS):
+        self.uri = uri or queries_async.MONGO_URI
+        self.db_name = db_name or queries_async.DB_NAME
+        self.cache = cache if cache is not None else queries_async.query_cache
+        self.players_collection = players_collection
+        self.refresh_rollups = refresh_rollups
+        self.debounce = debounce
+        self.pre_images = True
+        self.sequence = 0
+        self.events = 0
+        self.connected = False
+        self.last_error = None
+        self._history = deque(maxlen=HISTORY_SIZE)
+        self._resume_token = None
+        self._client = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    # ----------------------
+    # Ciclo de vida
+    # ----------------------
+
+    def start(self):
+        """Abre o change stream em uma thread própria."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            # Pool pequeno e separado: o change stream ocupa uma conexão enquanto espera eventos
+            self._client = MongoClient(self.uri, maxPoolSize=4)
+            self._thread = threading.Thread(target=self._run, name='live-refresh', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Fecha o change stream e espera a thread terminar."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    def _watch(self, collection):
+        options = {'full_document': 'updateLookup', 'max_await_time_ms': int(self.debounce * 1000)}
+        if self.pre_images:
+            # Versão anterior do documento (MongoDB 6.0+ com changeStreamPreAndPostImages na coleção);
+            # sem ela, uma mudança de país, idade ou time recalcula o resumo inteiro
+            options['full_document_before_change'] = 'whenAvailable'
+        return collection.watch(resume_after=self._resume_token, **options)
+
+    def _run(self):
+        collection = self._client[self.db_name][self.players_collection]
+        try:
+            while not self._stop.is_set():
+                try:
+                    with self._watch(collection) as stream:
+                        self.connected = True
+                        self.last_error = None
+                        self._consume(stream)
+                except OperationFailure as e:
+                    if self.pre_images and 'fullDocumentBeforeChange' in str(e):
+                        print("Servidor sem suporte a pre-images; seguindo sem a versão anterior dos documentos.")
+                        self.pre_images = False
+                        continue
+                    self._failed(e)
+                except Exception as e:
+                    # Inclui erros fora do pymongo ao aplicar um lote (cache, resumos, evento inesperado):
+                    # a thread segue tentando em vez de terminar com o status ainda "conectada"
+                    self._failed(e)
+        finally:
+            self.connected = False
+
+    def _failed(self, error):
+        self.connected = False
+        self.last_error = str(error)
+        print(f"Erro no change stream ({error}); nova tentativa em {RETRY_SECONDS}s.")
+        self._stop.wait(RETRY_SECONDS)
+
+    def _consume(self, stream):
+        pending = []
+        deadline = None
+        while not self._stop.is_set() and stream.alive:
+            event = stream.try_next()
+            if event is not None:
+                pending.append(event)
+                deadline = deadline or time.monotonic() + self.debounce
+                if event['operationType'] in ('drop', 'rename', 'dropDatabase', 'invalidate'):
+                    # O stream termina depois destes eventos; recomeça do ponto atual
+                    self.apply(pending)
+                    self._resume_token = None
+                    return
+            if pending and (len(pending) >= MAX_BATCH_EVENTS or time.monotonic() >= deadline):
+                self.apply(pending)
+                # O token só avança depois de aplicar o lote: uma falha no meio repete os eventos
+                self._resume_token = stream.resume_token
+                pending, deadline = [], None
+            elif not pending:
+                self._resume_token = stream.resume_token
+
+    # ----------------------
+    # Aplicação dos eventos
+    # ----------------------
+
+    def _affected_rollups(self, events):
+        """Resumo -> valores dos grupos a recalcular (None recalcula o resumo inteiro)."""
+        affected = {}
+        for event in events:
+            paths = changed_paths(event)
+            for name, rollup in agregados.ROLLUPS.items():
+                if affected.get(name, set()) is None:
+                    continue
+                if not _touches(registro_consultas.rollup_dependencies(name), paths):
+                    continue
+                scope = rollup['scope']
+                after = event.get('fullDocument')
+                before = event.get('fullDocumentBeforeChange')
+                operation = event['operationType']
+                # Se o grupo pode ter mudado, o valor antigo também precisa ser recalculado
+                needs_before = operation in ('delete', 'replace') or (paths is not None and scope in paths)
+                needs_after = operation in ('insert', 'update', 'replace')
+                if operation not in ('insert', 'update', 'replace', 'delete') \
+                        or (needs_before and before is None) or (needs_after and after is None):
+                    affected[name] = None
+                    continue
+                keys = affected.setdefault(name, set())
+                for document in (before, after):
+                    if document is not None:
+                        keys.add(document.get(scope))
+        return affected
+
+    def _refresh_rollups(self, affected):
+        db = self._client[self.db_name]
+        for name, keys in affected.items():
+            agregados.refresh_rollup(db, name, None if keys is None else list(keys), self.players_collection)
+
+    def apply(self, events):
+        """Aplica um lote de eventos: recalcula os resumos afetados e descarta as entradas de cache afetadas."""
+        changed = set()
+        for event in events:
+            paths = changed_paths(event)
+            if paths is None:
+                changed = None
+                break
+            changed |= paths
+
+        if self.refresh_rollups:
+            affected = self._affected_rollups(events)
+            if affected:
+                self._refresh_rollups(affected)
+
+        # Depois dos resumos, para que a próxima leitura das consultas sobre eles já veja os novos valores
+        invalidated = self.cache.invalidate_where(
+            lambda key: _touches(query_dependencies(key[0], key[1], key[2]), changed))
+
+        with self._lock:
+            self.sequence += 1
+            self.events += len(events)
+            self._history.append((self.sequence, None if changed is None else frozenset(changed)))
+        fields = 'todos os campos' if changed is None else ', '.join(sorted(changed))
+        print(f"Lote {self.sequence}: {len(events)} eventos ({fields}); {invalidated} entradas de cache descartadas.")
+        return invalidated
+
+    def changed_since(self, displayed, sequence):
+        """Indica se algum lote aplicado depois de sequence afeta as consultas exibidas.
+
+        displayed é uma lista de (nome da consulta, args) ou (nome, args, kwargs).
+        """
+        with self._lock:
+            if sequence >= self.sequence:
+                return False
+            history = [changed for applied, changed in self._history if applied > sequence]
+            # Lotes mais antigos que o histórico: não dá para saber o que mudou
+            forgotten = not self._history or self._history[0][0] > sequence + 1
+        if forgotten:
+            return True
+        for query in displayed:
+            dependencies = query_dependencies(*query)
+            if any(_touches(dependencies, changed) for changed in history):
+                return True
+        return False
+
+    def status(self):
+        """Resumo do estado do change stream, para a barra lateral do dashboard."""
+        return {'connected': self.connected, 'batches': self.sequence, 'events': self.events,
+                'pre_images': self.pre_images, 'last_error': self.last_error}
+
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def get_refresher():
+    """Retorna o LiveRefresher do processo, iniciado na primeira chamada (um change stream por processo)."""
+    global _refresher
+    if _refresher is None:
+        with _refresher_lock:
+            if _refresher is None:
+                _refresher = LiveRefresher().start()
+    return _refresher
+
+
+def enable_pre_images(db, players_collection=registro_consultas.PLAYERS_COLLECTION):
+    """Liga a gravação da versão anterior dos documentos (MongoDB 6.0+), usada para recalcular só os grupos antigos."""
+    db.command('collMod', players_collection, changeStreamPreAndPostImages={'enabled': True})
+
+
+def _demo(uri, db_name, file_path):
+    """Carrega o CSV, abre o change stream e mostra quais entradas do cache cada alteração descarta."""
+    import insercao_banco
+
+    client = MongoClient(uri)
+    db = client[db_name]
+    db[registro_consultas.PLAYERS_COLLECTION].drop()
+    df = insercao_banco.read_csv_file(file_path)
+    insercao_banco.insert_players_data(db[registro_consultas.PLAYERS_COLLECTION],
+                                       insercao_banco.dataframe_to_documents(df))
+    agregados.refresh_all(db)
+    try:
+        enable_pre_images(db)
+    except OperationFailure as e:
+        print(f"Pre-images indisponíveis: {e}")
+
+    queries_async.MONGO_URI = uri
+    queries_async.DB_NAME = db_name
+    refresher = LiveRefresher(uri, db_name, debounce=0.2).start()
+    time.sleep(1)
+    players = db[registro_consultas.PLAYERS_COLLECTION]
+    player = players.find_one({}, {'player_id': 1, 'country': 1})
+    steps = [
+        ("rating (não é lido pelo ranking nem pelos resumos)", {'$inc': {'rating': 0.01}}),
+        ("kills_assists_per_round (lido pelo ranking)", {'$inc': {'stats.kills_assists_per_round': 0.01}}),
+        ("country (grupo dos resumos por país)", {'$set': {'country': 'Atlantis'}}),
+    ]
+    try:
+        for description, update in steps:
+            queries_async.run(queries_async.ranking_kills_assists())
+            queries_async.run(queries_async.average_kills_by_country(0))
+            before = queries_async.query_cache.stats()['entries']
+            players.update_one({'_id': player['_id']}, update)
+            time.sleep(1)
+            after = queries_async.query_cache.stats()['entries']
+            print(f"Alteração de {description}: {before} -> {after} entradas no cache")
+        countries = [row['_id'] for row in queries_async.run(queries_async.average_kills_by_country(0))]
+        print(f"'Atlantis' no resumo por país: {'Atlantis' in countries}")
+    finally:
+        refresher.stop()
+        queries_async.close_client()
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Acompanha a coleção de jogadores por change stream.")
+    parser.add_argument('--uri', default=os.getenv("MONGO_URI", "mongodb://localhost:27017/"))
+    parser.add_argument('--db', default=os.getenv("MONGO_DB", "csgo_db"))
+    parser.add_argument('--mongod-bin', help="Inicia um mongod local em replica set de um membro e roda a demonstração")
+    parser.add_argument('--file', default='./cs_pro_players/csgo_players.csv', help="CSV carregado na demonstração")
+    parser.add_argument('--enable-pre-images', action='store_true',
+                        help="Liga changeStreamPreAndPostImages na coleção de jogadores e sai")
+    args = parser.parse_args()
+
+    if args.mongod_bin:
+        # Import local: só a demonstração precisa iniciar um mongod
+        from benchmark_consultas import start_mongod, stop_mongod
+
+        try:
+            process, uri, dbpath = start_mongod(args.mongod_bin, replica_set='rs0')
+        except RuntimeError as e:
+            print(f"Erro: {e}")
+            return
+        try:
+            _demo(uri, args.db, args.file)
+        finally:
+            stop_mongod(process, dbpath)
+        return
+
+    if args.enable_pre_images:
+        client = MongoClient(args.uri)
+        try:
+            enable_pre_images(client[args.db])
+            print("Pre-images ativadas na coleção de jogadores.")
+        except OperationFailure as e:
+            print(f"Erro: {e}")
+        finally:
+            client.close()
+        return
+
+    # Sem dashboard: apenas mostra os lotes aplicados (útil para acompanhar uma carga)
+    refresher = LiveRefresher(args.uri, args.db).start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        refresher.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+import argparse
+import copy
+import math
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import modelo
+from registro_consultas import LEADERBOARD_FIELDS
+
+# Colunas de texto; as demais colunas do modelo são numéricas e viram um array cada
+TEXT_COLUMNS = ['nickname', 'real_name', 'country', 'current_team', 'teams']
+NUMERIC_COLUMNS = [column for column in modelo.FIELD_MAPPING if column not in TEXT_COLUMNS]
+# Colunas de texto usadas em agrupamentos, guardadas como códigos inteiros + dicionário de valores
+DICTIONARY_COLUMNS = ['country', 'current_team']
+AGE_BOUNDARIES = [18, 21, 25, 30, 35, 40]
+
+
+def _sort_key(values):
+    """Chave de ordenação decrescente: valores ausentes (NaN) ficam por último, como no MongoDB."""
+    return np.where(np.isnan(values), np.inf, -values)
+
+
+def _python(value):
+    """Converte escalares do NumPy nos tipos que o pymongo devolveria."""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class ColumnarPlayers:
+    """Tabela de jogadores em arrays NumPy, com as mesmas consultas de queries.py.
+
+    columns: coluna numérica -> array (int64 ou float64, NaN para ausentes).
+    codes/dictionaries: para country e current_team, o código de cada jogador e a lista de valores.
+    ids e nicknames guardam o _id e o nickname de cada linha; texts guarda as demais colunas de texto
+    (real_name, teams e, se houver, _content_hash), usadas para remontar os documentos inteiros.
+    Qualquer sequência indexável serve, o que permite ler as colunas de um snapshot mapeado em memória.
+    documents, opcional, guarda os documentos originais e evita remontá-los.
+    """
+
+    def __init__(self, columns, codes, dictionaries, ids, nicknames, texts, documents=None):
+        self.columns = columns
+        self.codes = codes
+        self.dictionaries = dictionaries
+        self.ids = ids
+        self.nicknames = nicknames
+        self.texts = texts
+        self.documents = documents
+        self.size = len(ids)
+        self._player_id_order = None
+
+    @classmethod
+    def from_documents(cls, documents):
+        """Monta a tabela a partir de documentos no formato aninhado de modelo.py."""
+        documents = list(documents)
+        columns = {}
+        for column in NUMERIC_COLUMNS:
+            path = modelo.field_path(column)
+            raw = [modelo.get_path(document, path) for document in documents]
+            values = pd.to_numeric(pd.Series(raw, dtype=object), errors='coerce')
+            # Colunas gravadas como inteiros no banco continuam inteiras
+            if all(isinstance(value, int) and not isinstance(value, bool) for value in raw):
+                columns[column] = values.to_numpy(dtype=np.int64)
+            else:
+                columns[column] = values.to_numpy(dtype=np.float64)
+
+        codes, dictionaries = {}, {}
+        for column in DICTIONARY_COLUMNS:
+            values = [document.get(column) for document in documents]
+            column_codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=False)
+            codes[column] = column_codes.astype(np.int32)
+            dictionaries[column] = [_python(value) for value in uniques]
+
+        ids = np.array([document.get('_id') for document in documents], dtype=object)
+        nicknames = np.array([document.get('nickname') for document in documents], dtype=object)
+        text_columns = ['real_name', 'teams'] + [
+            column for column in ('_content_hash',) if documents and column in documents[0]]
+        texts = {column: [document.get(column) for document in documents] for column in text_columns}
+        return cls(columns, codes, dictionaries, ids, nicknames, texts, np.array(documents, dtype=object))
+
+    @classmethod
+    def from_collection(cls, collection):
+        """Carrega a coleção de jogadores inteira (uma única leitura)."""
+        return cls.from_documents(collection.find({}))
+
+    def _numeric(self, column):
+        return self.columns[column].astype(np.float64, copy=False)
+
+    def _decoded(self, column, codes):
+        dictionary = self.dictionaries[column]
+        return [dictionary[code] for code in codes]
+
+    def _row_of_player(self, player_id):
+        """Linha do jogador, por busca binária em um índice ordenado de player_id criado no primeiro uso."""
+        player_ids = self.columns['player_id']
+        if self._player_id_order is None:
+            self._player_id_order = np.argsort(player_ids, kind='stable')
+        position = np.searchsorted(player_ids, player_id, sorter=self._player_id_order)
+        if position < self.size and player_ids[self._player_id_order[position]] == player_id:
+            return int(self._player_id_order[position])
+        return None
+
+    def row_document(self, row):
+        """Remonta o documento aninhado de uma linha a partir das colunas."""
+        flat = {column: _python(self.columns[column][row]) for column in NUMERIC_COLUMNS}
+        for column in DICTIONARY_COLUMNS:
+            flat[column] = self.dictionaries[column][self.codes[column][row]]
+        flat['nickname'] = self.nicknames[row]
+        flat['real_name'] = self.texts['real_name'][row]
+        flat['teams'] = self.texts['teams'][row]
+        document = {'_id': self.ids[row], **modelo.to_document(flat)}
+        if '_content_hash' in self.texts:
+            document['_content_hash'] = self.texts['_content_hash'][row]
+        return document
+
+    def _documents(self, rows):
+        if self.documents is not None:
+            return copy.deepcopy(list(self.documents[rows]))
+        return [self.row_document(row) for row in rows]
+
+    def _top(self, mask, keys, limit):
+        """Linhas que passam no filtro, ordenadas pelas chaves (a primeira é a principal)."""
+        rows = np.flatnonzero(mask)
+        order = np.lexsort([key[rows] for key in reversed(keys)] if keys else [rows])
+        rows = rows[order]
+        return rows if limit is None else rows[:limit]
+
+    def _group_by(self, column, mask):
+        """Códigos dos grupos presentes entre as linhas filtradas e o grupo de cada linha."""
+        group_codes, inverse = np.unique(self.codes[column][mask], return_inverse=True)
+        return group_codes, inverse
+
+    # ======================
+    # Consultas Simples
+    # ======================
+
+    def percentage_maps_with_kills_above(self, player_id, kill_threshold):
+        return self.player_stats([player_id], kill_threshold)[player_id].get('percentage_rounds_above')
+
+    def player_stats(self, player_ids, kill_threshold=0):
+        results = {}
+        for player_id in dict.fromkeys(player_ids):
+            row = self._row_of_player(player_id)
+            if row is None:
+                results[player_id] = {'player_id': player_id, 'missing': True}
+                continue
+            document = {
+                'player_id': player_id,
+                'nickname': self.nicknames[row],
+                'current_team': self.dictionaries['current_team'][self.codes['current_team'][row]],
+                'rating': _python(self.columns['rating'][row]),
+                'stats': {
+                    'maps_played': _python(self.columns['maps_played'][row]),
+                    'rounds_played': _python(self.columns['rounds_played'][row]),
+                    'kills_per_round': _python(self.columns['kills_per_round'][row]),
+                    'rounds_by_kills': {field: _python(self.columns[field][row])
+                                        for field in modelo.ROUNDS_BY_KILLS_FIELDS},
+                },
+            }
+            results[player_id] = modelo.player_summary(document, kill_threshold)
+        return results
+
+    def ranking_kills_assists(self):
+        ratio = self._numeric('kills_assists_per_round')
+        rows = self._top(np.ones(self.size, dtype=bool), [_sort_key(ratio)], 10)
+        return [{
+            '_id': self.ids[row],
+            'nickname': self.nicknames[row],
+            'kills_per_round': _python(self.columns['kills_per_round'][row]),
+            'assists_per_round': _python(self.columns['assists_per_round'][row]),
+            'total_kills': _python(self.columns['total_kills'][row]),
+            'total_rounds': _python(self.columns['rounds_played'][row]),
+            'kills_assists_ratio': _python(self.columns['kills_assists_per_round'][row]),
+        } for row in rows]
+
+    def kill_difference_among_players_with_maps_above(self, threshold):
+        kills = self._numeric('total_kills')[self._numeric('maps_played') > threshold]
+        if kills.size == 0:
+            return []
+        kills = kills[~np.isnan(kills)]
+        difference = kills.max() - kills.min() if kills.size else None
+        if difference is not None and self.columns['total_kills'].dtype == np.int64:
+            difference = int(difference)
+        return [{'_id': None, 'kill_difference': _python(difference)}]
+
+    def players_with_opening_kills_and_rating_above(self, opening_kills_threshold, rating_threshold):
+        opening_kills = self._numeric('total_opening_kills')
+        rating = self._numeric('rating')
+        mask = (opening_kills > opening_kills_threshold) & (rating > rating_threshold)
+        # Mesma ordem dos campos de registro_consultas.OPENING_KILLS_SORT; empates seguem a ordem das linhas, não o _id
+        rows = self._top(mask, [opening_kills, rating], None)
+        return self._documents(rows)
+
+    def get_top_killers(self):
+        categories = ['rifle_kills', 'sniper_kills', 'smg_kills', 'pistol_kills', 'grenade_kills']
+        leaders = self.leaderboard(categories, k=1)
+        results = {}
+        for category in categories:
+            top_killer = leaders[category][0] if leaders[category] else None
+            if top_killer:
+                top_killer = {'player_id': top_killer['player_id'], 'nickname': top_killer['nickname'],
+                              category: top_killer['value']}
+            results[category] = top_killer
+        return results
+
+    def leaderboard(self, fields, k=10):
+        unknown = [field for field in fields if field not in LEADERBOARD_FIELDS]
+        if unknown:
+            raise ValueError(f"Campos inválidos para o leaderboard: {', '.join(unknown)}")
+        all_rows = np.ones(self.size, dtype=bool)
+        results = {}
+        for field in fields:
+            values = self.columns[field]
+            rows = self._top(all_rows, [_sort_key(self._numeric(field)), self._numeric('player_id')], k)
+            results[field] = [{
+                'player_id': _python(self.columns['player_id'][row]),
+                'nickname': self.nicknames[row],
+                'value': _python(values[row]),
+            } for row in rows]
+        return results
+
+    # ======================
+    # Consultas Avançadas
+    # ======================
+
+    def players_with_win_percent_after_first_kill_above(self, threshold):
+        win_percent = self._numeric('team_win_percent_after_first_kill')
+        # Mesma ordem de registro_consultas.WIN_PERCENT_SORT; empates seguem a ordem das linhas, não o _id
+        rows = self._top(win_percent > threshold, [win_percent], None)
+        return self._documents(rows)
+
+    def win_percentage_after_first_kill_by_country(self, threshold):
+        win_percent = self._numeric('team_win_percent_after_first_kill')
+        mask = win_percent > threshold
+        group_codes, groups = self._group_by('country', mask)
+        totals = np.bincount(groups, weights=win_percent[mask], minlength=len(group_codes))
+        players = np.bincount(groups, minlength=len(group_codes))
+        averages = totals / players
+        order = np.argsort(-averages, kind='stable')
+        return [{
+            '_id': country,
+            'average_win_percent': _python(averages[i]),
+            'total_players': _python(players[i]),
+        } for i, country in zip(order, self._decoded('country', group_codes[order]))]
+
+    def average_kills_by_country(self, min_maps_played):
+        mask = self._numeric('maps_played') > min_maps_played
+        kills = self._numeric('total_kills')[mask]
+        group_codes, groups = self._group_by('country', mask)
+        numeric = ~np.isnan(kills)
+        sums = np.bincount(groups[numeric], weights=kills[numeric], minlength=len(group_codes))
+        counts = np.bincount(groups[numeric], minlength=len(group_codes))
+        players = np.bincount(groups, minlength=len(group_codes))
+        averages = np.divide(sums, counts, out=np.full(len(group_codes), np.nan), where=counts > 0)
+        order = np.lexsort([_sort_key(averages)])
+        return [{
+            '_id': country,
+            'average_kills': _python(averages[i]) if counts[i] else None,
+            'total_players': _python(players[i]),
+        } for i, country in zip(order, self._decoded('country', group_codes[order]))]
+
+    def kd_ratio_by_age_group(self):
+        age = self._numeric('age')
+        boundaries = np.array(AGE_BOUNDARIES, dtype=np.float64)
+        # Faixa de cada jogador; -1 para idades fora das faixas ("Other" no $bucket)
+        bucket = np.searchsorted(boundaries, age, side='right') - 1
+        bucket[np.isnan(age) | (age >= boundaries[-1])] = -1
+        kd = self._numeric('kills_per_death')
+        numeric = ~np.isnan(kd)
+
+        results = []
+        for index in list(range(len(AGE_BOUNDARIES) - 1)) + [-1]:
+            members = bucket == index
+            players = int(members.sum())
+            if not players:
+                continue
+            values = kd[members & numeric]
+            results.append({
+                '_id': AGE_BOUNDARIES[index] if index >= 0 else 'Other',
+                'average_kd_ratio': _python(values.sum() / values.size) if values.size else None,
+                'total_players': players,
+            })
+        averages = np.array([np.nan if r['average_kd_ratio'] is None else r['average_kd_ratio'] for r in results])
+        return [results[i] for i in np.lexsort([_sort_key(averages)])]
+
+    def top_kill_per_round_low_headshot(self, threshold):
+        headshots = self._numeric('headshot_percentage')
+        kills_per_round = self._numeric('kills_per_round')
+        # Mesma ordem do índice (stats.kills_per_round -1, stats.headshot_percentage 1)
+        rows = self._top(headshots < threshold, [_sort_key(kills_per_round), headshots], 10)
+        return [{
+            '_id': self.ids[row],
+            'nickname': self.nicknames[row],
+            'kills_per_round': _python(self.columns['kills_per_round'][row]),
+            'headshot_percentage': _python(self.columns['headshot_percentage'][row]),
+        } for row in rows]
+
+    def total_kills_by_weapon_per_team(self):
+        group_codes, groups = self._group_by('current_team', np.ones(self.size, dtype=bool))
+        sums = {}
+        for field in modelo.WEAPON_FIELDS:
+            values = self._numeric(field)
+            numeric = ~np.isnan(values)
+            sums[field] = np.bincount(groups[numeric], weights=values[numeric], minlength=len(group_codes))
+            if self.columns[field].dtype == np.int64:
+                sums[field] = sums[field].astype(np.int64)
+        order = np.argsort(-sums['rifle_kills'], kind='stable')
+        return [{
+            '_id': team,
+            **{field: _python(sums[field][i]) for field in modelo.WEAPON_FIELDS},
+        } for i, team in zip(order, self._decoded('current_team', group_codes[order]))]
+
+    def kill_death_difference_by_maps_and_kills(self, min_maps_played, min_kills):
+        maps_played = self._numeric('maps_played')
+        total_kills = self._numeric('total_kills')
+        mask = (maps_played > min_maps_played) & (total_kills > min_kills)
+        # Mesma ordem do índice (stats.kill_to_death_diff -1, stats.maps_played, stats.total_kills)
+        rows = self._top(mask, [_sort_key(self._numeric('kill_to_death_diff')), maps_played, total_kills], 10)
+        return [{
+            '_id': self.ids[row],
+            'nickname': self.nicknames[row],
+            'kill_to_death_diff': _python(self.columns['kill_to_death_diff'][row]),
+        } for row in rows]
+
+# ======================
+# Paridade com o MongoDB
+# ======================
+
+# Parâmetros usados na comparação; cada consulta roda com todos os casos
+PARITY_CASES = {
+    'percentage_maps_with_kills_above': [(11893, 1), (7998, 0), (-1, 1)],
+    'player_stats': [([11893, 7998, 20113, -1], 1), ([2023, 2023], 3)],
+    'ranking_kills_assists': [()],
+    'kill_difference_among_players_with_maps_above': [(0,), (500,), (1000,), (10 ** 9,)],
+    'players_with_opening_kills_and_rating_above': [(1000, 1.1), (500, 1.0), (0, 0)],
+    'get_top_killers': [()],
+    'leaderboard': [(['rating', 'kills_per_round', 'sniper_kills'], 5), (['other_kills'], 10)],
+    'players_with_win_percent_after_first_kill_above': [(75,), (70,)],
+    'win_percentage_after_first_kill_by_country': [(40,), (74,)],
+    'average_kills_by_country': [(0,), (500,), (1500,)],
+    'kd_ratio_by_age_group': [()],
+    'top_kill_per_round_low_headshot': [(40.0,), (50.0,)],
+    'total_kills_by_weapon_per_team': [()],
+    'kill_death_difference_by_maps_and_kills': [(500, 10000), (0, 0)],
+}
+# Consultas sem ordem definida (find sem sort) ou que agrupam e podem empatar na ordenação:
+# a comparação é feita com os resultados ordenados por _id
+UNORDERED = {
+    'players_with_opening_kills_and_rating_above', 'players_with_win_percent_after_first_kill_above',
+    'win_percentage_after_first_kill_by_country', 'average_kills_by_country', 'kd_ratio_by_age_group',
+    'total_kills_by_weapon_per_team',
+}
+
+
+def _same(expected, actual):
+    """Compara resultados, tolerando a diferença de arredondamento entre somas do servidor e do NumPy."""
+    if isinstance(expected, float) and isinstance(actual, float):
+        return (math.isnan(expected) and math.isnan(actual)) or math.isclose(expected, actual, rel_tol=1e-9)
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        return expected.keys() == actual.keys() and all(_same(expected[key], actual[key]) for key in expected)
+    if isinstance(expected, list) and isinstance(actual, list):
+        return len(expected) == len(actual) and all(_same(a, b) for a, b in zip(expected, actual))
+    return type(expected) is type(actual) and expected == actual
+
+
+def _canonical(result):
+    return sorted(result, key=lambda document: repr(document.get('_id')))
+
+
+def check_parity(store, mongo_queries):
+    """Roda todas as consultas nos dois backends e retorna a lista de divergências."""
+    mismatches = []
+    for name, cases in PARITY_CASES.items():
+        for args in cases:
+            expected = getattr(mongo_queries, name)(*args)
+            actual = getattr(store, name)(*args)
+            if name in UNORDERED:
+                expected, actual = _canonical(expected), _canonical(actual)
+            status = 'ok' if _same(expected, actual) else 'DIVERGENTE'
+            print(f"{name}{args}: {status}")
+            if status != 'ok':
+                mismatches.append((name, args, expected, actual))
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend colunar em memória para as consultas de queries.py.")
+    parser.add_argument('--parity', action='store_true', help="Compara todas as consultas com as do MongoDB")
+    parser.add_argument('--timing', action='store_true', help="Mede a latência de cada consulta no backend colunar")
+    args = parser.parse_args()
+
+    import queries
+    import queries_async
+    from pymongo import MongoClient
+
+    client = MongoClient(queries_async.MONGO_URI)
+    start = time.perf_counter()
+    store = ColumnarPlayers.from_collection(client[queries_async.DB_NAME]['players'])
+    print(f"{store.size:,} jogadores carregados em {time.perf_counter() - start:.2f} s.")
+    client.close()
+
+    if args.timing:
+        for name, cases in PARITY_CASES.items():
+            start = time.perf_counter()
+            for _ in range(100):
+                getattr(store, name)(*cases[0])
+            print(f"{name:50s} {(time.perf_counter() - start) * 10_000:8.1f} µs")
+
+    if args.parity:
+        # O cache devolveria resultados anteriores; a comparação precisa ir ao banco
+        queries.query_cache.ttl = 0
+        mismatches = check_parity(store, queries)
+        queries.close_client()
+        if mismatches:
+            print(f"\n{len(mismatches)} divergência(s) entre o backend colunar e o MongoDB.")
+            sys.exit(1)
+        print("\nTodas as consultas retornaram os mesmos resultados nos dois backends.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import time
+
+import insercao_banco
+
+
+class LatencyCollection:
+    """Substituto em memória de uma coleção que simula a latência de rede de cada escrita.
+
+    Permite medir como o pipeline escala com o número de workers sem um mongod local.
+    """
+
+    def __init__(self, latency_ms=20.0, per_document_us=20.0):
+        self.latency = latency_ms / 1000
+        self.per_document = per_document_us / 1_000_000
+        self.count = 0
+
+    def insert_many(self, documents, ordered=True):
+        # time.sleep libera o GIL, como a espera pela resposta do servidor
+        time.sleep(self.latency + self.per_document * len(documents))
+        self.count += len(documents)
+        return _InsertManyResult(len(documents))
+
+
+class _InsertManyResult:
+    def __init__(self, count):
+        self.inserted_ids = [None] * count
+
+
+def run_benchmark(file_path, worker_counts, chunk_size, uri=None, latency_ms=20.0):
+    """Executa o modo pipeline para cada quantidade de workers e retorna as linhas/s obtidas."""
+    client = insercao_banco.connect_to_mongodb(uri, max_pool_size=max(worker_counts) + 1) if uri else None
+    results = {}
+    try:
+        for workers in worker_counts:
+            if client:
+                collection = client['csgo_bench']['players_ingest']
+                collection.drop()
+            else:
+                collection = LatencyCollection(latency_ms)
+            start = time.perf_counter()
+            outcome = insercao_banco.pipeline_players_data(collection, file_path, workers, chunk_size)
+            elapsed = time.perf_counter() - start
+            if outcome is None:
+                break
+            results[workers] = outcome[0] / elapsed
+    finally:
+        if client:
+            client['csgo_bench']['players_ingest'].drop()
+            client.close()
+
+    print("\nWorkers | Linhas/s | Speedup")
+    baseline = results.get(min(results), 1) if results else 1
+    for workers, rate in results.items():
+        print(f"{workers:7d} | {rate:8,.0f} | {rate / baseline:6.2f}x")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede a vazão do pipeline de ingestão por número de workers.")
+    parser.add_argument('--file', default='./cs_pro_players/csgo_players.csv')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--chunk-size', type=int, default=100)
+    parser.add_argument('--uri', default=None,
+                        help="URI de um mongod local; sem ela é usado o substituto em memória")
+    parser.add_argument('--latency-ms', type=float, default=20.0,
+                        help="Latência simulada por escrita no substituto em memória")
+    args = parser.parse_args()
+    run_benchmark(args.file, args.workers, args.chunk_size, args.uri, args.latency_ms)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import re
+import statistics
+import time
+
+import pandas as pd
+
+import insercao_banco
+
+
+def load_layout(collection, df, layout, replicate):
+    """Grava o DataFrame no layout indicado, replicando as linhas para simular bases maiores."""
+    collection.drop()
+    for copy in range(replicate):
+        chunk = df.copy()
+        chunk['player_id'] = chunk['player_id'] + copy * 1_000_000
+        insercao_banco.insert_players_chunk(collection, insercao_banco.dataframe_to_documents(chunk, layout))
+    # No layout aninhado teams é uma lista, então este índice é multikey
+    collection.create_index('teams')
+
+
+def team_filter(layout, team):
+    if layout == 'flat':
+        # teams é uma string "Time A, Time B": só uma expressão regular encontra o time
+        return {"teams": {"$regex": f"(^|, ){re.escape(team)}(,|$)"}}
+    return {"teams": team}
+
+
+def time_lookups(collection, layout, teams, repeat):
+    latencies = []
+    docs_examined = []
+    for team in teams:
+        query = team_filter(layout, team)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(collection.find(query, {'player_id': 1}))
+            latencies.append((time.perf_counter() - start) * 1000)
+        stats = collection.find(query, {'player_id': 1}).explain()['executionStats']
+        docs_examined.append(stats['totalDocsExamined'])
+    return statistics.median(latencies), statistics.mean(docs_examined)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara buscas por time nos layouts plano e aninhado.")
+    parser.add_argument('--uri', default="mongodb://localhost:27017/")
+    parser.add_argument('--file', default='./cs_pro_players/csgo_players.csv')
+    parser.add_argument('--replicate', type=int, default=10, help="Quantas cópias do CSV carregar")
+    parser.add_argument('--teams', type=int, default=20, help="Quantidade de times consultados")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.file)
+    teams = df['current_team'].dropna().value_counts().index[:args.teams].tolist()
+
+    client = insercao_banco.connect_to_mongodb(args.uri)
+    db = client['csgo_bench']
+    try:
+        print("Layout  | Mediana (ms) | Docs examinados por busca")
+        for layout in ('flat', 'nested'):
+            collection = db[f'players_{layout}']
+            load_layout(collection, df, layout, args.replicate)
+            median, examined = time_lookups(collection, layout, teams, args.repeat)
+            print(f"{layout:7s} | {median:12.3f} | {examined:,.0f}")
+    finally:
+        for layout in ('flat', 'nested'):
+            db[f'players_{layout}'].drop()
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from pymongo import MongoClient
+
+import agregados
+import indices
+import insercao_banco
+import queries
+import queries_async
+import registro_consultas
+
+SOURCE_CSV = './cs_pro_players/csgo_players.csv'
+RESULTS_DIR = './bench_results'
+# Banco próprio do benchmark, como em bench_ingestao.py e bench_modelo.py: nunca o banco de produção
+BENCH_DB_NAME = os.getenv("CSGO_BENCH_DB", "csgo_bench")
+# Documento gravado no banco criado pelo benchmark; sem ele, o banco não é apagado
+BENCH_MARKER_COLLECTION = 'bench_marker'
+BENCH_MARKER_ID = 'benchmark_consultas'
+GENERATION_CHUNK = 100_000
+
+# Proporção média de rounds com 1..5 kills e kills por round correspondentes no CSV original
+KILL_ROUND_SHARES = np.array([0.300, 0.124, 0.037, 0.0073, 0.00077])
+KILLS_PER_ROUND_OF_SHARES = float((KILL_ROUND_SHARES * np.arange(1, 6)).sum())
+# Divisão média das kills por arma (rifle, sniper, smg, pistol, grenade, other)
+WEAPON_SHARES = np.array([0.62, 0.14, 0.055, 0.17, 0.013, 0.004])
+WEAPON_FIELDS = ['rifle_kills', 'sniper_kills', 'smg_kills', 'pistol_kills', 'grenade_kills', 'other_kills']
+
+# ======================
+# Geração de dados sintéticos
+# ======================
+
+def _categorical_sampler(series):
+    """Retorna valores e probabilidades observados em uma coluna do CSV original (inclui ausentes)."""
+    counts = series.value_counts(dropna=False)
+    return counts.index.to_numpy(dtype=object), (counts / counts.sum()).to_numpy()
+
+
+def _percent(values):
+    return np.char.add(np.round(values, 1).astype(str), '%')
+
+
+def generate_players(n_rows, first_id, rng, samplers, team_pool):
+    """Gera um bloco de jogadores sintéticos com as colunas e distribuições do CSV original."""
+    countries, country_p = samplers['country']
+    current_teams, team_p = samplers['current_team']
+    ages, age_p = samplers['age']
+
+    maps_played = np.maximum(50, rng.lognormal(np.log(843) - 0.106, 0.46, n_rows)).astype(int)
+    rounds_played = (maps_played * rng.normal(26.3, 1.0, n_rows)).astype(int)
+    kills_per_round = np.clip(rng.normal(0.688, 0.045, n_rows), 0.45, 0.95)
+    deaths_per_round = np.clip(rng.normal(0.667, 0.03, n_rows), 0.5, 0.8)
+    total_kills = np.round(rounds_played * kills_per_round).astype(int)
+    total_deaths = np.round(rounds_played * deaths_per_round).astype(int)
+
+    # Histograma de rounds por número de kills, coerente com as kills por round
+    kill_rounds = np.round(
+        rounds_played[:, None] * KILL_ROUND_SHARES[None, :] * (kills_per_round / KILLS_PER_ROUND_OF_SHARES)[:, None]
+    ).astype(int)
+    zero_kill_rounds = rounds_played - kill_rounds.sum(axis=1)
+
+    # Divisão das kills por arma: Dirichlet em torno das proporções médias (alguns jogadores são AWPers)
+    weapon_split = rng.dirichlet(WEAPON_SHARES * 8, n_rows)
+    weapon_kills = np.round(weapon_split * total_kills[:, None]).astype(int)
+
+    opening_kills = np.round(total_kills * np.clip(rng.normal(0.15, 0.02, n_rows), 0.05, 0.3)).astype(int)
+    opening_deaths = np.round(total_deaths * np.clip(rng.normal(0.148, 0.02, n_rows), 0.05, 0.3)).astype(int)
+
+    current_team = rng.choice(current_teams, n_rows, p=team_p)
+    extra_teams = rng.integers(0, 4, n_rows)
+    teams = [
+        ', '.join(dict.fromkeys(
+            ([team] if isinstance(team, str) else []) + list(rng.choice(team_pool, extra))
+        )) or team_pool[0]
+        for team, extra in zip(current_team, extra_teams)
+    ]
+
+    player_ids = np.arange(first_id, first_id + n_rows)
+    data = {
+        'player_id': player_ids,
+        'nickname': [f'player{player_id}' for player_id in player_ids],
+        'real_name': [f'Synthetic Player {player_id}' for player_id in player_ids],
+        'age': rng.choice(ages, n_rows, p=age_p),
+        'country': rng.choice(countries, n_rows, p=country_p),
+        'current_team': current_team,
+        'teams': teams,
+        'total_kills': total_kills,
+        'total_deaths': total_deaths,
+        'headshot_percentage': _percent(np.clip(rng.normal(45, 7, n_rows), 10, 75)),
+        'damage_per_round': np.round(rng.normal(75.1, 4.1, n_rows), 1),
+        'grenade_dmg_per_round': np.round(np.clip(rng.normal(4.07, 1.19, n_rows), 0.5, 10), 1),
+        'maps_played': maps_played,
+        'rounds_played': rounds_played,
+        'kills_per_death': np.round(total_kills / np.maximum(total_deaths, 1), 2),
+        'kills_per_round': np.round(kills_per_round, 2),
+        'assists_per_round': np.round(np.clip(rng.normal(0.13, 0.018, n_rows), 0.05, 0.25), 2),
+        'deaths_per_round': np.round(deaths_per_round, 2),
+        'saved_by_teammate_per_round': np.round(np.clip(rng.normal(0.096, 0.011, n_rows), 0.02, 0.2), 2),
+        'saved_teammates_per_round': np.round(np.clip(rng.normal(0.097, 0.013, n_rows), 0.02, 0.2), 2),
+        'rounds_with_kills': rounds_played - zero_kill_rounds,
+        'kill_to_death_diff': 'K - D diff.',
+        'total_opening_kills': opening_kills,
+        'total_opening_deaths': opening_deaths,
+        'opening_kill_ratio': np.round(opening_kills / np.maximum(opening_deaths, 1), 2),
+        'opening_kill_rating': np.round(rng.normal(1.015, 0.08, n_rows), 2),
+        'team_win_percent_after_first_kill': _percent(np.clip(rng.normal(73, 2, n_rows), 60, 85)),
+        'first_kill_in_won_rounds': _percent(np.clip(rng.normal(20, 2.5, n_rows), 10, 30)),
+        '0_kill_rounds': zero_kill_rounds,
+        **{f'{kills}_kill_rounds': kill_rounds[:, kills - 1] for kills in range(1, 6)},
+        **{field: weapon_kills[:, i] for i, field in enumerate(WEAPON_FIELDS)},
+        'rating': np.round(rng.normal(1.035, 0.073, n_rows), 2),
+    }
+    return pd.DataFrame(data)
+
+
+def generate_synthetic_csv(path, n_rows, seed=42, source_csv=SOURCE_CSV):
+    """Escreve um CSV sintético com n_rows jogadores, em blocos para não depender da memória."""
+    source = pd.read_csv(source_csv)
+    samplers = {field: _categorical_sampler(source[field]) for field in ('country', 'current_team', 'age')}
+    team_pool = np.array(sorted({team for teams in source['teams'].dropna() for team in teams.split(', ')}))
+    rng = np.random.default_rng(seed)
+
+    columns = list(source.columns)
+    written = 0
+    with open(path, 'w', newline='') as f:
+        while written < n_rows:
+            size = min(GENERATION_CHUNK, n_rows - written)
+            chunk = generate_players(size, written + 1, rng, samplers, team_pool)[columns]
+            chunk.to_csv(f, header=(written == 0), index=False)
+            written += size
+    print(f"CSV sintético com {n_rows:,} jogadores gravado em '{path}'.")
+    return path
+
+# ======================
+# mongod local
+# ======================
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_mongod(mongod_bin='mongod', replica_set=None):
+    """Inicia um mongod temporário e retorna (processo, uri, diretório de dados)."""
+    if shutil.which(mongod_bin) is None:
+        raise RuntimeError(f"Executável '{mongod_bin}' não encontrado. Informe --mongod-bin ou use --uri.")
+    dbpath = tempfile.mkdtemp(prefix='csgo_bench_')
+    port = _free_port()
+    command = [mongod_bin, '--dbpath', dbpath, '--port', str(port), '--bind_ip', '127.0.0.1', '--quiet']
+    if replica_set:
+        command += ['--replSet', replica_set]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    uri = f"mongodb://127.0.0.1:{port}/"
+    client = MongoClient(uri, serverSelectionTimeoutMS=500, directConnection=True)
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            client.admin.command('ping')
+            break
+        except Exception:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                shutil.rmtree(dbpath, ignore_errors=True)
+                raise RuntimeError("Não foi possível iniciar o mongod local.")
+            time.sleep(0.2)
+    if replica_set:
+        # Change streams exigem um replica set, mesmo que de um único membro
+        client.admin.command('replSetInitiate', {'_id': replica_set, 'members': [{'_id': 0, 'host': f'127.0.0.1:{port}'}]})
+        while not client.admin.command('hello').get('isWritablePrimary'):
+            time.sleep(0.2)
+        uri += f"?replicaSet={replica_set}"
+    client.close()
+    print(f"mongod local iniciado em {uri} (dados em {dbpath}).")
+    return process, uri, dbpath
+
+
+def stop_mongod(process, dbpath):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+    shutil.rmtree(dbpath, ignore_errors=True)
+
+# ======================
+# Medição das consultas
+# ======================
+
+# Parâmetros próprios da base sintética, cujos player_id vão de 1 a N (os exemplos do registro usam IDs reais)
+SYNTHETIC_ARGS = {
+    'percentage_maps_with_kills_above': (1, 1),
+    'player_stats': (list(range(1, 101)), 1),
+}
+
+
+def query_cases():
+    """Consultas medidas: todas as registradas em registro_consultas.py, com os parâmetros de exemplo de cada plano."""
+    cases = {}
+    for name, plan in registro_consultas.PLANS.items():
+        args = SYNTHETIC_ARGS.get(name, plan.example)
+        cases[name] = partial(getattr(queries, name), *args)
+    return cases
+
+
+def _result_size(result):
+    if isinstance(result, (list, dict)):
+        return len(result)
+    return 1 if result is not None else 0
+
+
+def profile_query(db, run):
+    """Executa a consulta uma vez com o profiler ligado e soma documentos e chaves examinados."""
+    db.command('profile', 0)
+    db['system.profile'].drop()
+    db.command('profile', 2)
+    try:
+        run()
+    finally:
+        db.command('profile', 0)
+    docs_examined = keys_examined = 0
+    for entry in db['system.profile'].find({'ns': {'$ne': f'{db.name}.system.profile'}}):
+        docs_examined += entry.get('docsExamined', 0)
+        keys_examined += entry.get('keysExamined', 0)
+    return docs_examined, keys_examined
+
+
+def time_queries(db, repeat, warmup=2):
+    """Mede p50/p95/p99 de cada consulta, sem cache, e os documentos examinados por execução."""
+    results = {}
+    for name, run in query_cases().items():
+        for _ in range(warmup):
+            run()
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = run()
+            latencies.append((time.perf_counter() - start) * 1000)
+        docs_examined, keys_examined = profile_query(db, run)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        results[name] = {
+            'p50_ms': round(float(p50), 3),
+            'p95_ms': round(float(p95), 3),
+            'p99_ms': round(float(p99), 3),
+            'docs_examined': docs_examined,
+            'keys_examined': keys_examined,
+            'result_size': _result_size(result),
+            'runs': repeat,
+        }
+        print(f"{name:50s} p50 {p50:9.2f} ms  p95 {p95:9.2f} ms  p99 {p99:9.2f} ms  docs {docs_examined:,}")
+    return results
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def prepare_bench_db(client, db_name=BENCH_DB_NAME):
+    """Recria o banco do benchmark. Recusa apagar um banco que já existe e não foi criado pelo benchmark."""
+    db = client[db_name]
+    if db.list_collection_names() and db[BENCH_MARKER_COLLECTION].find_one({'_id': BENCH_MARKER_ID}) is None:
+        raise RuntimeError(f"O banco '{db_name}' já existe e não foi criado pelo benchmark; use outro com CSGO_BENCH_DB.")
+    client.drop_database(db_name)
+    db[BENCH_MARKER_COLLECTION].insert_one({'_id': BENCH_MARKER_ID, 'created_at': datetime.now(timezone.utc)})
+    return db
+
+
+def run_benchmark(uri, sizes, repeat, workers, seed, output_dir=RESULTS_DIR, db_name=BENCH_DB_NAME):
+    """Carrega cada tamanho de base sintética pelo insercao_banco.py e mede todas as consultas."""
+    os.makedirs(output_dir, exist_ok=True)
+    commit = current_commit()
+    report = {
+        'commit': commit,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'uri': uri,
+        'db': db_name,
+        'repeat': repeat,
+        'scales': {},
+    }
+
+    # O cache mascararia a latência real das consultas
+    queries.query_cache.ttl = 0
+    queries_async.MONGO_URI = uri
+    queries_async.DB_NAME = db_name
+    queries.close_client()
+
+    client = insercao_banco.connect_to_mongodb(uri, max_pool_size=workers + 1)
+    try:
+        db = prepare_bench_db(client, db_name)
+        for size in sizes:
+            print(f"\n===== {size:,} jogadores =====")
+            with tempfile.TemporaryDirectory() as tmp:
+                csv_path = generate_synthetic_csv(os.path.join(tmp, 'players.csv'), size, seed)
+                db['players'].drop()
+                start = time.perf_counter()
+                insercao_banco.pipeline_players_data(db['players'], csv_path, workers)
+                load_seconds = time.perf_counter() - start
+            indices.ensure_indexes(db['players'])
+            agregados.refresh_all(db)
+            report['scales'][str(size)] = {
+                'load_seconds': round(load_seconds, 3),
+                'queries': time_queries(db, repeat),
+            }
+    finally:
+        queries.close_client()
+        client.close()
+
+    path = os.path.join(output_dir, f"bench_{commit}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResultados gravados em '{path}'.")
+    return report
+
+
+def compare_reports(baseline_path, candidate_path):
+    """Compara dois resultados e mostra a variação de p50 e p95 por consulta e escala."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(candidate_path) as f:
+        candidate = json.load(f)
+    print(f"Base: {baseline['commit']}  Candidato: {candidate['commit']}")
+    for scale, data in candidate['scales'].items():
+        if scale not in baseline['scales']:
+            continue
+        print(f"\n===== {int(scale):,} jogadores =====")
+        for name, stats in data['queries'].items():
+            before = baseline['scales'][scale]['queries'].get(name)
+            if not before:
+                continue
+            changes = [
+                f"{metric} {before[metric]:.2f} -> {stats[metric]:.2f} ms ({(stats[metric] / before[metric] - 1) * 100:+.0f}%)"
+                if before[metric] else f"{metric} {stats[metric]:.2f} ms"
+                for metric in ('p50_ms', 'p95_ms')
+            ]
+            print(f"{name:50s} {'  '.join(changes)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede a latência das consultas de queries.py em bases sintéticas.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                        help="Quantidades de jogadores (ex.: 10000 100000 1000000 10000000)")
+    parser.add_argument('--repeat', type=int, default=50, help="Execuções medidas por consulta")
+    parser.add_argument('--workers', type=int, default=insercao_banco.DEFAULT_WORKERS)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--uri', default=None,
+                        help=f"Usar um servidor existente em vez de iniciar um mongod local (banco {BENCH_DB_NAME})")
+    parser.add_argument('--mongod-bin', default='mongod')
+    parser.add_argument('--generate-only', metavar='CSV', help="Apenas gera o CSV sintético do primeiro tamanho")
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'CANDIDATO'), help="Compara dois resultados JSON")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_reports(*args.compare)
+        return
+    if args.generate_only:
+        generate_synthetic_csv(args.generate_only, args.sizes[0], args.seed)
+        return
+
+    if args.uri:
+        try:
+            run_benchmark(args.uri, args.sizes, args.repeat, args.workers, args.seed)
+        except RuntimeError as e:
+            print(f"Erro: {e}")
+        return
+
+    process, uri, dbpath = start_mongod(args.mongod_bin)
+    try:
+        run_benchmark(uri, args.sizes, args.repeat, args.workers, args.seed)
+    finally:
+        stop_mongod(process, dbpath)
+
+
+if __name__ == "__main__":
+    main()
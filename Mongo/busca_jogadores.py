@@ -0,0 +1,249 @@
+import argparse
+import asyncio
+import bisect
+import os
+import re
+import time
+import unicodedata
+from collections import Counter
+
+import numpy as np
+
+import modelo
+import queries_async
+import snapshot
+from backend_colunar import _python
+
+# Campos pesquisados, na ordem de prioridade usada para desempatar os resultados
+SEARCH_FIELDS = ['nickname', 'real_name', 'teams']
+DEFAULT_LIMIT = int(os.getenv("CSGO_SEARCH_LIMIT", "10"))
+# Tamanho das n-gramas usadas para achar os termos candidatos quando há erro de digitação
+NGRAM_SIZE = 3
+
+# ======================
+# Índice de busca por nome
+# ======================
+# Os nomes são quebrados em termos normalizados (minúsculas, sem acentos nem pontuação). Os termos ficam
+# em uma lista ordenada, onde todos os que começam com um prefixo formam um intervalo contíguo, achado por
+# busca binária (o mesmo que um trie, sem os nós). Para tolerar erros de digitação, um índice de trigramas
+# aponta os termos candidatos, conferidos depois pela distância de edição.
+
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text):
+    """Termos de um texto: minúsculas, sem acentos, separados por qualquer caractere não alfanumérico."""
+    if not isinstance(text, str):
+        return []
+    decomposed = unicodedata.normalize('NFKD', text)
+    ascii_text = ''.join(char for char in decomposed if not unicodedata.combining(char)).lower()
+    return [term for term in _NON_WORD.split(ascii_text) if term]
+
+
+def allowed_typos(term):
+    """Erros aceitos em um termo da busca: nenhum até 2 letras, 1 até 5 e 2 a partir de 6."""
+    if len(term) < 3:
+        return 0
+    return 1 if len(term) <= 5 else 2
+
+
+def _ngrams(term):
+    padded = f"^{term}"
+    return {padded[i:i + NGRAM_SIZE] for i in range(max(1, len(padded) - NGRAM_SIZE + 1))}
+
+
+def prefix_distance(query, term, limit):
+    """Menor distância de edição (com transposições) entre query e algum prefixo de term.
+
+    Retorna limit + 1 assim que nenhum caminho pode ficar dentro do limite.
+    """
+    previous2 = None
+    previous = list(range(len(term) + 1))
+    for i in range(1, len(query) + 1):
+        current = [i] + [0] * len(term)
+        for j in range(1, len(term) + 1):
+            cost = query[i - 1] != term[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous2 is not None and j > 1 and query[i - 1] == term[j - 2]
+                    and query[i - 2] == term[j - 1]):
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return min(previous)
+
+
+class PlayerSearchIndex:
+    """Busca de jogadores por nickname, nome real e times, com autocompletar e tolerância a erros.
+
+    terms é a lista ordenada de termos distintos; postings[i] traz os pares (linha, campo) que contêm
+    terms[i], com campo sendo a posição em SEARCH_FIELDS.
+    """
+
+    def __init__(self, store, terms, postings, ngrams):
+        self.store = store
+        self.terms = terms
+        self.postings = postings
+        self.ngrams = ngrams
+        # Desempate entre resultados igualmente bons: maior rating primeiro
+        rating = store.columns['rating'].astype(np.float64)
+        self._popularity = np.nan_to_num(-rating, nan=np.inf)
+
+    @classmethod
+    def build(cls, store):
+        """Quebra os nomes de todas as linhas da tabela colunar em termos."""
+        by_term = {}
+        for row in range(store.size):
+            team_names = modelo.split_teams(store.texts['teams'][row])
+            current_team = store.dictionaries['current_team'][store.codes['current_team'][row]]
+            values = [[store.nicknames[row]], [store.texts['real_name'][row]], team_names + [current_team]]
+            for field, texts in enumerate(values):
+                for text in texts:
+                    for term in normalize(text):
+                        by_term.setdefault(term, set()).add((row, field))
+        terms = sorted(by_term)
+        postings = [sorted(by_term[term]) for term in terms]
+        ngrams = {}
+        for term_id, term in enumerate(terms):
+            for ngram in _ngrams(term):
+                ngrams.setdefault(ngram, []).append(term_id)
+        return cls(store, terms, postings, ngrams)
+
+    def _prefix_terms(self, token):
+        """Ids dos termos que começam com token (intervalo da lista ordenada)."""
+        start = bisect.bisect_left(self.terms, token)
+        end = bisect.bisect_left(self.terms, token + '\uffff', start)
+        return range(start, end)
+
+    def _fuzzy_terms(self, token):
+        """Ids e distâncias dos termos que começam com token a menos de allowed_typos(token) erros."""
+        limit = allowed_typos(token)
+        if not limit:
+            return []
+        query_ngrams = _ngrams(token)
+        shared = Counter(term_id for ngram in query_ngrams for term_id in self.ngrams.get(ngram, ()))
+        # Cada erro destrói no máximo NGRAM_SIZE trigramas da busca
+        minimum = max(1, len(query_ngrams) - NGRAM_SIZE * limit)
+        matches = []
+        for term_id, count in shared.items():
+            if count >= minimum:
+                distance = prefix_distance(token, self.terms[term_id], limit)
+                if 0 < distance <= limit:
+                    matches.append((term_id, distance))
+        return matches
+
+    def _match_token(self, token, last):
+        """Melhor casamento de cada linha com um termo da busca: linha -> (tipo, erros, campo).
+
+        tipo 0 é o termo inteiro, 1 um prefixo (só para o último termo, que ainda está sendo digitado)
+        e 2 um casamento com erros de digitação.
+        """
+        best = {}
+
+        def offer(term_id, kind, distance):
+            for row, field in self.postings[term_id]:
+                key = (kind, distance, field)
+                if row not in best or key < best[row]:
+                    best[row] = key
+
+        for term_id in self._prefix_terms(token):
+            exact = self.terms[term_id] == token
+            if exact or last:
+                offer(term_id, 0 if exact else 1, 0)
+        for term_id, distance in self._fuzzy_terms(token):
+            if last or len(self.terms[term_id]) <= len(token) + distance:
+                offer(term_id, 2, distance)
+        return best
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """Jogadores cujos nomes contêm todos os termos da busca, do melhor casamento para o pior.
+
+        Uma busca só com dígitos também encontra o jogador com esse player_id.
+        """
+        tokens = normalize(query)
+        if not tokens:
+            return []
+        matches = None
+        for position, token in enumerate(tokens):
+            token_matches = self._match_token(token, last=position == len(tokens) - 1)
+            if matches is None:
+                matches = {row: [key] for row, key in token_matches.items()}
+            else:
+                matches = {row: keys + [token_matches[row]] for row, keys in matches.items() if row in token_matches}
+            if not matches:
+                break
+        ranked = sorted(
+            matches.items(),
+            key=lambda item: (sum(key[0] for key in item[1]), sum(key[1] for key in item[1]),
+                              min(key[2] for key in item[1]), self._popularity[item[0]])
+        )
+        rows = [row for row, _ in ranked]
+        if query.strip().isdigit():
+            row = self.store._row_of_player(int(query.strip()))
+            if row is not None:
+                rows = [row] + [other for other in rows if other != row]
+        results = []
+        for row in rows[:limit]:
+            keys = matches.get(row)
+            results.append({
+                'player_id': _python(self.store.columns['player_id'][row]),
+                'nickname': self.store.nicknames[row],
+                'real_name': self.store.texts['real_name'][row],
+                'current_team': self.store.dictionaries['current_team'][self.store.codes['current_team'][row]],
+                'matched_field': SEARCH_FIELDS[min(key[2] for key in keys)] if keys else 'player_id',
+                'typos': sum(key[1] for key in keys) if keys else 0,
+            })
+        return results
+
+
+# Índice em uso pelo processo, trocado quando a tabela colunar é recarregada
+_index = {'index': None, 'lock': None}
+
+
+async def get_search_index():
+    """Retorna o índice de busca da tabela colunar atual, montado na primeira busca depois de cada recarga."""
+    store = await queries_async.get_columnar_store()
+    if _index['lock'] is None:
+        _index['lock'] = asyncio.Lock()
+    async with _index['lock']:
+        if _index['index'] is None or _index['index'].store is not store:
+            # A montagem percorre todos os nomes; fora do loop, para não travar as outras consultas
+            _index['index'] = await asyncio.to_thread(PlayerSearchIndex.build, store)
+    return _index['index']
+
+
+@queries_async.query_monitor.instrumented
+async def search_players(query, limit=DEFAULT_LIMIT):
+    return (await get_search_index()).search(query, limit)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Busca jogadores por nickname, nome real ou time.")
+    parser.add_argument('query', nargs='+')
+    parser.add_argument('--snapshot', default=snapshot.DEFAULT_SNAPSHOT_PATH)
+    parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT)
+    args = parser.parse_args()
+
+    try:
+        store = snapshot.load_snapshot(args.snapshot)
+    except (OSError, ValueError) as e:
+        print(f"Erro ao abrir o snapshot: {e}")
+        return
+    start = time.perf_counter()
+    index = PlayerSearchIndex.build(store)
+    print(f"Índice com {len(index.terms):,} termos montado em {(time.perf_counter() - start) * 1000:.0f} ms.")
+    for query in args.query:
+        start = time.perf_counter()
+        results = index.search(query, args.limit)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"\n'{query}' ({elapsed_ms:.2f} ms):")
+        for result in results:
+            typos = f", {result['typos']} erro(s)" if result['typos'] else ''
+            print(f"  {result['nickname']} ({result['player_id']}) - {result['real_name']},"
+                  f" {result['current_team']} [{result['matched_field']}{typos}]")
+        if not results:
+            print("  Nenhum jogador encontrado.")
+
+
+if __name__ == "__main__":
+    main()
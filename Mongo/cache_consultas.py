@@ -0,0 +1,249 @@
+import asyncio
+import copy
+import inspect
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+# Configuração padrão (pode ser sobrescrita por variáveis de ambiente)
+DEFAULT_TTL = float(os.getenv("CSGO_CACHE_TTL", "300"))  # segundos; 0 desativa o cache
+DEFAULT_MAX_ENTRIES = int(os.getenv("CSGO_CACHE_MAX_ENTRIES", "256"))
+# Intervalo mínimo entre duas leituras do carimbo de versão da coleção
+VERSION_CHECK_INTERVAL = float(os.getenv("CSGO_CACHE_VERSION_CHECK", "2"))
+
+# Documento com o carimbo de versão da coleção de jogadores, incrementado a cada carga
+META_COLLECTION = 'meta'
+VERSION_DOC_ID = 'players'
+
+
+def bump_collection_version(db):
+    """Incrementa o carimbo de versão da coleção de jogadores, invalidando os caches que o observam."""
+    result = db[META_COLLECTION].find_one_and_update(
+        {'_id': VERSION_DOC_ID},
+        {'$inc': {'version': 1}, '$currentDate': {'updated_at': True}},
+        upsert=True,
+        return_document=True
+    )
+    return result['version']
+
+
+def read_collection_version(db):
+    """Lê o carimbo de versão atual da coleção de jogadores (0 se nunca houve carga)."""
+    document = db[META_COLLECTION].find_one({'_id': VERSION_DOC_ID}, {'version': 1})
+    return document['version'] if document else 0
+
+
+async def read_collection_version_async(db):
+    """Versão de read_collection_version para o cliente assíncrono."""
+    document = await db[META_COLLECTION].find_one({'_id': VERSION_DOC_ID}, {'version': 1})
+    return document['version'] if document else 0
+
+
+def _freeze(value):
+    """Converte listas, conjuntos e dicionários em tuplas, para que possam compor a chave do cache."""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(_freeze(item) for item in value))
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    return value
+
+
+def make_key(function_name, args, kwargs):
+    """Monta a chave do cache a partir do nome da função e dos argumentos."""
+    return function_name, _freeze(args), _freeze(kwargs)
+
+
+class QueryCache:
+    """Cache LRU com TTL para resultados de consultas, invalidado quando a versão da coleção muda.
+
+    version_source é uma função que retorna a versão atual dos dados; ela é consultada no máximo
+    uma vez a cada version_check_interval segundos, e não a cada acesso ao cache. on_hit, se
+    informada, é chamada (sem argumentos) a cada valor servido pelo cache.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, version_source=None,
+                 version_check_interval=VERSION_CHECK_INTERVAL, on_hit=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._version_source = version_source
+        self._on_hit = on_hit
+        self._version_check_interval = version_check_interval
+        self._version = None
+        self._version_checked_at = float('-inf')
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Um lock por chave em cálculo, para que vários leitores simultâneos não repitam a mesma consulta
+        self._inflight = {}
+        # O mesmo para as consultas assíncronas: um future por chave, resolvido por quem calcula
+        self._inflight_async = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_entries > 0
+
+    def _version_due(self):
+        return (self._version_source is not None
+                and time.monotonic() - self._version_checked_at >= self._version_check_interval)
+
+    def _refresh_version(self):
+        if self._version_due():
+            self._apply_version(self._version_source())
+
+    async def _refresh_version_async(self):
+        if self._version_due():
+            version = self._version_source()
+            if inspect.isawaitable(version):
+                version = await version
+            self._apply_version(version)
+
+    def _apply_version(self, version):
+        now = time.monotonic()
+        with self._lock:
+            self._version_checked_at = now
+            if version != self._version:
+                if self._version is not None:
+                    self.invalidations += len(self._entries)
+                    self._entries.clear()
+                self._version = version
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        if self._on_hit is not None:
+            self._on_hit()
+        return True, value
+
+    def _store(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        """Retorna o valor em cache para a chave ou o calcula com compute() e o armazena."""
+        if not self.enabled:
+            return compute()
+        self._refresh_version()
+        found, value = self._lookup(key)
+        if found:
+            return copy.deepcopy(value)
+
+        with self._lock:
+            key_lock = self._inflight.setdefault(key, threading.Lock())
+        with key_lock:
+            # Outro leitor pode ter calculado o valor enquanto esperávamos
+            found, value = self._lookup(key)
+            if not found:
+                with self._lock:
+                    self.misses += 1
+                value = compute()
+                self._store(key, value)
+        with self._lock:
+            self._inflight.pop(key, None)
+        return copy.deepcopy(value)
+
+    async def get_or_compute_async(self, key, compute):
+        """Versão assíncrona de get_or_compute; compute é uma função sem argumentos que retorna uma corrotina."""
+        if not self.enabled:
+            return await compute()
+        await self._refresh_version_async()
+        found, value = self._lookup(key)
+        if found:
+            return copy.deepcopy(value)
+
+        with self._lock:
+            future = self._inflight_async.get(key)
+            owner = future is None
+            if owner:
+                future = asyncio.get_running_loop().create_future()
+                self._inflight_async[key] = future
+                self.misses += 1
+        if not owner:
+            # Outra tarefa já está calculando esta chave; espera o mesmo resultado
+            return copy.deepcopy(await asyncio.shield(future))
+
+        try:
+            value = await compute()
+            self._store(key, value)
+            future.set_result(value)
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # evita o aviso de exceção não lida quando ninguém mais espera
+            raise
+        finally:
+            with self._lock:
+                self._inflight_async.pop(key, None)
+        return copy.deepcopy(value)
+
+    def invalidate(self, function_names=None):
+        """Remove do cache todas as entradas, ou apenas as das funções indicadas."""
+        with self._lock:
+            if function_names is None:
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                names = set(function_names)
+                keys = [key for key in self._entries if key[0] in names]
+                for key in keys:
+                    del self._entries[key]
+                removed = len(keys)
+            self.invalidations += removed
+        return removed
+
+    def invalidate_where(self, predicate):
+        """Remove do cache as entradas cuja chave (função, args, kwargs) satisfaz predicate."""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            self.invalidations += len(keys)
+        return len(keys)
+
+    def stats(self):
+        """Retorna os contadores do cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'version': self._version,
+                'ttl': self.ttl,
+                'max_entries': self.max_entries,
+            }
+
+    def cached(self, func):
+        """Decorador: guarda o resultado da função (síncrona ou assíncrona) por nome e argumentos."""
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                key = make_key(func.__name__, args, kwargs)
+                return await self.get_or_compute_async(key, lambda: func(*args, **kwargs))
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = make_key(func.__name__, args, kwargs)
+            return self.get_or_compute(key, lambda: func(*args, **kwargs))
+        return wrapper
@@ -0,0 +1,284 @@
+import argparse
+import asyncio
+import math
+import os
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from pymongo import ASCENDING, DESCENDING
+
+import modelo
+import queries_async
+from backend_colunar import ColumnarPlayers
+
+# Coleções do histórico: as diferenças por jogador e um documento por versão registrada
+HISTORY_COLLECTION = 'player_history'
+VERSIONS_COLLECTION = 'player_history_versions'
+# A cada tantas versões, o estado inteiro é gravado de novo, para que reconstruir uma versão nunca
+# exija aplicar mais que esse número de cargas de diferenças
+CHECKPOINT_INTERVAL = int(os.getenv("CSGO_HISTORY_CHECKPOINT_INTERVAL", "10"))
+# Versões reconstruídas mantidas em memória para as consultas com as_of
+STORE_CACHE_SIZE = int(os.getenv("CSGO_HISTORY_CACHE_SIZE", "4"))
+# Colunas guardadas no histórico (player_id é a chave de cada registro)
+HISTORY_COLUMNS = [column for column in modelo.FIELD_MAPPING if column != 'player_id']
+
+# ======================
+# Histórico de versões
+# ======================
+# Cada carga de insercao_banco.py é registrada com a versão da coleção (cache_consultas.py). Um registro
+# por jogador alterado guarda só as colunas que mudaram em relação à versão anterior (kind 'set', com os
+# campos removidos em unset) ou a remoção do jogador (kind 'delete'). A cada CHECKPOINT_INTERVAL versões,
+# um checkpoint grava o estado inteiro (kind 'checkpoint'). Reconstruir a versão v é partir do último
+# checkpoint até v e aplicar as diferenças seguintes, na ordem.
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def flatten(document):
+    """Colunas do jogador no formato plano (sem os valores ausentes), como gravadas no histórico."""
+    flat = {}
+    for column in HISTORY_COLUMNS:
+        value = modelo.get_path(document, modelo.field_path(column))
+        if column == 'teams':
+            value = modelo.split_teams(value) or None
+        if not _is_missing(value):
+            flat[column] = value
+    return flat
+
+
+def apply_delta(state, delta):
+    """Aplica um registro do histórico ao estado (player_id -> colunas)."""
+    player_id = delta['player_id']
+    if delta['kind'] == 'delete':
+        state.pop(player_id, None)
+    elif delta['kind'] == 'checkpoint':
+        state[player_id] = dict(delta['fields'])
+    else:
+        fields = state.setdefault(player_id, {})
+        fields.update(delta.get('fields', {}))
+        for column in delta.get('unset', []):
+            fields.pop(column, None)
+
+
+def replay(deltas):
+    """Estado de todos os jogadores depois de aplicar os registros, que devem vir em ordem de versão."""
+    state = {}
+    for delta in deltas:
+        apply_delta(state, delta)
+    return state
+
+
+def diff(previous, current, player_ids=None):
+    """Registros que levam do estado previous ao current (considerando só player_ids, se informado)."""
+    if player_ids is None:
+        player_ids = set(previous) | set(current)
+    deltas = []
+    for player_id in sorted(player_ids):
+        old, new = previous.get(player_id), current.get(player_id)
+        if new is None:
+            if old is not None:
+                deltas.append({'player_id': player_id, 'kind': 'delete'})
+            continue
+        old = old or {}
+        changed = {column: value for column, value in new.items() if old.get(column) != value}
+        removed = [column for column in old if column not in new]
+        if changed or removed:
+            delta = {'player_id': player_id, 'kind': 'set', 'fields': changed}
+            if removed:
+                delta['unset'] = removed
+            deltas.append(delta)
+    return deltas
+
+
+def stat_series(player_id, deltas, versions, fields):
+    """Valores das colunas do jogador em cada versão, a partir dos registros dele em ordem de versão.
+
+    Versões em que o jogador não existia ficam de fora.
+    """
+    series, state, position = [], {}, 0
+    for version in versions:
+        while position < len(deltas) and deltas[position]['version'] <= version['_id']:
+            apply_delta(state, deltas[position])
+            position += 1
+        if player_id in state:
+            series.append({'version': version['_id'], 'recorded_at': version['recorded_at'],
+                           **{field: state[player_id].get(field) for field in fields}})
+    return series
+
+
+def store_from_state(state):
+    """Tabela colunar de um estado reconstruído, para rodar sobre ele as consultas do backend colunar."""
+    documents = [modelo.to_document({'player_id': player_id, **fields}) for player_id, fields in state.items()]
+    return ColumnarPlayers.from_documents(documents)
+
+
+def _deltas_filter(checkpoint, version):
+    return {'version': {'$gte': checkpoint, '$lte': version}}
+
+
+def ensure_history_indexes(db):
+    db[HISTORY_COLLECTION].create_index([('version', ASCENDING), ('player_id', ASCENDING)])
+    db[HISTORY_COLLECTION].create_index([('player_id', ASCENDING), ('version', ASCENDING)])
+
+
+def reconstruct(db, version):
+    """Estado (player_id -> colunas) na versão pedida, ou None se ela é anterior ao histórico."""
+    recorded = db[VERSIONS_COLLECTION].find_one({'_id': {'$lte': version}}, sort=[('_id', DESCENDING)])
+    if recorded is None:
+        return None
+    return replay(db[HISTORY_COLLECTION].find(_deltas_filter(recorded['checkpoint_version'], recorded['_id']))
+                  .sort([('version', ASCENDING), ('player_id', ASCENDING)]))
+
+
+def record_version(db, version, player_ids=None, players_collection='players'):
+    """Registra o estado atual da coleção como a versão informada.
+
+    Com player_ids (os jogadores alterados por uma carga incremental) e a versão anterior já registrada,
+    só esses jogadores são relidos; caso contrário, a coleção inteira é comparada com a última versão.
+    """
+    versions, history = db[VERSIONS_COLLECTION], db[HISTORY_COLLECTION]
+    last = versions.find_one(sort=[('_id', DESCENDING)])
+    if last is not None and last['_id'] >= version:
+        print(f"Versão {version} já está no histórico.")
+        return None
+    ensure_history_indexes(db)
+    players = db[players_collection]
+
+    previous = reconstruct(db, last['_id']) if last is not None else {}
+    if last is not None and player_ids is not None and last['_id'] == version - 1:
+        current = dict(previous)
+        found = {document['player_id']: flatten(document)
+                 for document in players.find({'player_id': {'$in': list(player_ids)}})}
+        for player_id in player_ids:
+            current.pop(player_id, None)
+        current.update(found)
+        deltas = diff(previous, current, set(player_ids))
+    else:
+        current = {document['player_id']: flatten(document) for document in players.find({})}
+        deltas = diff(previous, current)
+
+    checkpoint = last is None or version - last['checkpoint_version'] >= CHECKPOINT_INTERVAL
+    kinds = {kind: sum(delta['kind'] == kind for delta in deltas) for kind in ('set', 'delete')}
+    if checkpoint:
+        # As remoções também entram no checkpoint: sem elas, a série de um jogador removido nesta versão
+        # (player_stat_history, que só lê os registros dele) continuaria com os valores antigos
+        records = [{'player_id': player_id, 'kind': 'checkpoint', 'fields': fields}
+                   for player_id, fields in current.items()]
+        records += [delta for delta in deltas if delta['kind'] == 'delete']
+    else:
+        records = deltas
+    for record in records:
+        record['version'] = version
+    if records:
+        history.insert_many(records, ordered=False)
+    versions.insert_one({
+        '_id': version,
+        'recorded_at': datetime.now(timezone.utc),
+        'checkpoint': checkpoint,
+        'checkpoint_version': version if checkpoint else last['checkpoint_version'],
+        'players': len(current),
+        'changed': kinds['set'],
+        'deleted': kinds['delete'],
+    })
+    kind = "checkpoint" if checkpoint else "diferenças"
+    print(f"Histórico: versão {version} registrada ({kind}; {kinds['set']} jogadores alterados,"
+          f" {kinds['delete']} removidos, {len(records)} registros).")
+    return version
+
+# ======================
+# Consultas no passado
+# ======================
+
+# Versão pedida -> tabela colunar reconstruída, das mais recentes para as mais antigas
+_stores = OrderedDict()
+
+
+async def get_store_as_of(version):
+    """Tabela colunar do estado na versão pedida (a última registrada até ela), com cache das mais usadas.
+
+    O _id dos documentos não é guardado no histórico; nas consultas com as_of ele vem como None.
+    """
+    db = queries_async.get_client()[queries_async.DB_NAME]
+    recorded = await db[VERSIONS_COLLECTION].find_one({'_id': {'$lte': version}}, sort=[('_id', DESCENDING)])
+    if recorded is None:
+        raise ValueError(f"Nenhuma versão registrada no histórico até a versão {version}.")
+    version = recorded['_id']
+    if version in _stores:
+        _stores.move_to_end(version)
+        return _stores[version]
+    deltas = await db[HISTORY_COLLECTION].find(_deltas_filter(recorded['checkpoint_version'], version)).sort(
+        [('version', ASCENDING), ('player_id', ASCENDING)]).to_list()
+    # A conversão para arrays usa CPU; fora do loop, para não travar as outras consultas
+    store = await asyncio.to_thread(lambda: store_from_state(replay(deltas)))
+    _stores[version] = store
+    while len(_stores) > STORE_CACHE_SIZE:
+        _stores.popitem(last=False)
+    return store
+
+
+@queries_async.query_monitor.instrumented
+async def history_versions():
+    """Versões registradas, da mais antiga para a mais recente."""
+    db = queries_async.get_client()[queries_async.DB_NAME]
+    return await db[VERSIONS_COLLECTION].find({}).sort('_id', ASCENDING).to_list()
+
+
+@queries_async.query_monitor.instrumented
+async def player_stat_history(player_id, fields=('rating',)):
+    """Valores das colunas do jogador em cada versão registrada desde a primeira em que ele aparece.
+
+    Retorna uma linha por versão: version, recorded_at e o valor de cada coluna (None se ausente).
+    Versões em que o jogador não existia ficam de fora.
+    """
+    db = queries_async.get_client()[queries_async.DB_NAME]
+    deltas = await db[HISTORY_COLLECTION].find({'player_id': player_id}).sort('version', ASCENDING).to_list()
+    if not deltas:
+        return []
+    versions = await db[VERSIONS_COLLECTION].find({'_id': {'$gte': deltas[0]['version']}}).sort(
+        '_id', ASCENDING).to_list()
+    return stat_series(player_id, deltas, versions, fields)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Registra e consulta o histórico de versões da coleção de jogadores.")
+    parser.add_argument('--uri', default=os.getenv("MONGO_URI", "mongodb://localhost:27017/"))
+    parser.add_argument('--db', default=os.getenv("MONGO_DB", "csgo_db"))
+    parser.add_argument('--record', action='store_true', help="Registra a versão atual da coleção")
+    parser.add_argument('--list', action='store_true', help="Lista as versões registradas")
+    parser.add_argument('--player', type=int, help="Mostra a série histórica do jogador")
+    parser.add_argument('--fields', nargs='+', default=['rating'])
+    args = parser.parse_args()
+
+    from pymongo import MongoClient
+    from cache_consultas import read_collection_version
+
+    client = MongoClient(args.uri)
+    db = client[args.db]
+    try:
+        if args.record:
+            record_version(db, read_collection_version(db))
+        if args.list:
+            for version in db[VERSIONS_COLLECTION].find({}).sort('_id', ASCENDING):
+                kind = 'checkpoint' if version['checkpoint'] else 'diferenças'
+                print(f"v{version['_id']:<5} {version['recorded_at']:%Y-%m-%d %H:%M}  {kind:11s}"
+                      f" {version['players']:,} jogadores, {version['changed']} alterados, {version['deleted']} removidos")
+        if args.player is not None:
+            queries_async.MONGO_URI = args.uri
+            queries_async.DB_NAME = args.db
+            try:
+                series = queries_async.run(player_stat_history(args.player, args.fields))
+            finally:
+                queries_async.close_client()
+            if not series:
+                print(f"Jogador {args.player} não está no histórico.")
+            for point in series:
+                values = ', '.join(f"{field}: {point[field]}" for field in args.fields)
+                print(f"v{point['version']:<5} {point['recorded_at']:%Y-%m-%d %H:%M}  {values}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import argparse
+import sys
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+import agregados
+import modelo
+import registro_consultas
+from registro_consultas import LEADERBOARD_FIELDS
+
+# ======================
+# Índices por consulta
+# ======================
+# Cada consulta de registro_consultas.py declara os índices de que precisa. Os nomes são os padrões
+# do MongoDB, então um mesmo índice pode ser declarado por mais de uma consulta.
+
+INDEX_PLANS = {
+    # Busca de jogadores pela chave natural (um ou vários de uma vez, com $in)
+    'percentage_maps_with_kills_above': [
+        IndexModel([('player_id', ASCENDING)], unique=True),
+    ],
+    'player_stats': [
+        IndexModel([('player_id', ASCENDING)], unique=True),
+    ],
+    # Top 10 pela soma de kills e assistências por round, gravada na carga
+    'ranking_kills_assists': [
+        IndexModel([('stats.kills_assists_per_round', DESCENDING)]),
+    ],
+    # Faixa de maps_played; o índice cobre total_kills, então o $group não lê documentos
+    'kill_difference_among_players_with_maps_above': [
+        IndexModel([('stats.maps_played', ASCENDING), ('stats.total_kills', ASCENDING)]),
+    ],
+    # _id no fim do índice atende à ordenação estável da paginação por chave, sem sort em memória
+    'players_with_opening_kills_and_rating_above': [
+        IndexModel([('stats.total_opening_kills', ASCENDING), ('rating', ASCENDING), ('_id', ASCENDING)]),
+    ],
+    # Um índice por campo atende ao sort + limit de cada ramo do leaderboard, com player_id como desempate
+    'leaderboard': [
+        IndexModel([(modelo.field_path(field), DESCENDING), ('player_id', ASCENDING)]) for field in LEADERBOARD_FIELDS
+    ],
+    'players_with_win_percent_after_first_kill_above': [
+        IndexModel([('stats.team_win_percent_after_first_kill', ASCENDING), ('_id', ASCENDING)]),
+    ],
+    # win_percentage_after_first_kill_by_country, average_kills_by_country, kd_ratio_by_age_group e
+    # total_kills_by_weapon_per_team leem as coleções resumidas, com índices declarados em agregados.py
+    # Ordem do índice segue a regra ESR: campo ordenado antes do campo de faixa
+    'top_kill_per_round_low_headshot': [
+        IndexModel([('stats.kills_per_round', DESCENDING), ('stats.headshot_percentage', ASCENDING)]),
+    ],
+    'kill_death_difference_by_maps_and_kills': [
+        IndexModel([('stats.kill_to_death_diff', DESCENDING), ('stats.maps_played', ASCENDING),
+                    ('stats.total_kills', ASCENDING)]),
+    ],
+}
+
+
+def declared_indexes():
+    """Retorna os índices declarados, sem repetições, na ordem em que aparecem."""
+    unique = {}
+    for models in INDEX_PLANS.values():
+        for model in models:
+            unique.setdefault(model.document['name'], model)
+    return list(unique.values())
+
+
+def ensure_indexes(collection):
+    """Cria os índices declarados. É idempotente: índices já existentes não são recriados."""
+    agregados.ensure_rollup_indexes(collection.database)
+    existing = set(collection.index_information())
+    missing = [model for model in declared_indexes() if model.document['name'] not in existing]
+    if not missing:
+        print("Todos os índices já existem.")
+        return []
+    created = []
+    # Um índice por vez, para que a falha de um não impeça a criação dos demais
+    for model in missing:
+        try:
+            created.extend(collection.create_indexes([model]))
+        except OperationFailure as e:
+            # Ex.: índice único de player_id em uma coleção com jogadores duplicados
+            print(f"Erro ao criar o índice {model.document['name']}: {e}")
+    print(f"{len(created)} índices criados: {', '.join(created)}")
+    return created
+
+
+# ======================
+# Verificação dos planos
+# ======================
+# As consultas verificadas são as de registro_consultas.py, com os parâmetros de exemplo de cada plano.
+
+def _winning_plan_stages(explain):
+    """Percorre a saída do explain e retorna os estágios dos planos vencedores."""
+    stages = []
+
+    def collect_stages(plan):
+        if isinstance(plan, dict):
+            if 'stage' in plan:
+                stages.append(plan['stage'])
+            for key, value in plan.items():
+                if key != 'rejectedPlans':
+                    collect_stages(value)
+        elif isinstance(plan, list):
+            for item in plan:
+                collect_stages(item)
+
+    def find_winning_plans(node):
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key == 'winningPlan':
+                    collect_stages(value)
+                elif key != 'rejectedPlans':
+                    find_winning_plans(value)
+        elif isinstance(node, list):
+            for item in node:
+                find_winning_plans(item)
+
+    find_winning_plans(explain)
+    return stages
+
+
+def verify_query_plans(collection):
+    """Executa explain() de todas as consultas registradas e falha se alguma fizer COLLSCAN."""
+    failures = []
+    for name in registro_consultas.PLANS:
+        stages = _winning_plan_stages(registro_consultas.explain_plan(collection.database, name))
+        status = 'COLLSCAN' if 'COLLSCAN' in stages else 'ok'
+        print(f"{name:50s} {status:9s} {' > '.join(stages)}")
+        if status == 'COLLSCAN':
+            failures.append(name)
+    if failures:
+        raise RuntimeError(f"Consultas sem índice (COLLSCAN): {', '.join(failures)}")
+    print("Nenhuma consulta registrada faz COLLSCAN.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cria e verifica os índices usados pelas consultas.")
+    parser.add_argument('--uri', default="mongodb://localhost:27017/")
+    parser.add_argument('--apply', action='store_true', help="Cria os índices que estiverem faltando")
+    parser.add_argument('--verify', action='store_true', help="Roda explain() em cada consulta registrada")
+    args = parser.parse_args()
+
+    # Import local para reaproveitar a conexão do carregador
+    from insercao_banco import connect_to_mongodb
+
+    client = connect_to_mongodb(args.uri)
+    collection = client['csgo_db']['players']
+    try:
+        if args.apply or not args.verify:
+            ensure_indexes(collection)
+        if args.verify:
+            verify_query_plans(collection)
+    except RuntimeError as e:
+        print(f"Erro: {e}")
+        sys.exit(1)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,37 @@
+import argparse
+import hashlib
+import json
+import queue
+import threading
+import time
+
 import pandas as pd
-from pymongo import MongoClient
-from pymongo.errors import ConfigurationError, OperationFailure
+from pymongo import DeleteOne, MongoClient, ReplaceOne
+from pymongo.errors import BulkWriteError, ConfigurationError, OperationFailure, PyMongoError
+
+import agregados
+import amostragem
+import historico
+import indices
+import modelo
+import percentis
+import similaridade
+import snapshot
+from cache_consultas import bump_collection_version
 
-def connect_to_mongodb(uri="mongodb://localhost:27017/"):
+# Quantidade de linhas lidas e gravadas por bloco no modo streaming
+DEFAULT_CHUNK_SIZE = 5000
+# Número padrão de workers de escrita no modo pipeline
+DEFAULT_WORKERS = 4
+# Campo que guarda o hash do conteúdo de cada jogador, usado pelo modo sync
+HASH_FIELD = '_content_hash'
+# Campos que o CSV traz como texto no formato "41.2%" e que são gravados como número
+PERCENT_FIELDS = ['headshot_percentage', 'team_win_percent_after_first_kill', 'first_kill_in_won_rounds']
+
+def connect_to_mongodb(uri="mongodb://localhost:27017/", max_pool_size=100):
     """Estabelece a conexão com o MongoDB."""
     try:
-        client = MongoClient(uri)
+        client = MongoClient(uri, maxPoolSize=max_pool_size)
         print("Conexão bem-sucedida com o MongoDB.")
         return client
     except ConfigurationError:
@@ -33,29 +59,378 @@ def read_csv_file(file_path):
         print(f"Erro: Arquivo '{file_path}' não encontrado.")
         return None
 
-def main():
+def normalize_dataframe(df):
+    """Converte percentuais em número e calcula os campos derivados, uma única vez na carga."""
+    df = df.copy()
+    for field in PERCENT_FIELDS:
+        if field in df and not pd.api.types.is_numeric_dtype(df[field]):
+            df[field] = pd.to_numeric(df[field].astype(str).str.rstrip('%'), errors='coerce')
+    # O CSV traz apenas o texto "K - D diff." nesta coluna
+    if {'total_kills', 'total_deaths'} <= set(df.columns):
+        df['kill_to_death_diff'] = df['total_kills'] - df['total_deaths']
+    if {'kills_per_round', 'assists_per_round'} <= set(df.columns):
+        df['kills_assists_per_round'] = (df['kills_per_round'] + df['assists_per_round']).round(2)
+    return df
+
+def dataframe_to_documents(df, layout='nested'):
+    """Converte um DataFrame (ou um bloco dele) em uma lista de documentos normalizados.
+
+    Com layout='nested' os documentos seguem o modelo de modelagem_banco/modelagem.txt
+    (subdocumentos stats e kills_breakdown e teams como lista); com 'flat' mantêm as colunas do CSV.
+    """
+    records = normalize_dataframe(df).to_dict(orient='records')
+    if layout == 'flat':
+        return records
+    return [modelo.to_document(record) for record in records]
+
+def migrate_existing_documents(collection):
+    """Migração única: normaliza e converte para o formato aninhado os documentos de cargas antigas."""
+    percent_to_number = {
+        field: {"$convert": {
+            "input": {"$trim": {"input": {"$toString": f"${field}"}, "chars": "%"}},
+            "to": "double",
+            "onError": None,
+            "onNull": None
+        }}
+        for field in PERCENT_FIELDS
+    }
+    result = collection.update_many(
+        {"stats": {"$exists": False}},
+        [{"$set": {
+            **percent_to_number,
+            "kill_to_death_diff": {"$subtract": ["$total_kills", "$total_deaths"]},
+            "kills_assists_per_round": {"$round": [{"$add": ["$kills_per_round", "$assists_per_round"]}, 2]}
+        }}] + modelo.migration_pipeline()
+    )
+    print(f"{result.modified_count} documentos migrados.")
+    return result.modified_count
+
+def insert_players_chunk(collection, documents):
+    """Grava um bloco de documentos sem ordem, seguindo adiante em caso de falhas individuais.
+
+    Retorna uma tupla (inseridos, falhas).
+    """
+    if not documents:
+        return 0, 0
+    try:
+        result = collection.insert_many(documents, ordered=False)
+        return len(result.inserted_ids), 0
+    except BulkWriteError as e:
+        # Com ordered=False o servidor continua gravando os demais documentos do bloco
+        write_errors = e.details.get('writeErrors', [])
+        for error in write_errors[:3]:
+            print(f"Erro no documento {error.get('index')}: {error.get('errmsg')}")
+        if len(write_errors) > 3:
+            print(f"... e mais {len(write_errors) - 3} erros neste bloco.")
+        return e.details.get('nInserted', 0), len(write_errors)
+    except PyMongoError as e:
+        print(f"Erro ao inserir bloco: {e}")
+        return 0, len(documents)
+
+def stream_players_data(collection, file_path, chunk_size=DEFAULT_CHUNK_SIZE, layout='nested'):
+    """Lê o CSV em blocos de tamanho fixo e grava cada bloco com um bulk write não ordenado.
+
+    A memória utilizada depende apenas de chunk_size, e não do tamanho do arquivo.
+    Retorna uma tupla (linhas lidas, inseridos, falhas) ou None se o arquivo não existir.
+    """
+    total_rows = total_inserted = total_failed = 0
+    try:
+        with open(file_path, 'rb') as f:
+            start = chunk_start = time.perf_counter()
+            last_position = 0
+            for index, chunk in enumerate(pd.read_csv(f, chunksize=chunk_size), start=1):
+                documents = dataframe_to_documents(chunk, layout)
+                inserted, failed = insert_players_chunk(collection, documents)
+
+                # O tempo do bloco inclui leitura, conversão e escrita
+                elapsed = max(time.perf_counter() - chunk_start, 1e-9)
+                position = f.tell()
+                megabytes = (position - last_position) / 1_000_000
+                last_position = position
+
+                total_rows += len(documents)
+                total_inserted += inserted
+                total_failed += failed
+                print(
+                    f"Bloco {index}: {len(documents)} linhas, {inserted} inseridas, {failed} falhas"
+                    f" - {len(documents) / elapsed:,.0f} linhas/s, {megabytes / elapsed:.2f} MB/s"
+                )
+                chunk_start = time.perf_counter()
+    except FileNotFoundError:
+        print(f"Erro: Arquivo '{file_path}' não encontrado.")
+        return None
+
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    print(
+        f"Total: {total_rows} linhas lidas, {total_inserted} inseridas, {total_failed} falhas"
+        f" em {elapsed:.2f}s ({total_rows / elapsed:,.0f} linhas/s)."
+    )
+    return total_rows, total_inserted, total_failed
+
+def pipeline_players_data(collection, file_path, workers=DEFAULT_WORKERS,
+                          chunk_size=DEFAULT_CHUNK_SIZE, queue_size=None, layout='nested'):
+    """Carrega o CSV em pipeline: a thread atual lê e converte os blocos e N workers os gravam.
+
+    A fila entre as etapas é limitada (por padrão, 2 blocos por worker), então a leitura
+    fica bloqueada quando os workers não dão conta, mantendo a memória sob controle.
+    Os workers compartilham o pool de conexões do cliente dono da coleção.
+    Retorna uma tupla (linhas lidas, inseridos, falhas) ou None se o arquivo não existir.
+    """
+    pending = queue.Queue(maxsize=queue_size or 2 * workers)
+    totals = {'inserted': 0, 'failed': 0}
+    lock = threading.Lock()
+
+    def writer():
+        while True:
+            documents = pending.get()
+            if documents is None:
+                break
+            try:
+                inserted, failed = insert_players_chunk(collection, documents)
+            except Exception as e:
+                # Um erro fora do pymongo (ex.: documento que o bson não codifica) não pode derrubar
+                # o worker: sem workers vivos, o put() da leitura ficaria bloqueado para sempre
+                print(f"Erro ao gravar bloco em {threading.current_thread().name}: {e}")
+                inserted, failed = 0, len(documents)
+            with lock:
+                totals['inserted'] += inserted
+                totals['failed'] += failed
+
+    threads = [threading.Thread(target=writer, name=f"writer-{i}", daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    total_rows = 0
+    start = time.perf_counter()
+    try:
+        for chunk in pd.read_csv(file_path, chunksize=chunk_size):
+            documents = dataframe_to_documents(chunk, layout)
+            total_rows += len(documents)
+            # put() bloqueia enquanto a fila estiver cheia (back-pressure)
+            pending.put(documents)
+    except FileNotFoundError:
+        print(f"Erro: Arquivo '{file_path}' não encontrado.")
+        return None
+    finally:
+        for _ in threads:
+            pending.put(None)
+        for thread in threads:
+            thread.join()
+
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    print(
+        f"Pipeline com {workers} workers: {total_rows} linhas lidas, {totals['inserted']} inseridas,"
+        f" {totals['failed']} falhas em {elapsed:.2f}s ({total_rows / elapsed:,.0f} linhas/s)."
+    )
+    return total_rows, totals['inserted'], totals['failed']
+
+def content_hash(document):
+    """Calcula um hash estável do conteúdo do documento (ignorando _id e o próprio hash)."""
+    payload = {key: value for key, value in document.items() if key not in ('_id', HASH_FIELD)}
+    encoded = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+def remove_duplicate_players(collection):
+    """Remove documentos repetidos de um mesmo player_id (deixados por cargas anteriores)."""
+    duplicates = collection.aggregate([
+        {"$group": {"_id": "$player_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ])
+    operations = [DeleteOne({"_id": _id}) for group in duplicates for _id in group['ids'][1:]]
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+    return len(operations)
+
+def sync_players_data(collection, file_path, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False, delete_missing=True,
+                      layout='nested'):
+    """Sincroniza a coleção com o CSV usando player_id como chave natural.
+
+    Só são gravados os jogadores novos ou cujo hash de conteúdo mudou; os ausentes do CSV
+    são removidos (se delete_missing). Com dry_run nada é gravado, apenas contado.
+    Retorna um dicionário com as contagens, os player_id alterados e os grupos afetados
+    (valores antigos e novos de país, idade e time), ou None se o arquivo não existir.
+    """
+    counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
+    changed_player_ids = []
+    affected_groups = {field: set() for field in agregados.GROUP_FIELDS}
+
+    def track_groups(document):
+        for field in agregados.GROUP_FIELDS:
+            affected_groups[field].add(document.get(field))
+
+    if not dry_run:
+        removed = remove_duplicate_players(collection)
+        if removed:
+            print(f"{removed} documentos duplicados removidos.")
+        collection.create_index('player_id', unique=True)
+
+    # Apenas player_id, hash e campos de agrupamento são lidos, então o custo não depende do tamanho dos documentos
+    stored = {
+        doc['player_id']: doc
+        for doc in collection.find({}, {'player_id': 1, HASH_FIELD: 1, '_id': 0, **{f: 1 for f in agregados.GROUP_FIELDS}})
+    }
+    seen = set()
+
+    try:
+        for chunk in pd.read_csv(file_path, chunksize=chunk_size):
+            operations = []
+            for document in dataframe_to_documents(chunk, layout):
+                player_id = document['player_id']
+                if player_id in seen:
+                    print(f"Aviso: player_id {player_id} repetido no CSV, linha ignorada.")
+                    continue
+                seen.add(player_id)
+
+                document[HASH_FIELD] = content_hash(document)
+                if player_id not in stored:
+                    counts['inserted'] += 1
+                elif stored[player_id].get(HASH_FIELD) != document[HASH_FIELD]:
+                    counts['updated'] += 1
+                    track_groups(stored[player_id])
+                else:
+                    counts['unchanged'] += 1
+                    continue
+                changed_player_ids.append(player_id)
+                track_groups(document)
+                operations.append(ReplaceOne({'player_id': player_id}, document, upsert=True))
+
+            if operations and not dry_run:
+                collection.bulk_write(operations, ordered=False)
+    except FileNotFoundError:
+        print(f"Erro: Arquivo '{file_path}' não encontrado.")
+        return None
+
+    missing = [player_id for player_id in stored if player_id not in seen]
+    if delete_missing:
+        counts['deleted'] = len(missing)
+        changed_player_ids.extend(missing)
+        for player_id in missing:
+            track_groups(stored[player_id])
+        if missing and not dry_run:
+            for i in range(0, len(missing), chunk_size):
+                collection.delete_many({'player_id': {'$in': missing[i:i + chunk_size]}})
+
+    prefix = "[dry-run] " if dry_run else ""
+    print(
+        f"{prefix}Sincronização: {counts['inserted']} inseridos, {counts['updated']} atualizados,"
+        f" {counts['unchanged']} inalterados, {counts['deleted']} removidos."
+    )
+    counts['changed_player_ids'] = changed_player_ids
+    counts['affected_groups'] = affected_groups
+    return counts
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Carrega o CSV de jogadores de CS:GO no MongoDB.")
+    parser.add_argument('--file', default='./cs_pro_players/csgo_players.csv', help="Caminho do arquivo CSV")
+    parser.add_argument('--uri', default="mongodb://localhost:27017/", help="URI de conexão do MongoDB")
+    parser.add_argument('--mode', choices=['full', 'stream', 'pipeline', 'sync', 'migrate'], default='full',
+                        help="full: lê o arquivo inteiro de uma vez; stream: lê e grava em blocos;"
+                             " pipeline: leitura e escrita em paralelo com vários workers;"
+                             " sync: grava apenas os jogadores novos ou alterados;"
+                             " migrate: converte os documentos já gravados para o formato atual")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Linhas por bloco nos modos stream, pipeline e sync")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help="Workers de escrita no modo pipeline")
+    parser.add_argument('--layout', choices=['nested', 'flat'], default='nested',
+                        help="nested: documento modelado (stats, kills_breakdown, teams como lista);"
+                             " flat: colunas do CSV no primeiro nível")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="No modo sync, apenas mostra o que seria inserido, atualizado e removido")
+    parser.add_argument('--keep-missing', action='store_true',
+                        help="No modo sync, não remove jogadores ausentes do CSV")
+    # O caminho do snapshot vem só de CSGO_SNAPSHOT_PATH, a mesma configuração lida pelo backend colunar
+    parser.add_argument('--no-snapshot', dest='snapshot', action='store_false',
+                        help=f"Não regenerar o snapshot binário ({snapshot.DEFAULT_SNAPSHOT_PATH})")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
     # Configuração do caminho do arquivo CSV e do banco de dados
-    file_path = './cs_pro_players/csgo_players.csv'  # Caminho relativo para o arquivo
+    file_path = args.file  # Caminho relativo para o arquivo
     db_name = 'csgo_db'  # Nome do banco de dados
     collection_name = 'players'  # Nome da coleção
     
     # Conectar ao MongoDB
-    client = connect_to_mongodb()
+    client = connect_to_mongodb(args.uri, max_pool_size=max(args.workers, 1) + 1)
     
     if client:
         # Definir banco de dados e coleção
         db = client[db_name]
         collection = db[collection_name]
+        # Indica se a carga alterou a coleção (o modo sync pode não encontrar mudanças)
+        changed = not args.dry_run
+        # Grupos afetados por uma carga incremental; None recalcula os resumos inteiros
+        affected_groups = None
+        # Jogadores alterados por uma carga incremental; None reconstrói o índice de similaridade
+        changed_player_ids = None
+
+        if args.mode == 'stream':
+            # Ler e inserir o CSV em blocos, mantendo a memória constante
+            stream_players_data(collection, file_path, args.chunk_size, args.layout)
+        elif args.mode == 'pipeline':
+            # Ler/converter e gravar ao mesmo tempo, com vários workers de escrita
+            pipeline_players_data(collection, file_path, args.workers, args.chunk_size, layout=args.layout)
+        elif args.mode == 'sync':
+            # Gravar apenas o que mudou desde a última carga, usando player_id como chave
+            counts = sync_players_data(collection, file_path, args.chunk_size, args.dry_run,
+                                       delete_missing=not args.keep_missing, layout=args.layout)
+            changed = changed and bool(counts) and any(
+                counts[key] for key in ('inserted', 'updated', 'deleted'))
+            if counts:
+                affected_groups = counts['affected_groups']
+                changed_player_ids = counts['changed_player_ids']
+        elif args.mode == 'migrate':
+            # Converter percentuais e campos derivados dos documentos de cargas antigas
+            migrate_existing_documents(collection)
+        else:
+            # Ler dados do arquivo CSV
+            df = read_csv_file(file_path)
+
+            if df is not None:
+                # Converter o DataFrame em uma lista de dicionários para o MongoDB
+                data = dataframe_to_documents(df, args.layout)
+
+                # Inserir os dados no MongoDB
+                insert_players_data(collection, data)
+
+        if not args.dry_run:
+            # Garantir os índices usados pelas consultas (idempotente)
+            indices.ensure_indexes(collection)
+
+        if changed:
+            # Atualizar as coleções resumidas lidas pelo dashboard
+            if affected_groups is None:
+                agregados.refresh_all(db)
+            else:
+                agregados.refresh_groups(db, affected_groups)
+
+            # Invalidar os caches de consultas que observam a versão da coleção
+            version = bump_collection_version(db)
+            print(f"Versão da coleção de jogadores: {version}")
+
+            # Regenerar o snapshot usado na partida rápida do dashboard (só o formato aninhado)
+            if args.snapshot and args.layout == 'nested':
+                snapshot.export_snapshot(db, snapshot.DEFAULT_SNAPSHOT_PATH)
+                # Índice de percentis montado a partir do snapshot novo, gravado ao lado dele
+                percentis.export_index(snapshot.DEFAULT_SNAPSHOT_PATH)
+
+            # Registrar a versão no histórico (só as colunas alteradas de cada jogador)
+            if args.layout == 'nested':
+                historico.record_version(db, version, changed_player_ids)
+
+            # Vetores de estilo: só os jogadores alterados, se o índice gravado estiver na versão anterior
+            if args.layout == 'nested':
+                similaridade.refresh_index(db, changed_player_ids)
 
-        # Ler dados do arquivo CSV
-        df = read_csv_file(file_path)
-        
-        if df is not None:
-            # Converter o DataFrame em uma lista de dicionários para o MongoDB
-            data = df.to_dict(orient='records')
-            
-            # Inserir os dados no MongoDB
-            insert_players_data(collection, data)
+            # Recalcular a amostra estratificada das consultas aproximadas, marcada com a nova versão
+            if args.layout == 'nested':
+                try:
+                    amostragem.refresh_sample(db)
+                except OperationFailure as e:
+                    # Ex.: servidor anterior ao MongoDB 5.0 ($getField); as consultas aproximadas usam $sample
+                    print(f"Erro ao recalcular a amostra: {e}")
 
         # Fechar conexão com o MongoDB
         client.close()
@@ -0,0 +1,356 @@
+import argparse
+import asyncio
+import contextvars
+import inspect
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from functools import wraps
+
+import numpy as np
+from bson import json_util
+from pymongo import monitoring
+
+# Configuração padrão (pode ser sobrescrita por variáveis de ambiente)
+SLOW_QUERY_MS = float(os.getenv("CSGO_SLOW_QUERY_MS", "200"))
+SLOW_QUERY_LOG = os.getenv("CSGO_SLOW_QUERY_LOG", "slow_queries.log")  # vazio desativa o arquivo
+# Fração das chamadas não cacheadas que são repetidas com explain para obter tempo de servidor e documentos examinados
+EXPLAIN_SAMPLE_RATE = float(os.getenv("CSGO_EXPLAIN_SAMPLE_RATE", "0.1"))
+# Quantidade de chamadas recentes mantidas por função para os histogramas
+WINDOW_SIZE = int(os.getenv("CSGO_INSTRUMENTATION_WINDOW", "1000"))
+
+# Limites (em ms) das faixas dos histogramas de latência
+HISTOGRAM_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+EXPLAINABLE_COMMANDS = {'find', 'aggregate', 'count', 'distinct'}
+# Campos de sessão e protocolo que não podem ser repassados ao explain
+_PROTOCOL_FIELDS = {
+    'lsid', 'txnNumber', 'autocommit', 'startTransaction', 'readConcern', 'writeConcern',
+    'apiVersion', 'apiStrict', 'apiDeprecationErrors',
+}
+
+# Chamada instrumentada em andamento no contexto atual (tarefa assíncrona)
+_current_call = contextvars.ContextVar('current_query_call', default=None)
+
+
+class _CallRecord:
+    """Comandos e métricas de uma chamada a uma função de consulta.
+
+    Os comandos ficam só com a chamada mais interna: uma consulta que chama outra instrumentada não
+    os recebe de novo, e cada comando é contado (e repetido com explain) uma única vez.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.commands = []
+        self.command_ms = 0.0
+        self.docs_returned = 0
+        self.failed_commands = 0
+        self.cache_hit = False
+
+
+def _result_size(result):
+    if isinstance(result, (list, dict, tuple)):
+        return len(result)
+    return 0 if result is None else 1
+
+
+def _batch_size(reply):
+    cursor = reply.get('cursor') if isinstance(reply, dict) else None
+    if not cursor:
+        return 0
+    return len(cursor.get('firstBatch', cursor.get('nextBatch', [])))
+
+
+def _explain_totals(explain):
+    """Soma documentos e chaves examinados em todos os executionStats de um explain."""
+    totals = {'server_ms': 0, 'docs_examined': 0, 'keys_examined': 0}
+
+    def visit(node):
+        if isinstance(node, dict):
+            stats = node.get('executionStats')
+            if isinstance(stats, dict):
+                totals['server_ms'] = max(totals['server_ms'], stats.get('executionTimeMillis', 0))
+                totals['docs_examined'] += stats.get('totalDocsExamined', 0)
+                totals['keys_examined'] += stats.get('totalKeysExamined', 0)
+            for key, value in node.items():
+                if key != 'executionStats':
+                    visit(value)
+        elif isinstance(node, list):
+            for item in node:
+                visit(item)
+
+    visit(explain)
+    # Em pipelines o tempo total fica fora dos executionStats de cada estágio
+    if isinstance(explain, dict) and 'executionTimeMillis' in explain:
+        totals['server_ms'] = max(totals['server_ms'], explain['executionTimeMillis'])
+    return totals
+
+
+class QueryMonitor(monitoring.CommandListener):
+    """Registra latência, comandos enviados e documentos examinados de cada chamada às consultas.
+
+    Os comandos são capturados pelo monitoramento de comandos do pymongo e atribuídos à chamada
+    instrumentada em andamento; client_source retorna o cliente usado para os explains amostrados.
+    """
+
+    def __init__(self, client_source=None, slow_query_ms=SLOW_QUERY_MS, slow_query_log=SLOW_QUERY_LOG,
+                 explain_sample_rate=EXPLAIN_SAMPLE_RATE, window_size=WINDOW_SIZE):
+        self.client_source = client_source
+        self.slow_query_ms = slow_query_ms
+        self.slow_query_log = slow_query_log
+        self.explain_sample_rate = explain_sample_rate
+        self.window_size = window_size
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=self.window_size))
+        self._counters = defaultdict(lambda: {'calls': 0, 'cache_hits': 0, 'errors': 0})
+        self.slow_queries = deque(maxlen=100)
+        # Explains em andamento (tarefas no loop do motor), fora do caminho das chamadas
+        self._pending_explains = set()
+
+    # ---- monitoramento de comandos do pymongo ----
+
+    def started(self, event):
+        record = _current_call.get()
+        if record is not None and event.command_name in EXPLAINABLE_COMMANDS:
+            command = {key: value for key, value in event.command.items()
+                       if not key.startswith('$') and key not in _PROTOCOL_FIELDS}
+            record.commands.append((event.database_name, command))
+
+    def succeeded(self, event):
+        record = _current_call.get()
+        if record is not None:
+            record.command_ms += event.duration_micros / 1000
+            record.docs_returned += _batch_size(event.reply)
+
+    def failed(self, event):
+        record = _current_call.get()
+        if record is not None:
+            record.command_ms += event.duration_micros / 1000
+            record.failed_commands += 1
+
+    def cache_hit(self):
+        """Marca a chamada em andamento como atendida pelo cache (on_hit do QueryCache)."""
+        record = _current_call.get()
+        if record is not None:
+            record.cache_hit = True
+
+    # ---- chamadas às funções de consulta ----
+
+    def _should_explain(self, wall_ms, record):
+        return bool(record.commands) and self.client_source is not None and (
+            wall_ms >= self.slow_query_ms or random.random() < self.explain_sample_rate)
+
+    async def _explain(self, commands):
+        """Repete os comandos da chamada com explain (cliente assíncrono) e soma as estatísticas de execução."""
+        totals = {'server_ms': 0, 'docs_examined': 0, 'keys_examined': 0}
+        client = self.client_source()
+        for database, command in commands:
+            explain = await client[database].command({'explain': command, 'verbosity': 'executionStats'})
+            for key, value in _explain_totals(explain).items():
+                totals[key] += value
+        return totals
+
+    def _record(self, name, args, kwargs, wall_ms, record, result, error, explain_pending=False):
+        """Guarda a amostra da chamada; com explain_pending, o log de lenta espera o explain (_explain_done)."""
+        sample = {
+            'timestamp': time.time(),
+            'wall_ms': wall_ms,
+            'command_ms': record.command_ms,
+            'commands': len(record.commands),
+            'docs_returned': record.docs_returned,
+            'result_size': _result_size(result),
+            'server_ms': None,
+            'docs_examined': None,
+            'keys_examined': None,
+        }
+        slow = wall_ms >= self.slow_query_ms and record.commands
+
+        with self._lock:
+            counters = self._counters[name]
+            counters['calls'] += 1
+            counters['cache_hits'] += record.cache_hit
+            counters['errors'] += error is not None or record.failed_commands > 0
+            self._samples[name].append(sample)
+
+        if slow and not explain_pending:
+            self._log_slow_query(name, args, kwargs, sample, record)
+        return sample
+
+    def _explain_done(self, name, args, kwargs, sample, record, explained):
+        """Completa a amostra com o resultado do explain e grava o log se a chamada foi lenta."""
+        if explained:
+            with self._lock:
+                sample.update(explained)
+        if sample['wall_ms'] >= self.slow_query_ms and record.commands:
+            self._log_slow_query(name, args, kwargs, sample, record)
+
+    def _explain_later(self, name, args, kwargs, sample, record):
+        """Agenda o explain da chamada como tarefa separada no loop atual, sem atrasar quem chamou.
+
+        A tarefa roda em um contexto vazio, para que os comandos do explain não sejam atribuídos à
+        chamada instrumentada em andamento.
+        """
+        async def explain():
+            explained = None
+            try:
+                explained = await self._explain(record.commands)
+            except Exception as e:
+                print(f"Erro ao obter o explain de {name}: {e}")
+            self._explain_done(name, args, kwargs, sample, record, explained)
+
+        task = asyncio.get_running_loop().create_task(explain(), context=contextvars.Context())
+        with self._lock:
+            self._pending_explains.add(task)
+        task.add_done_callback(self._discard_explain)
+
+    def _discard_explain(self, pending):
+        with self._lock:
+            self._pending_explains.discard(pending)
+
+    def wait_explains(self, timeout=None):
+        """Espera os explains em andamento (ex.: antes de exportar as estatísticas ou fechar o cliente).
+
+        Não pode ser chamado de dentro do loop do motor de consultas.
+        """
+        with self._lock:
+            pending = list(self._pending_explains)
+        for task in pending:
+            asyncio.run_coroutine_threadsafe(asyncio.wait([task]), task.get_loop()).result(timeout)
+
+    def _log_slow_query(self, name, args, kwargs, sample, record):
+        entry = {
+            'time': datetime.now(timezone.utc).isoformat(),
+            'function': name,
+            'args': repr(args),
+            'kwargs': repr(kwargs),
+            **{key: value for key, value in sample.items() if key != 'timestamp'},
+            'mongo_commands': [command for _, command in record.commands],
+        }
+        line = json_util.dumps(entry)
+        self.slow_queries.append(json.loads(line))
+        if self.slow_query_log:
+            try:
+                with self._lock, open(self.slow_query_log, 'a') as f:
+                    f.write(line + '\n')
+            except OSError as e:
+                print(f"Erro ao gravar o log de consultas lentas: {e}")
+
+    def _finish_call(self, record, token, start):
+        wall_ms = (time.perf_counter() - start) * 1000
+        _current_call.reset(token)
+        return wall_ms
+
+    def instrumented(self, func):
+        """Decorador: mede cada chamada da função assíncrona e os comandos que ela envia ao MongoDB.
+
+        As consultas rodam todas no cliente assíncrono (queries_async.py), que é também o usado nos explains.
+        """
+        if not inspect.iscoroutinefunction(func):
+            raise TypeError(f"instrumented só aceita funções assíncronas: {func.__name__}")
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            record = _CallRecord(func.__name__)
+            token = _current_call.set(record)
+            start = time.perf_counter()
+            result = error = None
+            try:
+                result = await func(*args, **kwargs)
+                return result
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                wall_ms = self._finish_call(record, token, start)
+                explain = self._should_explain(wall_ms, record)
+                sample = self._record(func.__name__, args, kwargs, wall_ms, record, result, error, explain)
+                if explain:
+                    self._explain_later(func.__name__, args, kwargs, sample, record)
+        return wrapper
+
+    # ---- leitura das estatísticas ----
+
+    def stats(self):
+        """Retorna, por função, contadores, percentis de latência e o histograma da janela recente."""
+        with self._lock:
+            # Cópia das amostras: os explains em andamento ainda podem completá-las
+            snapshot = {name: (dict(self._counters[name]), [dict(sample) for sample in samples])
+                        for name, samples in self._samples.items()}
+
+        report = {}
+        for name, (counters, samples) in sorted(snapshot.items()):
+            wall = np.array([sample['wall_ms'] for sample in samples])
+            explained = [sample for sample in samples if sample['server_ms'] is not None]
+            p50, p95, p99 = np.percentile(wall, [50, 95, 99])
+            counts = np.histogram(wall, bins=[0] + HISTOGRAM_BUCKETS_MS + [np.inf])[0]
+
+            def mean(field, rows=samples):
+                return round(float(np.mean([row[field] for row in rows])), 3) if rows else None
+
+            report[name] = {
+                **counters,
+                'window': len(samples),
+                'wall_p50_ms': round(float(p50), 3),
+                'wall_p95_ms': round(float(p95), 3),
+                'wall_p99_ms': round(float(p99), 3),
+                'wall_max_ms': round(float(wall.max()), 3),
+                'command_ms_avg': mean('command_ms'),
+                'server_ms_avg': mean('server_ms', explained),
+                'docs_examined_avg': mean('docs_examined', explained),
+                'keys_examined_avg': mean('keys_examined', explained),
+                'docs_returned_avg': mean('docs_returned'),
+                'result_size_avg': mean('result_size'),
+                'explained_calls': len(explained),
+                'histogram': {
+                    (f'<={upper}ms' if upper != np.inf else f'>{HISTOGRAM_BUCKETS_MS[-1]}ms'): int(count)
+                    for upper, count in zip(HISTOGRAM_BUCKETS_MS + [np.inf], counts)
+                },
+            }
+        return report
+
+    def dump_json(self, path=None):
+        """Retorna as estatísticas e as consultas lentas recentes em JSON, gravando em path se informado."""
+        data = json.dumps({
+            'generated_at': datetime.now(timezone.utc).isoformat(),
+            'slow_query_ms': self.slow_query_ms,
+            'functions': self.stats(),
+            'slow_queries': list(self.slow_queries),
+        }, indent=2)
+        if path:
+            with open(path, 'w') as f:
+                f.write(data)
+        return data
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._counters.clear()
+            self.slow_queries.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Executa as consultas de exemplo e grava as estatísticas de instrumentação.")
+    parser.add_argument('--output', default='instrumentacao.json', help="Arquivo JSON de saída")
+    parser.add_argument('--explain-sample-rate', type=float, default=1.0,
+                        help="Fração das chamadas repetidas com explain (padrão: todas)")
+    args = parser.parse_args()
+
+    import queries
+    import relatorio
+    queries.query_monitor.explain_sample_rate = args.explain_sample_rate
+    try:
+        relatorio.run_report()
+        # Os explains rodam em paralelo às consultas; espera os últimos antes de exportar
+        queries.query_monitor.wait_explains()
+    finally:
+        queries.close_client()
+    queries.query_monitor.dump_json(args.output)
+    print(f"Estatísticas gravadas em '{args.output}'.")
+
+
+if __name__ == "__main__":
+    main()
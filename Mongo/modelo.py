@@ -0,0 +1,148 @@
+# Mapeamento declarativo entre as colunas do CSV e o documento modelado em
+# modelagem_banco/modelagem.txt. O carregador e as consultas usam este módulo
+# para que os dois lados enxerguem sempre os mesmos caminhos.
+
+IDENTITY_FIELDS = ['player_id', 'nickname', 'real_name', 'age', 'country', 'current_team', 'teams']
+
+STATS_FIELDS = [
+    'total_kills', 'total_deaths', 'headshot_percentage', 'damage_per_round', 'grenade_dmg_per_round',
+    'maps_played', 'rounds_played', 'kills_per_death', 'kills_per_round', 'assists_per_round',
+    'deaths_per_round', 'saved_by_teammate_per_round', 'saved_teammates_per_round', 'rounds_with_kills',
+    'kill_to_death_diff', 'total_opening_kills', 'total_opening_deaths', 'opening_kill_ratio',
+    'opening_kill_rating', 'team_win_percent_after_first_kill', 'first_kill_in_won_rounds',
+    'kills_assists_per_round'
+]
+
+ROUNDS_BY_KILLS_FIELDS = [f'{kills}_kill_rounds' for kills in range(6)]
+
+WEAPON_FIELDS = ['rifle_kills', 'sniper_kills', 'smg_kills', 'pistol_kills', 'grenade_kills', 'other_kills']
+
+# Coluna do CSV -> caminho (notação de ponto) no documento do MongoDB
+FIELD_MAPPING = {
+    **{field: field for field in IDENTITY_FIELDS},
+    **{field: f'stats.{field}' for field in STATS_FIELDS},
+    **{field: f'stats.rounds_by_kills.{field}' for field in ROUNDS_BY_KILLS_FIELDS},
+    **{field: f'kills_breakdown.{field}' for field in WEAPON_FIELDS},
+    'rating': 'rating',
+}
+
+
+def split_teams(value):
+    """Converte "Vitality, aAa" em ["Vitality", "aAa"], para que um índice multikey atenda às buscas."""
+    if isinstance(value, list):
+        return value
+    if not isinstance(value, str):
+        return []
+    return [team.strip() for team in value.split(',') if team.strip()]
+
+
+# Conversões aplicadas a colunas específicas ao montar o documento
+FIELD_CONVERTERS = {
+    'teams': split_teams,
+}
+
+
+def field_path(column):
+    """Retorna o caminho de uma coluna do CSV no documento modelado."""
+    return FIELD_MAPPING.get(column, column)
+
+
+def to_document(record):
+    """Monta o documento aninhado a partir de uma linha plana do CSV."""
+    document = {}
+    for column, value in record.items():
+        if column in FIELD_CONVERTERS:
+            value = FIELD_CONVERTERS[column](value)
+        target = document
+        *parents, leaf = field_path(column).split('.')
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[leaf] = value
+    return document
+
+
+def get_path(document, path, default=None):
+    """Lê um valor de um documento aninhado usando a notação de ponto."""
+    value = document
+    for key in path.split('.'):
+        if not isinstance(value, dict) or key not in value:
+            return default
+        value = value[key]
+    return value
+
+
+def rounds_with_kills_above(rounds_by_kills, kill_threshold):
+    """Soma, no histograma rounds_by_kills (rounds com 0 a 5 kills), os rounds com mais de kill_threshold kills.
+
+    Retorna (rounds acima do limiar, total de rounds do histograma).
+    """
+    above = total = 0
+    for kills, field in enumerate(ROUNDS_BY_KILLS_FIELDS):
+        count = rounds_by_kills.get(field) or 0
+        total += count
+        if kills > kill_threshold:
+            above += count
+    return above, total
+
+
+def player_summary(document, kill_threshold):
+    """Resumo de um jogador usado por player_stats, a partir dos campos de PLAYER_STATS_FIELDS."""
+    stats = document.get('stats', {})
+    above, total = rounds_with_kills_above(stats.get('rounds_by_kills', {}), kill_threshold)
+    return {
+        'player_id': document['player_id'],
+        'missing': False,
+        'nickname': document.get('nickname'),
+        'current_team': document.get('current_team'),
+        'rating': document.get('rating'),
+        'maps_played': stats.get('maps_played'),
+        'rounds_played': stats.get('rounds_played'),
+        'kills_per_round': stats.get('kills_per_round'),
+        'kill_threshold': kill_threshold,
+        'rounds_above_threshold': above,
+        'percentage_rounds_above': above / total * 100 if total else None,
+    }
+
+
+# Caminhos lidos por player_summary; o restante do documento não precisa ser transferido
+PLAYER_STATS_FIELDS = [
+    'player_id', 'nickname', 'current_team', 'rating', 'stats.maps_played', 'stats.rounds_played',
+    'stats.kills_per_round', 'stats.rounds_by_kills',
+]
+
+
+def to_flat(document):
+    """Operação inversa de to_document: devolve o documento com as colunas do CSV no primeiro nível."""
+    flat = {key: value for key, value in document.items() if key not in ('stats', 'kills_breakdown')}
+    for column, path in FIELD_MAPPING.items():
+        if '.' in path:
+            value = get_path(document, path)
+            if value is not None:
+                flat[column] = value
+    return flat
+
+
+def migration_pipeline():
+    """Pipeline de update que converte um documento plano (cargas antigas) no formato modelado."""
+    nested = {}
+    for column, path in FIELD_MAPPING.items():
+        if '.' in path:
+            nested[path] = f'${column}'
+    # Mesmo resultado de split_teams: nomes sem espaços nas pontas e sem entradas vazias; listas ficam
+    # como estão e qualquer outro valor (ausente, null, NaN do pandas) vira lista vazia
+    teams = {"$switch": {
+        "branches": [
+            {"case": {"$eq": [{"$type": "$teams"}, "string"]},
+             "then": {"$filter": {
+                 "input": {"$map": {"input": {"$split": ["$teams", ","]}, "in": {"$trim": {"input": "$$this"}}}},
+                 "cond": {"$ne": ["$$this", ""]}
+             }}},
+            {"case": {"$eq": [{"$type": "$teams"}, "array"]}, "then": "$teams"},
+        ],
+        "default": []
+    }}
+    flat_columns = [column for column, path in FIELD_MAPPING.items() if '.' in path]
+    return [
+        {"$set": {**nested, "teams": teams}},
+        {"$unset": flat_columns}
+    ]
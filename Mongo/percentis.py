@@ -0,0 +1,240 @@
+import argparse
+import asyncio
+import bisect
+import json
+import os
+import time
+
+import numpy as np
+
+import queries_async
+import snapshot
+from backend_colunar import NUMERIC_COLUMNS, _python
+
+# Colunas indexadas: todas as colunas numéricas do modelo, exceto player_id
+RANKED_FIELDS = [column for column in NUMERIC_COLUMNS if column != 'player_id']
+INDEX_FILE = 'percentiles.npy'
+
+
+def index_path_for(snapshot_path):
+    """Caminho do índice montado a partir de um snapshot: ao lado dele, salvo CSGO_PERCENTILE_INDEX_PATH."""
+    return os.getenv("CSGO_PERCENTILE_INDEX_PATH") or os.path.join(os.path.dirname(snapshot_path), INDEX_FILE)
+
+
+# O índice do snapshot padrão, regenerado junto com ele por insercao_banco.py
+DEFAULT_INDEX_PATH = index_path_for(snapshot.DEFAULT_SNAPSHOT_PATH)
+
+# ======================
+# Índice de percentis
+# ======================
+# Para cada coluna, as linhas da tabela colunar ordenadas pelo valor (ausentes de fora). A posição de um
+# valor nessa ordem, achada por busca binária, dá o rank e o percentil sem ordenar nem contar a coleção
+# a cada pergunta. O índice é uma matriz int32 (colunas x jogadores) gravada em .npy e mapeada em memória.
+
+
+class PercentileIndex:
+    """Rank e percentil de cada jogador em cada coluna numérica, em O(log n) por pergunta.
+
+    orders[i] traz as linhas de store em ordem crescente de RANKED_FIELDS[i]; apenas as primeiras
+    counts[i] têm valor (as linhas sem valor ficam no fim e não entram no rank).
+    """
+
+    def __init__(self, store, orders, counts, data_version=None):
+        self.store = store
+        self.orders = orders
+        self.counts = counts
+        self.data_version = data_version
+        self._field_index = {field: i for i, field in enumerate(RANKED_FIELDS)}
+
+    @classmethod
+    def build(cls, store, data_version=None):
+        """Ordena cada coluna da tabela colunar (um argsort por coluna)."""
+        orders = np.empty((len(RANKED_FIELDS), store.size), dtype=np.int32)
+        counts = np.empty(len(RANKED_FIELDS), dtype=np.int64)
+        for i, field in enumerate(RANKED_FIELDS):
+            values = store.columns[field]
+            # O argsort do NumPy deixa os NaN no fim
+            orders[i] = np.argsort(values, kind='stable')
+            counts[i] = store.size if values.dtype.kind == 'i' else int(np.count_nonzero(~np.isnan(values)))
+        return cls(store, orders, counts, data_version)
+
+    def save(self, path=DEFAULT_INDEX_PATH):
+        """Grava a matriz de ordens (.npy) e um cabeçalho JSON ao lado, de forma atômica."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temporary = f"{path}.tmp.npy"
+        np.save(temporary, self.orders)
+        os.replace(temporary, path)
+        header = {'data_version': self.data_version, 'rows': self.store.size, 'fields': RANKED_FIELDS,
+                  'counts': self.counts.tolist()}
+        with open(f"{temporary}.json", 'w', encoding='utf-8') as f:
+            json.dump(header, f)
+        os.replace(f"{temporary}.json", f"{path}.json")
+        return path
+
+    @classmethod
+    def load(cls, store, path=DEFAULT_INDEX_PATH):
+        """Mapeia o índice gravado; retorna None se ele não corresponder à tabela (versão, linhas ou colunas)."""
+        try:
+            with open(f"{path}.json", encoding='utf-8') as f:
+                header = json.load(f)
+            orders = np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        store_version = getattr(store, 'snapshot_header', {}).get('data_version')
+        if (header['rows'] != store.size or header['fields'] != RANKED_FIELDS or orders.shape[1] != store.size
+                or store_version is None or header['data_version'] != store_version):
+            return None
+        return cls(store, orders, np.array(header['counts']), header['data_version'])
+
+    def _field(self, field):
+        if field not in self._field_index:
+            raise ValueError(f"Campo sem índice de percentis: {field}")
+        i = self._field_index[field]
+        return self.orders[i], int(self.counts[i]), self.store.columns[field]
+
+    def _entry(self, row, field, value, position, count):
+        return {
+            'player_id': _python(self.store.columns['player_id'][row]),
+            'nickname': self.store.nicknames[row],
+            'field': field,
+            'value': _python(value),
+            # Rank 1 é o maior valor; jogadores empatados dividem o mesmo rank
+            'rank': count - position + 1,
+            'percentile': position / count * 100,
+            'players': count,
+        }
+
+    def rank(self, player_id, field):
+        """Rank e percentil do jogador na coluna; None se o jogador não existe, rank None se não tem o valor."""
+        row = self.store._row_of_player(player_id)
+        if row is None:
+            return None
+        order, count, values = self._field(field)
+        value = values[row]
+        if isinstance(value, (float, np.floating)) and np.isnan(value):
+            return {'player_id': player_id, 'nickname': self.store.nicknames[row], 'field': field,
+                    'value': None, 'rank': None, 'percentile': None, 'players': count}
+        # Quantos jogadores têm valor menor ou igual (busca binária na ordem da coluna)
+        position = bisect.bisect_right(order, value, 0, count, key=values.__getitem__)
+        return self._entry(row, field, value, position, count)
+
+    def profile(self, player_id, fields=RANKED_FIELDS):
+        """Rank e percentil do jogador em várias colunas de uma vez (None se o jogador não existe)."""
+        if self.store._row_of_player(player_id) is None:
+            return None
+        return {field: self.rank(player_id, field) for field in fields}
+
+    def between(self, field, low, high, limit=None):
+        """Jogadores entre os percentis low e high da coluna (0-100), do maior valor para o menor."""
+        order, count, values = self._field(field)
+        if not count:
+            return []
+        # Percentil de uma posição, como em _entry; low_position e high_position são a menor e a maior
+        # quantidade de jogadores "com valor menor ou igual" cujo percentil fica dentro de [low, high]
+        positions = range(count + 1)
+        low_position = bisect.bisect_left(positions, low, key=lambda position: position / count * 100)
+        high_position = bisect.bisect_right(positions, high, key=lambda position: position / count * 100) - 1
+        if low_position > high_position:
+            return []
+        # Empatados têm o mesmo percentil: os limites do trecho caem nas fronteiras entre valores,
+        # achadas pelo valor do jogador naquela posição da ordem
+        key = values.__getitem__
+        start = 0 if low_position == 0 else bisect.bisect_left(order, key(order[low_position - 1]), 0, count, key=key)
+        end = count if high_position >= count else bisect.bisect_left(order, key(order[high_position]), 0, count,
+                                                                       key=key)
+        rows = order[start:end][::-1]
+        if limit is not None:
+            rows = rows[:limit]
+        results = []
+        for row in rows:
+            value = values[row]
+            position = bisect.bisect_right(order, value, 0, count, key=values.__getitem__)
+            results.append(self._entry(row, field, value, position, count))
+        return results
+
+
+def export_index(snapshot_path=snapshot.DEFAULT_SNAPSHOT_PATH, path=None):
+    """Monta o índice a partir do snapshot recém-gravado e o grava ao lado dele (ou em path)."""
+    path = path or index_path_for(snapshot_path)
+    store = snapshot.load_snapshot(snapshot_path)
+    start = time.perf_counter()
+    index = PercentileIndex.build(store, store.snapshot_header['data_version'])
+    index.save(path)
+    print(f"Índice de percentis ({len(RANKED_FIELDS)} colunas, {store.size:,} jogadores) gravado em '{path}'"
+          f" em {time.perf_counter() - start:.2f} s.")
+    return path
+
+
+# Índice em uso pelo processo, trocado quando a tabela colunar é recarregada
+_index = {'index': None, 'lock': None}
+
+
+async def get_percentile_index():
+    """Retorna o índice da tabela colunar atual: o gravado, se corresponder a ela, ou um montado na hora."""
+    store = await queries_async.get_columnar_store()
+    if _index['lock'] is None:
+        _index['lock'] = asyncio.Lock()
+    async with _index['lock']:
+        if _index['index'] is None or _index['index'].store is not store:
+            index = PercentileIndex.load(store)
+            if index is None:
+                # Os argsorts usam CPU; fora do loop, para não travar as outras consultas
+                index = await asyncio.to_thread(PercentileIndex.build, store)
+            _index['index'] = index
+    return _index['index']
+
+
+@queries_async.query_monitor.instrumented
+async def percentile_rank(player_id, field):
+    return (await get_percentile_index()).rank(player_id, field)
+
+
+@queries_async.query_monitor.instrumented
+async def player_percentiles(player_id, fields=None):
+    return (await get_percentile_index()).profile(player_id, fields or RANKED_FIELDS)
+
+
+@queries_async.query_monitor.instrumented
+async def players_between_percentiles(field, low, high, limit=50):
+    return (await get_percentile_index()).between(field, low, high, limit)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera o índice de percentis e responde consultas de rank.")
+    parser.add_argument('--snapshot', default=snapshot.DEFAULT_SNAPSHOT_PATH)
+    parser.add_argument('--path', help="Arquivo do índice (padrão: percentiles.npy ao lado do snapshot)")
+    parser.add_argument('--build', action='store_true', help="Gera o índice a partir do snapshot")
+    parser.add_argument('--player', type=int, help="Mostra rank e percentil do jogador em todas as colunas")
+    parser.add_argument('--field', default='rating')
+    parser.add_argument('--between', nargs=2, type=float, metavar=('LOW', 'HIGH'),
+                        help="Lista os jogadores entre dois percentis de --field")
+    args = parser.parse_args()
+    args.path = args.path or index_path_for(args.snapshot)
+
+    if args.build:
+        try:
+            export_index(args.snapshot, args.path)
+        except (OSError, ValueError) as e:
+            print(f"Erro: {e}")
+            return
+
+    if args.player is None and args.between is None:
+        return
+    store = snapshot.load_snapshot(args.snapshot)
+    index = PercentileIndex.load(store, args.path) or PercentileIndex.build(store)
+    if args.player is not None:
+        profile = index.profile(args.player)
+        if profile is None:
+            print(f"Jogador {args.player} não encontrado.")
+        for field, entry in (profile or {}).items():
+            if entry['rank'] is not None:
+                print(f"{field:35s} {entry['value']!s:>10s}  rank {entry['rank']:>6,}/{entry['players']:,}"
+                      f"  percentil {entry['percentile']:6.2f}")
+    if args.between is not None:
+        for entry in index.between(args.field, *args.between, limit=50):
+            print(f"{entry['rank']:>6,}. {entry['nickname']} - {args.field}: {entry['value']}"
+                  f" (percentil {entry['percentile']:.2f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+import asyncio
+import os
+import threading
+import time
+from functools import wraps
+
+from pymongo import AsyncMongoClient
+
+import modelo
+import registro_consultas
+import snapshot
+from backend_colunar import ColumnarPlayers
+from cache_consultas import VERSION_CHECK_INTERVAL, QueryCache, read_collection_version_async
+from instrumentacao import QueryMonitor
+from registro_consultas import LEADERBOARD_FIELDS, WEAPON_CATEGORIES
+
+# Configuração da conexão (pode ser sobrescrita por variáveis de ambiente)
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+DB_NAME = os.getenv("MONGO_DB", "csgo_db")
+MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+# Backend das consultas: 'mongo' (padrão) ou 'columnar' (jogadores carregados em memória, ver backend_colunar.py)
+QUERY_BACKEND = os.getenv("CSGO_QUERY_BACKEND", "mongo")
+
+_client = None
+_loop = None
+_lock = threading.Lock()
+# Tabela colunar em memória e a versão dos dados em que foi carregada
+_columnar = {'store': None, 'version': None, 'checked_at': float('-inf'), 'lock': None}
+
+
+def get_loop():
+    """Retorna o loop de eventos do motor de consultas, que roda em uma thread própria.
+
+    O cliente assíncrono fica preso ao loop em que é usado pela primeira vez, então todas as
+    consultas, de scripts ou do dashboard, são executadas neste mesmo loop.
+    """
+    global _loop
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='queries-async', daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def run(coroutine):
+    """Executa a corrotina no loop do motor e espera o resultado (ponte para código síncrono)."""
+    loop = get_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coroutine.close()
+        raise RuntimeError("run() não pode ser chamado de dentro do loop do motor; use await.")
+    return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+
+def submit(coroutine):
+    """Agenda a corrotina no loop do motor sem esperar; retorna um concurrent.futures.Future."""
+    return asyncio.run_coroutine_threadsafe(coroutine, get_loop())
+
+
+def run_concurrently(calls):
+    """Dispara várias consultas ao mesmo tempo e espera todas; o tempo total é o da mais lenta.
+
+    calls é um dicionário nome -> corrotina. Retorna nome -> resultado; uma consulta que falhar
+    devolve a exceção no lugar do resultado, sem interromper as demais.
+    """
+    async def gather():
+        results = await asyncio.gather(*calls.values(), return_exceptions=True)
+        return dict(zip(calls, results))
+    return run(gather())
+
+
+def get_client():
+    """Retorna o cliente assíncrono compartilhado do MongoDB, criado apenas na primeira chamada."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = AsyncMongoClient(MONGO_URI, maxPoolSize=MAX_POOL_SIZE, event_listeners=[query_monitor])
+    return _client
+
+
+def get_players_collection():
+    """Retorna a coleção de jogadores usando o cliente compartilhado."""
+    return get_client()[DB_NAME]['players']
+
+
+def get_summary_collection(name):
+    """Retorna uma das coleções resumidas mantidas por agregados.py."""
+    return get_client()[DB_NAME][name]
+
+
+async def run_plan(name, *args, **kwargs):
+    """Executa a consulta registrada em registro_consultas.py e retorna a lista de documentos."""
+    plan = registro_consultas.get_plan(name)
+    spec = plan.build(*args, **kwargs)
+    collection = get_client()[DB_NAME][plan.collection]
+    if plan.operation == 'aggregate':
+        cursor = await collection.aggregate(spec['pipeline'])
+    else:
+        cursor = collection.find(spec['filter'], spec.get('projection'))
+        if spec.get('sort'):
+            cursor = cursor.sort(spec['sort'])
+        if spec.get('limit'):
+            cursor = cursor.limit(spec['limit'])
+    return await cursor.to_list()
+
+
+# Latência, comandos e documentos examinados de cada chamada (ver instrumentacao.py)
+query_monitor = QueryMonitor(client_source=get_client)
+# Cache compartilhado pelas consultas; invalidado quando insercao_banco.py grava novos dados. Cada valor
+# servido conta como acerto da chamada instrumentada em andamento
+query_cache = QueryCache(version_source=lambda: read_collection_version_async(get_client()[DB_NAME]),
+                         on_hit=query_monitor.cache_hit)
+
+
+async def _load_columnar_store(version):
+    """Mapeia o snapshot do carregador se ele estiver na versão atual; senão lê a coleção inteira."""
+    path = snapshot.DEFAULT_SNAPSHOT_PATH
+    try:
+        if snapshot.read_header(path)['data_version'] == version:
+            return snapshot.load_snapshot(path)
+    except (OSError, ValueError):
+        pass
+    documents = await get_players_collection().find({}).to_list()
+    # A conversão para arrays usa CPU; fora do loop, para não travar as outras consultas
+    return await asyncio.to_thread(ColumnarPlayers.from_documents, documents)
+
+
+async def get_columnar_store():
+    """Retorna a tabela colunar, recarregada quando insercao_banco.py grava uma nova versão dos dados."""
+    if _columnar['lock'] is None:
+        _columnar['lock'] = asyncio.Lock()
+    async with _columnar['lock']:
+        now = time.monotonic()
+        if _columnar['store'] is None or now - _columnar['checked_at'] >= VERSION_CHECK_INTERVAL:
+            version = await read_collection_version_async(get_client()[DB_NAME])
+            if _columnar['store'] is None or version != _columnar['version']:
+                _columnar['store'] = await _load_columnar_store(version)
+                _columnar['version'] = version
+            _columnar['checked_at'] = now
+    return _columnar['store']
+
+
+def cached_query(func):
+    """Decorador das consultas: escolhe o backend e aplica o cache (só no MongoDB) e a instrumentação.
+
+    A instrumentação fica por fora do cache, para medir também os acertos. Com as_of=versão, a consulta
+    roda no backend colunar sobre o estado reconstruído dessa versão (ver historico.py).
+    """
+    mongo_query = query_cache.cached(func)
+
+    @wraps(func)
+    async def dispatch(*args, as_of=None, **kwargs):
+        if as_of is not None:
+            # Import local: historico.py usa o cliente e a instrumentação deste módulo
+            import historico
+            store = await historico.get_store_as_of(as_of)
+            return getattr(store, func.__name__)(*args, **kwargs)
+        if QUERY_BACKEND == 'columnar':
+            store = await get_columnar_store()
+            return getattr(store, func.__name__)(*args, **kwargs)
+        return await mongo_query(*args, **kwargs)
+    return query_monitor.instrumented(dispatch)
+
+
+def close_client():
+    """Fecha o cliente compartilhado; a próxima consulta cria um novo."""
+    global _client
+    with _lock:
+        client, _client = _client, None
+    if client is not None:
+        run(client.close())
+
+# ======================
+# Paginação por chave
+# ======================
+# As consultas que podem devolver muitos jogadores têm uma versão paginada: cada página continua a partir
+# dos valores de ordenação do último documento da página anterior (sem skip, que relê tudo o que pula),
+# e uma versão em streaming, que entrega os documentos conforme o cursor avança.
+
+DEFAULT_PAGE_SIZE = int(os.getenv("CSGO_PAGE_SIZE", "500"))
+
+
+def _after_clause(sort, after):
+    """Filtro "depois de after" para uma ordenação ascendente em vários campos (o último deve ser _id)."""
+    branches = []
+    for i, (path, _) in enumerate(sort):
+        branch = {previous: value for (previous, _), value in zip(sort[:i], after[:i])}
+        branch[path] = {"$gt": after[i]}
+        branches.append(branch)
+    return {"$or": branches}
+
+
+async def keyset_page(query, sort, page_size=DEFAULT_PAGE_SIZE, after=None, projection=None):
+    """Retorna uma página da consulta e a chave para pedir a seguinte.
+
+    after é o next_after da página anterior (None na primeira). Com projection, os campos de
+    ordenação são sempre incluídos, pois formam a chave da próxima página.
+    """
+    if after is not None:
+        query = {"$and": [query, _after_clause(sort, after)]}
+    if projection is not None:
+        # Projeção de inclusão: dicionário {caminho: 1} ou lista de caminhos
+        if not isinstance(projection, dict):
+            projection = dict.fromkeys(projection, 1)
+        projection = {**projection, **{path: 1 for path, _ in sort}}
+    # Um documento a mais indica se existe uma próxima página
+    cursor = get_players_collection().find(query, projection).sort(sort).limit(page_size + 1)
+    documents = await cursor.to_list()
+    items = documents[:page_size]
+    next_after = None
+    if len(documents) > page_size:
+        next_after = tuple(modelo.get_path(items[-1], path) for path, _ in sort)
+    return {'items': items, 'next_after': next_after}
+
+
+def iterate(async_iterator):
+    """Consome um gerador assíncrono a partir de código síncrono, um documento por vez."""
+    async def next_item():
+        return await async_iterator.__anext__()
+    try:
+        while True:
+            try:
+                yield run(next_item())
+            except StopAsyncIteration:
+                return
+    finally:
+        # Fecha o cursor mesmo se o consumidor parar antes do fim
+        run(async_iterator.aclose())
+
+# ======================
+# Consultas Simples
+# ======================
+# Os pipelines ficam em registro_consultas.py; as funções abaixo executam o plano registrado com o
+# mesmo nome e, quando preciso, dão forma ao resultado.
+
+# 1. Porcentagem de rounds com mais de X kills (histograma rounds_by_kills), para um jogador
+@cached_query
+async def percentage_maps_with_kills_above(player_id, kill_threshold):
+    stats = await player_stats([player_id], kill_threshold)
+    # None quando o jogador não existe
+    return stats[player_id].get('percentage_rounds_above')
+
+# 1b. Estatísticas de vários jogadores em uma única consulta ($in no índice único de player_id)
+@cached_query
+async def player_stats(player_ids, kill_threshold=0):
+    player_ids = list(dict.fromkeys(player_ids))
+    found = {document['player_id']: modelo.player_summary(document, kill_threshold)
+             for document in await run_plan('player_stats', player_ids, kill_threshold)}
+    # Resultado na ordem pedida, com uma entrada explícita para cada id inexistente
+    return {player_id: found.get(player_id, {'player_id': player_id, 'missing': True})
+            for player_id in player_ids}
+
+# 2. Ranking dos jogadores com base na relação de kills por round e assistências por round
+@cached_query
+async def ranking_kills_assists():
+    return await run_plan('ranking_kills_assists')
+
+# 3. Diferença de kills entre jogadores com mais de X mapas jogados
+@cached_query
+async def kill_difference_among_players_with_maps_above(threshold):
+    return await run_plan('kill_difference_among_players_with_maps_above', threshold)
+
+# 4. Jogadores com mais de X opening kills e rating acima de Y (em ordem estável, também usada na paginação)
+@cached_query
+async def players_with_opening_kills_and_rating_above(opening_kills_threshold, rating_threshold):
+    return await run_plan('players_with_opening_kills_and_rating_above', opening_kills_threshold, rating_threshold)
+
+@query_monitor.instrumented
+async def players_with_opening_kills_and_rating_above_page(opening_kills_threshold, rating_threshold,
+                                                           page_size=DEFAULT_PAGE_SIZE, after=None, projection=None):
+    spec = registro_consultas.players_with_opening_kills_and_rating_above(opening_kills_threshold, rating_threshold)
+    return await keyset_page(spec['filter'], spec['sort'], page_size, after, projection)
+
+async def stream_players_with_opening_kills_and_rating_above(opening_kills_threshold, rating_threshold,
+                                                             batch_size=DEFAULT_PAGE_SIZE, projection=None):
+    spec = registro_consultas.players_with_opening_kills_and_rating_above(opening_kills_threshold, rating_threshold)
+    cursor = get_players_collection().find(spec['filter'], projection, batch_size=batch_size).sort(spec['sort'])
+    async for document in cursor:
+        yield document
+
+# 5. Função para encontrar o jogador com mais kills em cada categoria
+@cached_query
+async def get_top_killers():
+    categories = WEAPON_CATEGORIES
+    results = {}
+
+    # Uma única ida ao servidor para as cinco categorias
+    leaders = await leaderboard(categories, k=1)
+    for category in categories:
+        top_killer = leaders[category][0] if leaders[category] else None
+        if top_killer:
+            top_killer = {'player_id': top_killer['player_id'], 'nickname': top_killer['nickname'],
+                          category: top_killer['value']}
+        results[category] = top_killer
+
+    return results
+
+# 5b. Top K jogadores de vários campos numéricos em uma única ida ao servidor
+@cached_query
+async def leaderboard(fields, k=10):
+    # O plano valida os campos e monta um ramo $unionWith por campo
+    documents = await run_plan('leaderboard', fields, k) if fields else []
+    results = {field: [] for field in fields}
+    for document in documents:
+        results[document.pop('field')].append(document)
+    return results
+
+# ======================
+# Consultas Avançadas
+# ======================
+
+# 6. Jogadores com mais de X% de vitórias após o primeiro kill
+@cached_query
+async def players_with_win_percent_after_first_kill_above(threshold):
+    return await run_plan('players_with_win_percent_after_first_kill_above', threshold)
+
+@query_monitor.instrumented
+async def players_with_win_percent_after_first_kill_above_page(threshold, page_size=DEFAULT_PAGE_SIZE,
+                                                               after=None, projection=None):
+    spec = registro_consultas.players_with_win_percent_after_first_kill_above(threshold)
+    return await keyset_page(spec['filter'], spec['sort'], page_size, after, projection)
+
+async def stream_players_with_win_percent_after_first_kill_above(threshold, batch_size=DEFAULT_PAGE_SIZE,
+                                                                 projection=None):
+    spec = registro_consultas.players_with_win_percent_after_first_kill_above(threshold)
+    cursor = get_players_collection().find(spec['filter'], projection, batch_size=batch_size).sort(spec['sort'])
+    async for document in cursor:
+        yield document
+
+
+# 7. Porcentagem média de vitórias após o primeiro kill por país, acima de um limite (resumo de agregados.py)
+@cached_query
+async def win_percentage_after_first_kill_by_country(threshold):
+    return await run_plan('win_percentage_after_first_kill_by_country', threshold)
+
+# 8. Média de kills por país para jogadores com mais de X mapas jogados (resumo de agregados.py)
+@cached_query
+async def average_kills_by_country(min_maps_played):
+    return await run_plan('average_kills_by_country', min_maps_played)
+
+# 9. Distribuição de kill/death ratio por faixa etária (resumo de agregados.py)
+@cached_query
+async def kd_ratio_by_age_group():
+    return await run_plan('kd_ratio_by_age_group')
+
+# 10. Ranking dos jogadores com maior número de kills por round (headshot < 40%)
+@cached_query
+async def top_kill_per_round_low_headshot(threshold):
+    return await run_plan('top_kill_per_round_low_headshot', threshold)
+
+
+# 11. Total de kills por tipo de arma por time (resumo de agregados.py)
+@cached_query
+async def total_kills_by_weapon_per_team():
+    return await run_plan('total_kills_by_weapon_per_team')
+
+# 12. Diferença de kills/deaths para jogadores com mais de X mapas jogados e mais de Y kills
+@cached_query
+async def kill_death_difference_by_maps_and_kills(min_maps_played, min_kills):
+    return await run_plan('kill_death_difference_by_maps_and_kills', min_maps_played, min_kills)
@@ -0,0 +1,520 @@
+import argparse
+import inspect
+import json
+import os
+
+import agregados
+import modelo
+
+# ======================
+# Registro de consultas
+# ======================
+# Cada consulta do projeto é declarada uma única vez aqui, como um plano nomeado: a coleção que lê,
+# a operação (aggregate ou find) e a função que monta o pipeline a partir dos parâmetros. queries_async.py
+# executa os planos, indices.py roda explain() neles e o CLI deste módulo lista, valida e explica todos.
+
+PLAYERS_COLLECTION = 'players'
+WEAPON_CATEGORIES = ['rifle_kills', 'sniper_kills', 'smg_kills', 'pistol_kills', 'grenade_kills']
+# Campos que podem ser usados no leaderboard: só os que têm índice próprio em indices.py, para que
+# nenhum ramo do $unionWith leia a coleção inteira
+LEADERBOARD_FIELDS = WEAPON_CATEGORIES + ['other_kills', 'rating', 'kills_per_round']
+# Ordens estáveis (campos do índice + _id), usadas também na paginação por chave
+OPENING_KILLS_SORT = [("stats.total_opening_kills", 1), ("rating", 1), ("_id", 1)]
+WIN_PERCENT_SORT = [("stats.team_win_percent_after_first_kill", 1), ("_id", 1)]
+# Estágios que mudam o formato dos documentos: depois deles os caminhos não são mais os da coleção
+RESHAPING_STAGES = {'$group', '$project', '$bucket', '$unionWith', '$replaceRoot', '$unwind', '$facet'}
+
+PLANS = {}
+
+
+class QueryPlan:
+    """Consulta nomeada: coleção, operação e a função que monta o pipeline (ou filtro) a partir dos parâmetros."""
+
+    def __init__(self, name, collection, operation, builder, example):
+        self.name = name
+        self.collection = collection
+        self.operation = operation
+        self.builder = builder
+        # Parâmetros de exemplo, usados no explain, na validação e no relatório
+        self.example = example
+        self.description = inspect.getdoc(builder) or ''
+
+    @property
+    def parameters(self):
+        return list(inspect.signature(self.builder).parameters)
+
+    def build(self, *args, **kwargs):
+        """Monta a especificação: {'pipeline': [...]} ou {'filter', 'projection', 'sort', 'limit'}."""
+        return self.builder(*args, **kwargs)
+
+    def command(self, *args, **kwargs):
+        """Comando do MongoDB equivalente à consulta, para explain()."""
+        spec = self.build(*args, **kwargs)
+        if self.operation == 'aggregate':
+            return {'aggregate': self.collection, 'pipeline': spec['pipeline'], 'cursor': {}}
+        command = {'find': self.collection, 'filter': spec['filter']}
+        if spec.get('projection'):
+            command['projection'] = spec['projection']
+        if spec.get('sort'):
+            command['sort'] = dict(spec['sort'])
+        if spec.get('limit'):
+            command['limit'] = spec['limit']
+        return command
+
+
+def register(name, collection=PLAYERS_COLLECTION, operation='aggregate', example=()):
+    """Decorador que registra a função como o montador do plano name."""
+    def decorator(builder):
+        PLANS[name] = QueryPlan(name, collection, operation, builder, tuple(example))
+        return builder
+    return decorator
+
+
+def get_plan(name):
+    """Retorna o plano registrado com esse nome."""
+    if name not in PLANS:
+        raise ValueError(f"Consulta não registrada: {name}")
+    return PLANS[name]
+
+# ======================
+# Consultas Simples
+# ======================
+
+# 1. Porcentagem de rounds com mais de X kills; lê o jogador pela mesma consulta de player_stats
+@register('percentage_maps_with_kills_above', operation='find', example=(11893, 1))
+def percentage_maps_with_kills_above(player_id, kill_threshold):
+    """Porcentagem de rounds com mais de kill_threshold kills de um jogador."""
+    return player_stats([player_id], kill_threshold)
+
+
+# 1b. Estatísticas de vários jogadores em uma única consulta ($in no índice único de player_id)
+@register('player_stats', operation='find', example=([11893, 7998, 20113, 13156], 1))
+def player_stats(player_ids, kill_threshold=0):
+    """Resumo de vários jogadores, com os rounds acima de kill_threshold kills."""
+    return {
+        'filter': {"player_id": {"$in": list(player_ids)}},
+        'projection': {"_id": 0, **{path: 1 for path in modelo.PLAYER_STATS_FIELDS}},
+    }
+
+
+# 2. Ranking dos jogadores com base na relação de kills por round e assistências por round
+@register('ranking_kills_assists')
+def ranking_kills_assists():
+    """Top 10 pela soma de kills e assistências por round."""
+    pipeline = [
+        {
+            "$sort": {
+                # Soma calculada na carga (insercao_banco.normalize_dataframe)
+                "stats.kills_assists_per_round": -1  # Ordenar do maior para o menor
+            }
+        },
+        {
+            "$limit": 10  # Top 10 jogadores
+        },
+        {
+            "$project": {
+                "nickname": 1,
+                "kills_per_round": "$stats.kills_per_round",
+                "assists_per_round": "$stats.assists_per_round",
+                "total_kills": "$stats.total_kills",
+                "total_rounds": "$stats.rounds_played",  # Apenas para referência
+                "kills_assists_ratio": "$stats.kills_assists_per_round"
+            }
+        }
+    ]
+    return {'pipeline': pipeline}
+
+
+# 3. Diferença de kills entre jogadores com mais de X mapas jogados
+@register('kill_difference_among_players_with_maps_above', example=(500,))
+def kill_difference_among_players_with_maps_above(threshold):
+    """Diferença entre o maior e o menor total de kills dos jogadores com mais de threshold mapas."""
+    return {'pipeline': [
+        {"$match": {"stats.maps_played": {"$gt": threshold}}},
+        {"$group": {
+            "_id": None,
+            "max_kills": {"$max": "$stats.total_kills"},
+            "min_kills": {"$min": "$stats.total_kills"}
+        }},
+        {"$project": {"kill_difference": {"$subtract": ["$max_kills", "$min_kills"]}}}
+    ]}
+
+
+# 4. Jogadores com mais de X opening kills e rating acima de Y
+@register('players_with_opening_kills_and_rating_above', operation='find', example=(1000, 1.1))
+def players_with_opening_kills_and_rating_above(opening_kills_threshold, rating_threshold):
+    """Jogadores acima dos dois limites, em ordem estável (também usada na paginação)."""
+    return {
+        'filter': {
+            "stats.total_opening_kills": {"$gt": opening_kills_threshold},
+            "rating": {"$gt": rating_threshold}
+        },
+        'sort': OPENING_KILLS_SORT,
+    }
+
+
+# 5. Jogador com mais kills em cada categoria: o leaderboard das categorias de armas com k=1
+@register('get_top_killers')
+def get_top_killers():
+    """Jogador com mais kills em cada categoria de arma."""
+    return leaderboard(WEAPON_CATEGORIES, k=1)
+
+
+def _leaderboard_branch(field, k):
+    path = modelo.field_path(field)
+    return [
+        # player_id desempata jogadores com o mesmo valor, deixando o resultado determinístico
+        {"$sort": {path: -1, "player_id": 1}},
+        {"$limit": k},
+        {"$project": {"_id": 0, "player_id": 1, "nickname": 1, "value": f"${path}", "field": {"$literal": field}}}
+    ]
+
+
+# 5b. Top K jogadores de vários campos numéricos em uma única ida ao servidor
+@register('leaderboard', example=(['rifle_kills', 'sniper_kills', 'rating', 'kills_per_round'], 10))
+def leaderboard(fields, k=10):
+    """Top k jogadores de cada campo, com um ramo $unionWith por campo."""
+    unknown = [field for field in fields if field not in LEADERBOARD_FIELDS]
+    if unknown:
+        raise ValueError(f"Campos inválidos para o leaderboard: {', '.join(unknown)}")
+    if not fields:
+        return {'pipeline': []}
+    # Cada campo vira um ramo ordenado pelo seu próprio índice; $unionWith junta todos em um só comando
+    return {'pipeline': _leaderboard_branch(fields[0], k) + [
+        {"$unionWith": {"coll": PLAYERS_COLLECTION, "pipeline": _leaderboard_branch(field, k)}}
+        for field in fields[1:]
+    ]}
+
+# ======================
+# Consultas Avançadas
+# ======================
+
+# 6. Jogadores com mais de X% de vitórias após o primeiro kill
+@register('players_with_win_percent_after_first_kill_above', operation='find', example=(75,))
+def players_with_win_percent_after_first_kill_above(threshold):
+    """Jogadores com mais de threshold% de vitórias após o primeiro kill, em ordem estável."""
+    return {
+        'filter': {"stats.team_win_percent_after_first_kill": {"$gt": threshold}},
+        'sort': WIN_PERCENT_SORT,
+    }
+
+
+# 7. Porcentagem média de vitórias após o primeiro kill por país, acima de um limite
+@register('win_percentage_after_first_kill_by_country', collection='summary_country_win_percent', example=(40,))
+def win_percentage_after_first_kill_by_country(threshold):
+    """Média de vitórias após o primeiro kill por país (resumo país x percentual de agregados.py)."""
+    return {'pipeline': [
+        {"$match": {"_id.win_percent": {"$gt": threshold}}},
+        {"$group": {
+            "_id": "$_id.country",
+            "weighted_win_percent": {"$sum": {"$multiply": ["$_id.win_percent", "$players"]}},
+            "total_players": {"$sum": "$players"}
+        }},
+        {"$project": {
+            "average_win_percent": {"$divide": ["$weighted_win_percent", "$total_players"]},
+            "total_players": 1
+        }},
+        {"$sort": {"average_win_percent": -1}}
+    ]}
+
+
+# 8. Média de kills por país para jogadores com mais de X mapas jogados
+@register('average_kills_by_country', collection='summary_country_maps', example=(500,))
+def average_kills_by_country(min_maps_played):
+    """Média de kills por país (resumo país x mapas jogados de agregados.py)."""
+    return {'pipeline': [
+        {"$match": {"_id.maps_played": {"$gt": min_maps_played}}},
+        {"$group": {
+            "_id": "$_id.country",
+            "sum_total_kills": {"$sum": "$sum_total_kills"},
+            "count_total_kills": {"$sum": "$count_total_kills"},
+            "total_players": {"$sum": "$players"}
+        }},
+        {"$project": {
+            "average_kills": {"$cond": [
+                {"$gt": ["$count_total_kills", 0]},
+                {"$divide": ["$sum_total_kills", "$count_total_kills"]},
+                None
+            ]},
+            "total_players": 1
+        }},
+        {"$sort": {"average_kills": -1}}
+    ]}
+
+
+# 9. Distribuição de kill/death ratio por faixa etária
+@register('kd_ratio_by_age_group', collection='summary_age')
+def kd_ratio_by_age_group():
+    """Média de K/D por faixa etária (resumo por idade de agregados.py)."""
+    return {'pipeline': [
+        # Percorre o resumo pelo índice de _id
+        {"$sort": {"_id": 1}},
+        {"$bucket": {
+            "groupBy": "$_id",
+            "boundaries": [18, 21, 25, 30, 35, 40],  # Definindo os grupos etários
+            "default": "Other",
+            "output": {
+                "sum_kills_per_death": {"$sum": "$sum_kills_per_death"},
+                "count_kills_per_death": {"$sum": "$count_kills_per_death"},
+                "total_players": {"$sum": "$players"}
+            }
+        }},
+        {"$project": {
+            "average_kd_ratio": {"$cond": [
+                {"$gt": ["$count_kills_per_death", 0]},
+                {"$divide": ["$sum_kills_per_death", "$count_kills_per_death"]},
+                None
+            ]},
+            "total_players": 1
+        }},
+        {"$sort": {"average_kd_ratio": -1}}
+    ]}
+
+
+# 10. Ranking dos jogadores com maior número de kills por round (headshot < 40%)
+@register('top_kill_per_round_low_headshot', example=(40.0,))
+def top_kill_per_round_low_headshot(threshold):
+    """Top 10 em kills por round entre os jogadores com headshot abaixo de threshold%."""
+    return {'pipeline': [
+        {
+            "$match": {
+                "stats.headshot_percentage": {"$lt": threshold}
+            }
+        },
+        {
+            # Mesma ordem do índice; o headshot desempata, deixando o resultado determinístico
+            "$sort": {"stats.kills_per_round": -1, "stats.headshot_percentage": 1}
+        },
+        {
+            "$project": {
+                "nickname": 1,
+                "kills_per_round": "$stats.kills_per_round",
+                "headshot_percentage": "$stats.headshot_percentage"
+            }
+        },
+        {
+            "$limit": 10
+        }
+    ]}
+
+
+# 11. Total de kills por tipo de arma por time
+@register('total_kills_by_weapon_per_team', collection='summary_team', operation='find')
+def total_kills_by_weapon_per_team():
+    """Kills por arma de cada time (resumo por time de agregados.py)."""
+    # O resumo por time já tem um documento por time com as somas
+    return {'filter': {}, 'projection': {"refresh_token": 0}, 'sort': [("rifle_kills", -1)]}
+
+
+# 12. Diferença de kills/deaths para jogadores com mais de X mapas jogados e mais de Y kills
+@register('kill_death_difference_by_maps_and_kills', example=(500, 10000))
+def kill_death_difference_by_maps_and_kills(min_maps_played, min_kills):
+    """Top 10 em diferença de kills e deaths entre os jogadores acima dos dois limites."""
+    return {'pipeline': [
+        {"$match": {
+            "stats.maps_played": {"$gt": min_maps_played},
+            "stats.total_kills": {"$gt": min_kills}
+        }},
+        # Mesma ordem do índice; mapas e kills desempatam, deixando o resultado determinístico
+        {"$sort": {"stats.kill_to_death_diff": -1, "stats.maps_played": 1, "stats.total_kills": 1}},
+        {"$project": {
+            "nickname": 1,
+            "kill_to_death_diff": "$stats.kill_to_death_diff"
+        }},
+        {"$limit": 10}
+    ]}
+
+# ======================
+# Validação
+# ======================
+
+def known_paths(collection):
+    """Caminhos que existem nos documentos da coleção (jogadores ou um dos resumos de agregados.py)."""
+    if collection == PLAYERS_COLLECTION:
+        paths = {'_id'}
+        for path in modelo.FIELD_MAPPING.values():
+            parts = path.split('.')
+            paths.update('.'.join(parts[:i]) for i in range(1, len(parts) + 1))
+        return paths
+    rollup = agregados.ROLLUPS[collection]
+    paths = {'_id', 'refresh_token', *rollup['accumulators']}
+    if isinstance(rollup['group_id'], dict):
+        paths.update(f'_id.{key}' for key in rollup['group_id'])
+    return paths
+
+
+def _filter_paths(query):
+    """Caminhos usados em um filtro de consulta (ignorando os operadores)."""
+    paths = []
+    if isinstance(query, dict):
+        for key, value in query.items():
+            if key.startswith('$'):
+                paths.extend(_filter_paths(value))
+            else:
+                paths.append(key)
+    elif isinstance(query, list):
+        for item in query:
+            paths.extend(_filter_paths(item))
+    return paths
+
+
+def _expression_paths(expression):
+    """Caminhos referenciados como "$campo" em uma expressão de agregação."""
+    if isinstance(expression, str):
+        return [expression[1:]] if expression.startswith('$') and not expression.startswith('$$') else []
+    if isinstance(expression, dict):
+        return [path for value in expression.values() for path in _expression_paths(value)]
+    if isinstance(expression, list):
+        return [path for item in expression for path in _expression_paths(item)]
+    return []
+
+
+def _pipeline_paths(pipeline):
+    """Caminhos da coleção lidos por um pipeline: filtros, ordenações e o primeiro estágio que reformata."""
+    paths = []
+    reshaped = False
+    for stage in pipeline:
+        (operator, body), = stage.items()
+        if operator == '$unionWith':
+            # Cada ramo volta a ler a coleção desde o início
+            paths.extend(_pipeline_paths(body.get('pipeline', [])))
+        elif reshaped:
+            continue
+        elif operator == '$match':
+            paths.extend(_filter_paths(body))
+        elif operator == '$sort':
+            paths.extend(body)
+        elif operator in RESHAPING_STAGES:
+            # As expressões do primeiro estágio que reformata ainda leem os campos da coleção
+            paths.extend(_expression_paths(body))
+            if operator == '$project':
+                paths.extend(path for path, value in body.items() if value is True or value == 1)
+            reshaped = True
+    return paths
+
+
+def _input_paths(plan, spec):
+    """Caminhos da coleção lidos pelo plano."""
+    if plan.operation == 'find':
+        return (_filter_paths(spec['filter']) + [path for path, _ in spec.get('sort') or []]
+                + list(spec.get('projection') or {}))
+    return _pipeline_paths(spec['pipeline'])
+
+
+def rollup_dependencies(name):
+    """Campos da coleção de jogadores usados para montar um dos resumos de agregados.py."""
+    rollup = agregados.ROLLUPS[name]
+    return {rollup['scope'], *_expression_paths(rollup['group_id']), *_expression_paths(rollup['accumulators'])}
+
+
+def plan_dependencies(name, *args, **kwargs):
+    """Campos da coleção de jogadores dos quais o resultado da consulta depende.
+
+    Retorna None quando a consulta devolve documentos inteiros (qualquer campo importa).
+    """
+    plan = get_plan(name)
+    if plan.collection != PLAYERS_COLLECTION:
+        return rollup_dependencies(plan.collection)
+    spec = plan.build(*args, **kwargs)
+    if plan.operation == 'find' and not spec.get('projection'):
+        return None
+    return set(_input_paths(plan, spec))
+
+
+def validate_plan(plan):
+    """Monta o plano com os parâmetros de exemplo e retorna a lista de problemas encontrados."""
+    try:
+        spec = plan.build(*plan.example)
+    except Exception as e:
+        return [f"erro ao montar o pipeline: {e}"]
+    problems = []
+    if plan.collection != PLAYERS_COLLECTION and plan.collection not in agregados.ROLLUPS:
+        return [f"coleção desconhecida: {plan.collection}"]
+    if plan.operation == 'aggregate':
+        for i, stage in enumerate(spec.get('pipeline', [])):
+            if not isinstance(stage, dict) or len(stage) != 1 or not next(iter(stage)).startswith('$'):
+                problems.append(f"estágio {i} inválido: {stage!r}")
+        if problems:
+            return problems
+    elif plan.operation == 'find':
+        if 'filter' not in spec:
+            return ["plano find sem filtro"]
+    else:
+        return [f"operação desconhecida: {plan.operation}"]
+    paths = known_paths(plan.collection)
+    for path in _input_paths(plan, spec):
+        if path not in paths:
+            problems.append(f"campo inexistente em {plan.collection}: {path}")
+    return problems
+
+
+def validate_plans(names=None):
+    """Valida os planos registrados (ou só os indicados) e retorna nome -> problemas."""
+    return {name: validate_plan(get_plan(name)) for name in (names or PLANS)}
+
+
+def explain_plan(db, name, *args, verbosity='queryPlanner'):
+    """Roda explain() do plano no servidor, com os parâmetros dados ou os de exemplo."""
+    plan = get_plan(name)
+    return db.command('explain', plan.command(*(args or plan.example)), verbosity=verbosity)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lista, valida e explica as consultas registradas.")
+    parser.add_argument('names', nargs='*', help="Consultas a considerar (padrão: todas)")
+    parser.add_argument('--list', action='store_true', help="Lista as consultas e seus parâmetros")
+    parser.add_argument('--validate', action='store_true', help="Monta cada pipeline e confere estágios e campos")
+    parser.add_argument('--explain', action='store_true', help="Roda explain() de cada consulta no servidor")
+    parser.add_argument('--show', action='store_true', help="Imprime o pipeline montado com os parâmetros de exemplo")
+    parser.add_argument('--uri', default=os.getenv("MONGO_URI", "mongodb://localhost:27017/"))
+    parser.add_argument('--db', default=os.getenv("MONGO_DB", "csgo_db"))
+    args = parser.parse_args()
+
+    try:
+        names = [get_plan(name).name for name in args.names] or list(PLANS)
+    except ValueError as e:
+        print(f"Erro: {e}")
+        return
+
+    if args.list or not (args.validate or args.explain or args.show):
+        for name in names:
+            plan = PLANS[name]
+            print(f"{name:50s} {plan.operation:9s} {plan.collection:28s} ({', '.join(plan.parameters)})")
+            print(f"    {plan.description}")
+
+    if args.show:
+        for name in names:
+            plan = PLANS[name]
+            print(f"\n{name}{plan.example}")
+            print(json.dumps(plan.build(*plan.example), indent=2, default=str))
+
+    if args.validate:
+        results = validate_plans(names)
+        for name, problems in results.items():
+            print(f"{name:50s} {'ok' if not problems else 'ERRO'}")
+            for problem in problems:
+                print(f"    {problem}")
+        invalid = [name for name, problems in results.items() if problems]
+        print(f"{len(results) - len(invalid)} de {len(results)} consultas válidas.")
+
+    if args.explain:
+        from pymongo import MongoClient
+        from pymongo.errors import PyMongoError
+
+        # Import local: indices.py também importa este módulo
+        from indices import _winning_plan_stages
+
+        client = MongoClient(args.uri)
+        try:
+            for name in names:
+                try:
+                    stages = _winning_plan_stages(explain_plan(client[args.db], name))
+                    print(f"{name:50s} {' > '.join(stages)}")
+                except PyMongoError as e:
+                    print(f"{name:50s} erro: {e}")
+        finally:
+            client.close()
+
+
+if __name__ == "__main__":
+    main()
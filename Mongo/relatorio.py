@@ -0,0 +1,318 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+import pandas as pd
+from bson import ObjectId
+
+import queries
+import queries_async
+import registro_consultas
+
+REPORTS_DIR = os.getenv("CSGO_REPORTS_DIR", "./reports")
+REPORT_WORKERS = int(os.getenv("CSGO_REPORT_WORKERS", "8"))
+# Uma consulta é marcada como regressão se ficar este fator mais lenta que no relatório de referência...
+REGRESSION_FACTOR = float(os.getenv("CSGO_REPORT_REGRESSION_FACTOR", "1.5"))
+# ...e a diferença passar deste número de milissegundos (evita alarmes em consultas de 1-2 ms)
+REGRESSION_MIN_MS = float(os.getenv("CSGO_REPORT_REGRESSION_MIN_MS", "5"))
+TIMINGS_FILE = 'timings'
+TEXT_FILE = 'relatorio.txt'
+
+# ======================
+# Formatação em texto
+# ======================
+# Título e linhas do relatório em texto de cada consulta registrada; as consultas sem formatador
+# aparecem com uma linha por registro.
+
+def _decimal(value, suffix=''):
+    """Número com duas casas, ou n/d quando a consulta não tem o valor (ex.: jogador sem mapas)."""
+    return 'n/d' if value is None else f"{value:.2f}{suffix}"
+
+
+def _percent(value):
+    return _decimal(value, '%')
+
+
+def _format_percentage(result, args):
+    return [f"Jogador ID: {args[0]} - Porcentagem de rounds com mais de {args[1]} kill: {_percent(result)}"]
+
+
+def _format_player_stats(result, args):
+    lines = []
+    for player_id, stats in result.items():
+        if stats['missing']:
+            lines.append(f"Jogador ID: {player_id} - não encontrado")
+        else:
+            lines.append(f"{stats['nickname']} ({stats['current_team']}) - {_percent(stats['percentage_rounds_above'])} "
+                         f"dos rounds com mais de {args[1]} kill - Rating: {stats['rating']}")
+    return lines
+
+
+def _format_top_killers(result, args):
+    return [f"Top player for {category}: n/d" if player is None else
+            f"Top player for {category}: {player['nickname']} with {player[category]} kills"
+            for category, player in result.items()]
+
+
+def _format_leaderboard(result, args):
+    lines = []
+    for field, players in result.items():
+        ranking = ', '.join(f"{player['nickname']} ({player['value']})" for player in players)
+        lines.append(f"{field}: {ranking}")
+    return lines
+
+
+FORMATTERS = {
+    'percentage_maps_with_kills_above': (
+        "Porcentagem de rounds com mais de X kills", _format_percentage),
+    'player_stats': (
+        "Comparação de jogadores (rounds com mais de X kills)", _format_player_stats),
+    'ranking_kills_assists': (
+        "Ranking dos jogadores com base na relação de kills e assistências por round",
+        lambda result, args: [
+            f"{idx}. Nickname: {row['nickname']} - Kills/Round: {row['kills_per_round']} - Assists/Round:"
+            f" {row['assists_per_round']} - Kills/Assists Ratio: {_decimal(row['kills_assists_ratio'])}"
+            for idx, row in enumerate(result, start=1)]),
+    'kill_difference_among_players_with_maps_above': (
+        "Diferença de kills entre jogadores com mais de X mapas jogados",
+        lambda result, args: [f"Diferença de kills: {row['kill_difference']}" for row in result]),
+    'players_with_opening_kills_and_rating_above': (
+        "Jogadores com mais de X opening kills e rating acima de Y",
+        lambda result, args: [
+            f"Nickname: {row['nickname']} - Opening Kills: {row['stats']['total_opening_kills']} - Rating: {row['rating']}"
+            for row in result]),
+    'get_top_killers': ("Jogador com mais kills em cada categoria", _format_top_killers),
+    'leaderboard': ("Leaderboard por estatística", _format_leaderboard),
+    'players_with_win_percent_after_first_kill_above': (
+        "Jogadores com vitórias após o primeiro kill acima de X%",
+        lambda result, args: [
+            f"Nickname: {row['nickname']} - Vitórias após o primeiro kill:"
+            f" {row['stats']['team_win_percent_after_first_kill']}%" for row in result]),
+    'win_percentage_after_first_kill_by_country': (
+        "Porcentagem de vitórias após o primeiro kill acima de X% por país",
+        lambda result, args: [
+            f"País: {row['_id']} - Média de vitórias: {row['average_win_percent']}% - Jogadores: {row['total_players']}"
+            for row in result]),
+    'average_kills_by_country': (
+        "Média de kills por país para jogadores com mais de X mapas jogados",
+        lambda result, args: [
+            f"País: {row['_id']} - Média de kills: {row['average_kills']} - Jogadores: {row['total_players']}"
+            for row in result]),
+    'kd_ratio_by_age_group': (
+        "Distribuição do kill/death ratio por faixa etária",
+        lambda result, args: [
+            f"Faixa etária: {row['_id']} - Média de K/D: {row['average_kd_ratio']} - Jogadores: {row['total_players']}"
+            for row in result]),
+    'top_kill_per_round_low_headshot': (
+        "Ranking dos jogadores com maior número de kills por round (headshot abaixo de X%)",
+        lambda result, args: [
+            f"{idx}. Nickname: {row.get('nickname', 'N/A')} - Kills/Round: {row.get('kills_per_round', 'N/A')}"
+            f" - Headshot %: {row.get('headshot_percentage', 'N/A')}" for idx, row in enumerate(result, 1)]),
+    'total_kills_by_weapon_per_team': (
+        "Total de kills por tipo de arma por time",
+        lambda result, args: [
+            f"Time: {row['_id']} - Rifle Kills: {row['rifle_kills']} - Sniper Kills: {row['sniper_kills']}"
+            f" - SMG Kills: {row['smg_kills']}" for row in result]),
+    'kill_death_difference_by_maps_and_kills': (
+        "Diferença de kills/deaths para jogadores com mais de X mapas jogados e mais de Y kills",
+        lambda result, args: [
+            f"{idx}. Nickname: {row['nickname']} - Diferença K/D: {row['kill_to_death_diff']}"
+            for idx, row in enumerate(result, 1)]),
+}
+
+
+def format_result(name, result, args):
+    """Título e linhas de texto do resultado de uma consulta."""
+    title, formatter = FORMATTERS.get(name, (name, None))
+    if formatter is None:
+        return title, [str(row) for row in to_frame(result).to_dict('records')]
+    return title, formatter(result, args)
+
+# ======================
+# Resultados em colunas
+# ======================
+
+def to_frame(result):
+    """Converte o resultado de uma consulta em uma tabela (uma linha por registro, campos aninhados com ponto).
+
+    Listas de documentos viram uma linha por documento; dicionários de documentos (player_stats,
+    get_top_killers) ou de listas (leaderboard) ganham a coluna key; valores simples viram uma coluna value.
+    """
+    if isinstance(result, dict) and result and all(isinstance(value, list) for value in result.values()):
+        records = [{'key': key, **row} for key, rows in result.items() for row in rows]
+    elif isinstance(result, dict) and result and all(isinstance(value, dict) for value in result.values()):
+        records = [{'key': key, **row} for key, row in result.items()]
+    elif isinstance(result, list):
+        records = result
+    else:
+        records = [{'value': result}]
+    frame = pd.json_normalize(records, sep='.') if records else pd.DataFrame()
+    for column in frame.columns:
+        if frame[column].dtype == object:
+            # Parquet não tem tipo para ObjectId nem para colunas que misturam tipos (ex.: _id da faixa etária)
+            if frame[column].map(lambda value: isinstance(value, ObjectId)).any() or \
+                    frame[column].dropna().map(type).nunique() > 1:
+                frame[column] = frame[column].map(lambda value: None if value is None else str(value))
+    return frame
+
+
+def _write_table(frame, path, file_format):
+    """Grava a tabela em Parquet ou Arrow IPC (feather); retorna o caminho gravado."""
+    if file_format == 'arrow':
+        path = f"{path}.arrow"
+        frame.reset_index(drop=True).to_feather(path)
+    else:
+        path = f"{path}.parquet"
+        frame.to_parquet(path, index=False)
+    return path
+
+# ======================
+# Execução
+# ======================
+
+def report_cases(names=None):
+    """Consultas do relatório: nome e parâmetros de exemplo de cada plano registrado."""
+    names = names or list(registro_consultas.PLANS)
+    return [(name, registro_consultas.get_plan(name).example) for name in names]
+
+
+def _run_case(name, args, output_dir, file_format):
+    """Executa uma consulta pelo cliente compartilhado e já grava o resultado em colunas e em texto.
+
+    Um erro ao formatar ou gravar o resultado fica restrito a esta consulta; o relatório segue com as demais.
+    """
+    started_at = datetime.now(timezone.utc)
+    start = time.perf_counter()
+    try:
+        result = getattr(queries, name)(*args)
+    except Exception as e:
+        return {'name': name, 'args': repr(args), 'status': 'error', 'error': str(e), 'started_at': started_at,
+                'elapsed_ms': (time.perf_counter() - start) * 1000, 'rows': 0, 'title': None, 'lines': None,
+                'path': None}
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    try:
+        title, lines = format_result(name, result, args)
+    except Exception as e:
+        print(f"Erro ao formatar o resultado de {name}: {e}")
+        title, lines = FORMATTERS.get(name, (name, None))[0], [f"Erro ao formatar o resultado: {e}"]
+    frame, path = None, None
+    try:
+        frame = to_frame(result)
+        if file_format != 'none':
+            path = _write_table(frame, os.path.join(output_dir, name), file_format)
+    except Exception as e:
+        print(f"Erro ao gravar o resultado de {name}: {e}")
+    return {'name': name, 'args': repr(args), 'status': 'ok', 'error': None, 'started_at': started_at,
+            'elapsed_ms': elapsed_ms, 'rows': len(frame) if frame is not None else 0, 'title': title,
+            'lines': lines, 'path': path}
+
+
+def compare_timings(timings, baseline_dir):
+    """Acrescenta às medições o tempo do relatório de referência e marca as regressões."""
+    baseline = None
+    for extension, reader in (('parquet', pd.read_parquet), ('arrow', pd.read_feather)):
+        path = os.path.join(baseline_dir, f"{TIMINGS_FILE}.{extension}")
+        if os.path.exists(path):
+            baseline = reader(path).set_index('name')['elapsed_ms']
+            break
+    if baseline is None:
+        print(f"Relatório de referência sem medições: {baseline_dir}")
+        return timings
+    timings['baseline_ms'] = timings['name'].map(baseline)
+    timings['regression'] = (
+        (timings['elapsed_ms'] > timings['baseline_ms'] * REGRESSION_FACTOR)
+        & (timings['elapsed_ms'] - timings['baseline_ms'] > REGRESSION_MIN_MS)
+    )
+    return timings
+
+
+def run_report(output_dir=None, names=None, workers=REPORT_WORKERS, file_format='parquet', baseline_dir=None,
+               use_cache=False):
+    """Executa as consultas registradas em paralelo e grava o relatório (texto, tabelas e medições).
+
+    Cada worker do pool executa uma consulta pelo cliente compartilhado de queries_async.py e grava o
+    resultado assim que ele chega. Sem use_cache, o cache de consultas fica desligado durante o relatório,
+    para medir cada consulta de fato. Retorna o diretório do relatório e a tabela de medições.
+    """
+    output_dir = output_dir or os.path.join(REPORTS_DIR, datetime.now().strftime('%Y-%m-%d_%H%M%S'))
+    cases = report_cases(names)
+    os.makedirs(output_dir, exist_ok=True)
+
+    ttl = queries_async.query_cache.ttl
+    if not use_cache:
+        queries_async.query_cache.ttl = 0
+    start = time.perf_counter()
+    outcomes = {}
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(cases)))) as executor:
+            futures = [executor.submit(_run_case, name, args, output_dir, file_format) for name, args in cases]
+            for future in as_completed(futures):
+                outcome = future.result()
+                outcomes[outcome['name']] = outcome
+                status = f"{outcome['elapsed_ms']:.1f} ms" if outcome['status'] == 'ok' else f"erro: {outcome['error']}"
+                print(f"{outcome['name']:50s} {status}")
+    finally:
+        queries_async.query_cache.ttl = ttl
+    total_ms = (time.perf_counter() - start) * 1000
+
+    timings = pd.DataFrame([
+        {key: outcomes[name][key] for key in ('name', 'args', 'status', 'error', 'started_at', 'elapsed_ms', 'rows')}
+        for name, _ in cases
+    ])
+    if baseline_dir:
+        timings = compare_timings(timings, baseline_dir)
+    if file_format != 'none':
+        try:
+            _write_table(timings, os.path.join(output_dir, TIMINGS_FILE), file_format)
+        except (ImportError, ValueError, TypeError) as e:
+            print(f"Erro ao gravar as medições: {e}")
+
+    # O texto segue a ordem do registro, não a de término, para que relatórios de noites diferentes se comparem
+    text_path = os.path.join(output_dir, TEXT_FILE)
+    with open(text_path, 'w', encoding='utf-8') as f:
+        f.write(f"Relatório de consultas - {datetime.now(timezone.utc):%Y-%m-%d %H:%M:%S} UTC\n")
+        f.write(f"Backend: {queries_async.QUERY_BACKEND} - {len(cases)} consultas em {total_ms:.1f} ms"
+                f" ({workers} workers)\n\n")
+        f.write("===== Tempos =====\n")
+        for row in timings.to_dict('records'):
+            line = f"{row['name']:50s} {row['elapsed_ms']:10.1f} ms {row['rows']:6d} linhas"
+            if pd.notna(row.get('baseline_ms')):
+                line += f"  (referência {row['baseline_ms']:.1f} ms{' - REGRESSÃO' if row['regression'] else ''})"
+            if row['status'] != 'ok':
+                line += f"  ERRO: {row['error']}"
+            f.write(line + "\n")
+        for name, args in cases:
+            outcome = outcomes[name]
+            if outcome['status'] != 'ok':
+                continue
+            f.write(f"\n===== {outcome['title']} {args} =====\n")
+            f.write("\n".join(outcome['lines']) + "\n")
+    print(f"\nRelatório gravado em '{output_dir}' ({total_ms:.1f} ms no total).")
+    if 'regression' in timings and timings['regression'].any():
+        print(f"Regressões: {', '.join(timings.loc[timings['regression'], 'name'])}")
+    return output_dir, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera o relatório de todas as consultas registradas, em paralelo.")
+    parser.add_argument('--output', help=f"Diretório do relatório (padrão: {REPORTS_DIR}/<data e hora>)")
+    parser.add_argument('--queries', nargs='+', help="Consultas incluídas (padrão: todas as registradas)")
+    parser.add_argument('--workers', type=int, default=REPORT_WORKERS)
+    parser.add_argument('--format', choices=['parquet', 'arrow', 'none'], default='parquet',
+                        help="Formato das tabelas de resultados e medições (none: só o texto)")
+    parser.add_argument('--baseline', help="Relatório anterior, para comparar os tempos de cada consulta")
+    parser.add_argument('--cache', action='store_true', help="Usa o cache de consultas (por padrão, desligado)")
+    args = parser.parse_args()
+
+    try:
+        run_report(args.output, args.queries, args.workers, args.format, args.baseline, args.cache)
+    except ValueError as e:
+        print(f"Erro: {e}")
+    finally:
+        queries.close_client()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import argparse
+import asyncio
+import os
+import time
+
+import numpy as np
+
+import queries_async
+import snapshot
+from backend_colunar import ColumnarPlayers, _python
+from cache_consultas import read_collection_version
+
+# Grupos de estatísticas que descrevem o estilo de jogo; cada grupo pesa o mesmo na distância
+WEAPON_FIELDS = ['rifle_kills', 'sniper_kills', 'smg_kills', 'pistol_kills', 'grenade_kills', 'other_kills']
+FEATURE_GROUPS = {
+    # Divisão das kills por arma (fração do total de kills por arma, não o número absoluto)
+    'weapons': WEAPON_FIELDS,
+    'opening': ['opening_kill_rating', 'opening_kill_ratio', 'team_win_percent_after_first_kill',
+                'first_kill_in_won_rounds'],
+    'per_round': ['kills_per_round', 'assists_per_round', 'deaths_per_round', 'damage_per_round',
+                  'grenade_dmg_per_round', 'saved_by_teammate_per_round', 'saved_teammates_per_round',
+                  'headshot_percentage'],
+}
+FEATURES = [field for fields in FEATURE_GROUPS.values() for field in fields]
+# Linhas comparadas por vez na busca; limita a memória da matriz de distâncias temporária
+BLOCK_ROWS = int(os.getenv("CSGO_SIMILARITY_BLOCK_ROWS", "65536"))
+# Acima desta fração de jogadores alterados, a carga reconstrói o índice (e recalcula a normalização)
+REBUILD_FRACTION = float(os.getenv("CSGO_SIMILARITY_REBUILD_FRACTION", "0.1"))
+# O índice fica ao lado do snapshot e é atualizado por insercao_banco.py a cada carga
+DEFAULT_INDEX_PATH = os.getenv("CSGO_SIMILARITY_INDEX_PATH",
+                               os.path.join(os.path.dirname(snapshot.DEFAULT_SNAPSHOT_PATH), 'similarity.npz'))
+
+# ======================
+# Vetores de estilo
+# ======================
+# Cada jogador vira um vetor float32 com as colunas de FEATURES, padronizadas (z-score) pela média e
+# desvio da carga em que o índice foi montado. Valores ausentes ficam na média (zero). Cada grupo é
+# dividido pela raiz do seu tamanho, para que um grupo com mais colunas não domine a distância.
+
+
+def _raw_features(store):
+    """Matriz (jogadores x FEATURES) com os valores brutos, NaN para ausentes."""
+    columns = {field: store.columns[field].astype(np.float64) for field in FEATURES}
+    weapon_total = np.sum([columns[field] for field in WEAPON_FIELDS], axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for field in WEAPON_FIELDS:
+            columns[field] = np.where(weapon_total > 0, columns[field] / weapon_total, np.nan)
+    return np.column_stack([columns[field] for field in FEATURES])
+
+
+def _group_weights():
+    return np.concatenate([np.full(len(fields), 1 / np.sqrt(len(fields))) for fields in FEATURE_GROUPS.values()])
+
+
+class SimilarityIndex:
+    """Vetores de estilo de todos os jogadores e busca dos k mais próximos por força bruta em blocos.
+
+    Com poucos milhares de jogadores e ~20 dimensões, a força bruta vetorizada responde em
+    milissegundos e permite atualizar jogadores isolados sem reorganizar uma árvore.
+    """
+
+    def __init__(self, vectors, player_ids, nicknames, mean, scale, data_version=None):
+        self.vectors = vectors
+        self.player_ids = player_ids
+        self.nicknames = nicknames
+        self.mean = mean
+        self.scale = scale
+        self.data_version = data_version
+        self._reindex()
+
+    def _reindex(self):
+        self.size = len(self.player_ids)
+        self._rows = {int(player_id): row for row, player_id in enumerate(self.player_ids)}
+        # Normas ao quadrado, para calcular as distâncias com um produto de matrizes
+        self._norms = np.einsum('ij,ij->i', self.vectors, self.vectors)
+
+    @classmethod
+    def build(cls, store, data_version=None):
+        """Calcula a normalização e os vetores a partir da tabela colunar."""
+        raw = _raw_features(store)
+        mean = np.nanmean(raw, axis=0)
+        std = np.nanstd(raw, axis=0)
+        # Colunas constantes (ou vazias) não distinguem ninguém
+        scale = np.where(std > 0, std, 1.0) / _group_weights()
+        mean = np.nan_to_num(mean)
+        return cls(cls._normalize(raw, mean, scale), np.asarray(store.columns['player_id'], dtype=np.int64),
+                   np.array(list(store.nicknames), dtype=object), mean, scale, data_version)
+
+    @staticmethod
+    def _normalize(raw, mean, scale):
+        return np.nan_to_num((raw - mean) / scale).astype(np.float32)
+
+    # ======================
+    # Atualização incremental
+    # ======================
+
+    def upsert(self, documents):
+        """Atualiza (ou acrescenta) os jogadores dos documentos, mantendo a normalização atual."""
+        store = ColumnarPlayers.from_documents(documents)
+        if not store.size:
+            return
+        vectors = self._normalize(_raw_features(store), self.mean, self.scale)
+        new_rows = []
+        for row, player_id in enumerate(store.columns['player_id']):
+            existing = self._rows.get(int(player_id))
+            if existing is None:
+                new_rows.append(row)
+            else:
+                self.vectors[existing] = vectors[row]
+                self.nicknames[existing] = store.nicknames[row]
+        if new_rows:
+            self.vectors = np.vstack([self.vectors, vectors[new_rows]])
+            self.player_ids = np.concatenate([self.player_ids, store.columns['player_id'][new_rows]])
+            self.nicknames = np.concatenate([self.nicknames, store.nicknames[new_rows]])
+        self._reindex()
+
+    def remove(self, player_ids):
+        """Remove os jogadores do índice (os que não estão nele são ignorados)."""
+        rows = [self._rows[player_id] for player_id in player_ids if player_id in self._rows]
+        if not rows:
+            return
+        keep = np.ones(self.size, dtype=bool)
+        keep[rows] = False
+        self.vectors = self.vectors[keep]
+        self.player_ids = self.player_ids[keep]
+        self.nicknames = self.nicknames[keep]
+        self._reindex()
+
+    # ======================
+    # Busca
+    # ======================
+
+    def nearest(self, vector, k=10, exclude=None):
+        """Linhas e distâncias dos k vetores mais próximos, comparando BLOCK_ROWS linhas por vez."""
+        vector = np.asarray(vector, dtype=np.float32)
+        query_norm = float(vector @ vector)
+        best_rows = np.empty(0, dtype=np.int64)
+        best_distances = np.empty(0, dtype=np.float32)
+        for start in range(0, self.size, BLOCK_ROWS):
+            block = self.vectors[start:start + BLOCK_ROWS]
+            distances = self._norms[start:start + BLOCK_ROWS] - 2 * (block @ vector) + query_norm
+            if exclude is not None and start <= exclude < start + len(block):
+                distances[exclude - start] = np.inf
+            # Só os k melhores de cada bloco disputam com os k melhores até aqui
+            candidates = np.argpartition(distances, k)[:k] if len(distances) > k else np.arange(len(distances))
+            best_rows = np.concatenate([best_rows, candidates + start])
+            best_distances = np.concatenate([best_distances, distances[candidates]])
+            if len(best_rows) > k:
+                keep = np.argpartition(best_distances, k)[:k]
+                best_rows, best_distances = best_rows[keep], best_distances[keep]
+        order = np.argsort(best_distances, kind='stable')
+        rows, distances = best_rows[order], best_distances[order]
+        finite = np.isfinite(distances)
+        # Erros de arredondamento podem deixar distâncias ligeiramente negativas
+        return rows[finite], np.sqrt(np.maximum(distances[finite], 0))
+
+    def similar(self, player_id, k=10):
+        """Os k jogadores de estilo mais parecido com o do jogador (None se ele não está no índice)."""
+        row = self._rows.get(player_id)
+        if row is None:
+            return None
+        rows, distances = self.nearest(self.vectors[row], k, exclude=row)
+        return [{
+            'player_id': _python(self.player_ids[match]),
+            'nickname': self.nicknames[match],
+            'distance': float(distance),
+        } for match, distance in zip(rows, distances)]
+
+    # ======================
+    # Persistência
+    # ======================
+
+    def save(self, path=DEFAULT_INDEX_PATH):
+        """Grava vetores, normalização e versão dos dados em um .npz, de forma atômica."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temporary = f"{path}.tmp.npz"
+        np.savez(temporary, vectors=self.vectors, player_ids=self.player_ids,
+                 nicknames=np.array([str(nickname) for nickname in self.nicknames]), mean=self.mean,
+                 scale=self.scale, features=np.array(FEATURES),
+                 data_version=np.array(-1 if self.data_version is None else self.data_version))
+        os.replace(temporary, path)
+        return path
+
+    @classmethod
+    def load(cls, path=DEFAULT_INDEX_PATH):
+        """Lê o índice gravado; retorna None se ele não existir ou tiver sido gerado com outras colunas."""
+        try:
+            with np.load(path) as data:
+                if data['features'].tolist() != FEATURES:
+                    return None
+                data_version = int(data['data_version'])
+                return cls(data['vectors'], data['player_ids'], data['nicknames'].astype(object), data['mean'],
+                           data['scale'], None if data_version < 0 else data_version)
+        except (OSError, ValueError, KeyError):
+            return None
+
+
+def refresh_index(db, player_ids=None, path=DEFAULT_INDEX_PATH, players_collection='players'):
+    """Atualiza o índice gravado depois de uma carga, na versão atual da coleção.
+
+    Com player_ids (os jogadores alterados por uma carga incremental), e se o índice gravado estiver na
+    versão anterior, só esses jogadores são relidos; os que não existem mais saem do índice. Nos demais
+    casos, ou quando muitos jogadores mudaram, o índice é reconstruído a partir da coleção.
+    """
+    start = time.perf_counter()
+    version = read_collection_version(db)
+    collection = db[players_collection]
+    index = SimilarityIndex.load(path) if player_ids is not None else None
+    if (index is not None and index.data_version == version - 1
+            and len(player_ids) <= REBUILD_FRACTION * index.size):
+        documents = list(collection.find({'player_id': {'$in': list(player_ids)}}))
+        index.remove(set(player_ids) - {document['player_id'] for document in documents})
+        index.upsert(documents)
+        index.data_version = version
+        mode = f"{len(player_ids)} jogadores atualizados"
+    else:
+        index = SimilarityIndex.build(ColumnarPlayers.from_collection(collection), version)
+        mode = "reconstruído"
+    index.save(path)
+    print(f"Índice de similaridade ({index.size:,} jogadores, {len(FEATURES)} dimensões) {mode} em"
+          f" {time.perf_counter() - start:.2f} s.")
+    return index
+
+
+# Índice em uso pelo processo, trocado quando a tabela colunar é recarregada
+_index = {'index': None, 'store': None, 'lock': None}
+
+
+async def get_similarity_index():
+    """Retorna o índice da versão atual: o gravado, se estiver na versão do snapshot, ou um montado na hora."""
+    store = await queries_async.get_columnar_store()
+    if _index['lock'] is None:
+        _index['lock'] = asyncio.Lock()
+    async with _index['lock']:
+        if _index['index'] is None or _index['store'] is not store:
+            store_version = getattr(store, 'snapshot_header', {}).get('data_version')
+            index = await asyncio.to_thread(SimilarityIndex.load)
+            if index is None or store_version is None or index.data_version != store_version:
+                index = await asyncio.to_thread(SimilarityIndex.build, store, store_version)
+            _index['index'], _index['store'] = index, store
+    return _index['index']
+
+
+@queries_async.query_monitor.instrumented
+async def similar_players(player_id, k=10):
+    return (await get_similarity_index()).similar(player_id, k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mantém o índice de similaridade e busca jogadores de estilo parecido.")
+    parser.add_argument('--uri', default=os.getenv("MONGO_URI", "mongodb://localhost:27017/"))
+    parser.add_argument('--db', default=os.getenv("MONGO_DB", "csgo_db"))
+    parser.add_argument('--path', default=DEFAULT_INDEX_PATH)
+    parser.add_argument('--build', action='store_true', help="Reconstrói o índice a partir da coleção")
+    parser.add_argument('--player', type=int, help="Mostra os jogadores mais parecidos com este")
+    parser.add_argument('-k', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.build:
+        from pymongo import MongoClient
+        client = MongoClient(args.uri)
+        try:
+            refresh_index(client[args.db], path=args.path)
+        finally:
+            client.close()
+
+    if args.player is not None:
+        index = SimilarityIndex.load(args.path)
+        if index is None:
+            print(f"Índice não encontrado em '{args.path}'; gere-o com --build.")
+            return
+        start = time.perf_counter()
+        matches = index.similar(args.player, args.k)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if matches is None:
+            print(f"Jogador {args.player} não encontrado.")
+            return
+        for position, match in enumerate(matches, 1):
+            print(f"{position:>3}. {match['nickname']} ({match['player_id']}) - distância {match['distance']:.3f}")
+        print(f"Busca em {elapsed_ms:.2f} ms.")
+
+
+if __name__ == "__main__":
+    main()
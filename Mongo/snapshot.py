@@ -0,0 +1,227 @@
+import argparse
+import json
+import os
+import struct
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from bson import ObjectId
+
+from backend_colunar import DICTIONARY_COLUMNS, NUMERIC_COLUMNS, ColumnarPlayers
+from cache_consultas import read_collection_version
+
+# Formato do arquivo:
+#   MAGIC (8 bytes) | versão do formato (uint32) | tamanho do cabeçalho (uint32) | cabeçalho JSON
+#   seções de dados alinhadas em 8 bytes, descritas no cabeçalho (offset a partir do início do arquivo)
+# Colunas numéricas são arrays de largura fixa (little-endian); textos ficam em uma tabela de strings
+# (offsets int64 + bytes UTF-8) e os _id em uma seção de 12 bytes por linha.
+MAGIC = b'CSGOSNAP'
+FORMAT_VERSION = 1
+PREAMBLE = struct.Struct('<8sII')
+ALIGNMENT = 8
+DEFAULT_SNAPSHOT_PATH = os.getenv("CSGO_SNAPSHOT_PATH", "snapshots/players.snap")
+# Colunas de texto por jogador gravadas na tabela de strings (além das de ColumnarPlayers.texts)
+STRING_COLUMNS = ['nickname', 'real_name', 'teams', '_content_hash']
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+def _encode_text(value):
+    if isinstance(value, list):
+        return ', '.join(value)
+    return str(value)
+
+
+class StringColumn:
+    """Coluna de textos lida da tabela de strings; cada valor é decodificado só quando acessado."""
+
+    def __init__(self, offsets, blob, nulls=None, null_value=None):
+        self._offsets = offsets
+        self._blob = blob
+        self._nulls = nulls
+        self._null_value = null_value
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, (list, np.ndarray)):
+            return [self[i] for i in index]
+        if self._nulls is not None and self._nulls[index]:
+            return self._null_value
+        return bytes(self._blob[self._offsets[index]:self._offsets[index + 1]]).decode('utf-8')
+
+
+class ObjectIdColumn:
+    """Coluna de _id (12 bytes por linha), convertidos em ObjectId ao serem acessados."""
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def __len__(self):
+        return len(self._raw)
+
+    def __getitem__(self, index):
+        if isinstance(index, (list, np.ndarray)):
+            return [self[i] for i in index]
+        return ObjectId(bytes(self._raw[index]))
+
+
+class _Writer:
+    """Acumula as seções de dados e monta o cabeçalho com os offsets de cada uma."""
+
+    def __init__(self):
+        self.sections = []
+        self.size = 0
+
+    def add(self, data):
+        data = data.tobytes() if isinstance(data, np.ndarray) else bytes(data)
+        offset = self.size
+        padding = -len(data) % ALIGNMENT
+        self.sections.append(data + b'\0' * padding)
+        self.size += len(data) + padding
+        return {'offset': offset, 'nbytes': len(data)}
+
+    def add_strings(self, values):
+        values = list(values)
+        nulls = np.array([_is_missing(value) for value in values], dtype=np.uint8)
+        encoded = [b'' if null else _encode_text(value).encode('utf-8') for value, null in zip(values, nulls)]
+        offsets = np.zeros(len(encoded) + 1, dtype='<i8')
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        entry = {'offsets': self.add(offsets), 'blob': self.add(b''.join(encoded))}
+        if nulls.any():
+            # Ausentes vêm do pandas como NaN; o leitor devolve NaN (ou None) no mesmo lugar
+            null_values = {type(value).__name__ for value in values if _is_missing(value)}
+            entry['nulls'] = self.add(nulls)
+            entry['null_value'] = 'nan' if null_values == {'float'} else None
+        return entry
+
+
+def write_snapshot(store, path, data_version=None):
+    """Grava a tabela colunar em um snapshot binário (de forma atômica: arquivo temporário + rename)."""
+    writer = _Writer()
+    header = {
+        'format_version': FORMAT_VERSION,
+        'data_version': data_version,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'rows': store.size,
+        'columns': {},
+        'codes': {},
+        'dictionaries': {},
+        'strings': {},
+    }
+    for column in NUMERIC_COLUMNS:
+        values = store.columns[column]
+        dtype = '<i8' if values.dtype.kind == 'i' else '<f8'
+        header['columns'][column] = {'dtype': dtype, **writer.add(np.ascontiguousarray(values, dtype=dtype))}
+    for column in DICTIONARY_COLUMNS:
+        header['codes'][column] = {'dtype': '<i4', **writer.add(np.ascontiguousarray(store.codes[column], dtype='<i4'))}
+        header['dictionaries'][column] = writer.add_strings(store.dictionaries[column])
+    texts = {'nickname': store.nicknames, **store.texts}
+    for column in STRING_COLUMNS:
+        if column in texts:
+            header['strings'][column] = writer.add_strings(texts[column][row] for row in range(store.size))
+    header['ids'] = writer.add(b''.join(ObjectId(store.ids[row]).binary for row in range(store.size)))
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    header_bytes += b' ' * (-(PREAMBLE.size + len(header_bytes)) % ALIGNMENT)
+    data_start = PREAMBLE.size + len(header_bytes)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temporary = f"{path}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for section in writer.sections:
+            f.write(section)
+    # Leitores que já mapearam o arquivo antigo continuam com ele até fecharem
+    os.replace(temporary, path)
+    return data_start + writer.size
+
+
+def read_header(path):
+    """Lê apenas o cabeçalho do snapshot (versões, número de linhas e esquema)."""
+    with open(path, 'rb') as f:
+        magic, format_version, header_size = PREAMBLE.unpack(f.read(PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError(f"'{path}' não é um snapshot de jogadores.")
+        if format_version != FORMAT_VERSION:
+            raise ValueError(f"Versão de snapshot não suportada: {format_version} (esperada {FORMAT_VERSION}).")
+        header = json.loads(f.read(header_size))
+    header['data_start'] = PREAMBLE.size + header_size
+    return header
+
+
+def load_snapshot(path):
+    """Mapeia o snapshot em memória e retorna a tabela colunar, sem copiar as colunas.
+
+    As páginas do arquivo só são lidas do disco quando as consultas acessam os dados.
+    """
+    header = read_header(path)
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    start = header['data_start']
+
+    def section(entry, dtype=np.uint8):
+        offset = start + entry['offset']
+        return data[offset:offset + entry['nbytes']].view(dtype)
+
+    def strings(entry):
+        nulls = section(entry['nulls']) if 'nulls' in entry else None
+        null_value = float('nan') if entry.get('null_value') == 'nan' else None
+        return StringColumn(section(entry['offsets'], '<i8'), section(entry['blob']), nulls, null_value)
+
+    columns = {column: section(entry, entry['dtype']) for column, entry in header['columns'].items()}
+    codes = {column: section(entry, entry['dtype']) for column, entry in header['codes'].items()}
+    dictionaries = {}
+    for column, entry in header['dictionaries'].items():
+        dictionary = strings(entry)
+        dictionaries[column] = [dictionary[i] for i in range(len(dictionary))]
+    texts = {column: strings(entry) for column, entry in header['strings'].items() if column != 'nickname'}
+    ids = ObjectIdColumn(section(header['ids']).reshape(-1, 12))
+    store = ColumnarPlayers(columns, codes, dictionaries, ids, strings(header['strings']['nickname']), texts)
+    store.snapshot_header = header
+    return store
+
+
+def export_snapshot(db, path=DEFAULT_SNAPSHOT_PATH, players_collection='players'):
+    """Lê a coleção de jogadores e grava o snapshot, marcado com a versão atual dos dados."""
+    data_version = read_collection_version(db)
+    store = ColumnarPlayers.from_collection(db[players_collection])
+    size = write_snapshot(store, path, data_version)
+    print(f"Snapshot com {store.size:,} jogadores ({size / 1024 / 1024:.1f} MB) gravado em '{path}'.")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta ou inspeciona o snapshot binário da coleção de jogadores.")
+    parser.add_argument('--path', default=DEFAULT_SNAPSHOT_PATH)
+    parser.add_argument('--uri', default=os.getenv("MONGO_URI", "mongodb://localhost:27017/"))
+    parser.add_argument('--db', default=os.getenv("MONGO_DB", "csgo_db"))
+    parser.add_argument('--info', action='store_true', help="Mostra o cabeçalho e mede a abertura do snapshot")
+    args = parser.parse_args()
+
+    if args.info:
+        header = read_header(args.path)
+        print(f"Formato v{header['format_version']}, dados v{header['data_version']}, "
+              f"{header['rows']:,} jogadores, criado em {header['created_at']}")
+        start = time.perf_counter()
+        store = load_snapshot(args.path)
+        opened = time.perf_counter() - start
+        store.ranking_kills_assists()
+        first_query = time.perf_counter() - start - opened
+        print(f"Abertura: {opened * 1000:.1f} ms - primeira consulta: {first_query * 1000:.1f} ms")
+        return
+
+    from pymongo import MongoClient
+    client = MongoClient(args.uri)
+    try:
+        export_snapshot(client[args.db], args.path)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import math
+import os
+
+import pandas as pd
+import pytest
+
+import insercao_banco
+from backend_colunar import AGE_BOUNDARIES, ColumnarPlayers
+
+CSV_PATH = os.path.join(os.path.dirname(__file__), '..', 'cs_pro_players', 'csgo_players.csv')
+
+# Jogadores pequenos o bastante para conferir cada resultado à mão; o jogador 4 não tem idade
+FIXTURE = [
+    {'player_id': 1, 'nickname': 'alpha', 'country': 'Brazil', 'current_team': 'T1', 'age': 20,
+     'total_kills': 1000, 'total_deaths': 800, 'maps_played': 100, 'kills_per_death': 1.25,
+     'kills_per_round': 0.80, 'assists_per_round': 0.10, 'headshot_percentage': 45.0,
+     'team_win_percent_after_first_kill': 75.0, 'rifle_kills': 600, 'sniper_kills': 100,
+     'total_opening_kills': 200, 'rating': 1.10},
+    {'player_id': 2, 'nickname': 'bravo', 'country': 'Brazil', 'current_team': 'T2', 'age': 27,
+     'total_kills': 3000, 'total_deaths': 2500, 'maps_played': 300, 'kills_per_death': 1.20,
+     'kills_per_round': 0.75, 'assists_per_round': 0.20, 'headshot_percentage': 55.0,
+     'team_win_percent_after_first_kill': 80.0, 'rifle_kills': 1500, 'sniper_kills': 900,
+     'total_opening_kills': 500, 'rating': 1.20},
+    {'player_id': 3, 'nickname': 'charlie', 'country': 'France', 'current_team': 'T1', 'age': 31,
+     'total_kills': 2000, 'total_deaths': 2100, 'maps_played': 250, 'kills_per_death': 0.95,
+     'kills_per_round': 0.70, 'assists_per_round': 0.12, 'headshot_percentage': 35.0,
+     'team_win_percent_after_first_kill': 70.0, 'rifle_kills': 1200, 'sniper_kills': 50,
+     'total_opening_kills': 300, 'rating': 0.98},
+    {'player_id': 4, 'nickname': 'delta', 'country': 'France', 'current_team': 'T2', 'age': None,
+     'total_kills': 500, 'total_deaths': 400, 'maps_played': 40, 'kills_per_death': 1.25,
+     'kills_per_round': 0.85, 'assists_per_round': 0.02, 'headshot_percentage': 30.0,
+     'team_win_percent_after_first_kill': 72.0, 'rifle_kills': 400, 'sniper_kills': 20,
+     'total_opening_kills': 60, 'rating': 1.05},
+]
+
+
+def build_store(df):
+    """Tabela colunar montada como na carga: normalização e documentos aninhados de insercao_banco.py."""
+    return ColumnarPlayers.from_documents(insercao_banco.dataframe_to_documents(df))
+
+
+@pytest.fixture(scope='module')
+def store():
+    return build_store(pd.DataFrame(FIXTURE))
+
+
+@pytest.fixture(scope='module')
+def players():
+    return insercao_banco.normalize_dataframe(pd.read_csv(CSV_PATH))
+
+
+@pytest.fixture(scope='module')
+def csv_store(players):
+    return build_store(players)
+
+
+def _key(value):
+    """Grupo sem valor: None no backend, NaN no pandas."""
+    return None if value is None or (isinstance(value, float) and math.isnan(value)) else value
+
+# ======================
+# Fixture pequena
+# ======================
+
+def test_simple_queries(store):
+    assert store.kill_difference_among_players_with_maps_above(50) == [{'_id': None, 'kill_difference': 2000}]
+    assert store.kill_difference_among_players_with_maps_above(300) == []
+    assert [row['nickname'] for row in store.ranking_kills_assists()] == ['bravo', 'alpha', 'delta', 'charlie']
+    assert {row['player_id'] for row in store.players_with_opening_kills_and_rating_above(100, 1.0)} == {1, 2}
+    assert store.leaderboard(['rating'], 2)['rating'] == [
+        {'player_id': 2, 'nickname': 'bravo', 'value': 1.20},
+        {'player_id': 1, 'nickname': 'alpha', 'value': 1.10},
+    ]
+    top_killers = store.get_top_killers()
+    assert top_killers['rifle_kills'] == {'player_id': 2, 'nickname': 'bravo', 'rifle_kills': 1500}
+    assert top_killers['sniper_kills'] == {'player_id': 2, 'nickname': 'bravo', 'sniper_kills': 900}
+
+
+def test_missing_player(store):
+    stats = store.player_stats([1, 99])
+    assert stats[1]['nickname'] == 'alpha'
+    assert stats[99] == {'player_id': 99, 'missing': True}
+    assert store.percentage_maps_with_kills_above(99, 1) is None
+
+
+def test_advanced_queries(store):
+    assert {row['player_id'] for row in store.players_with_win_percent_after_first_kill_above(72)} == {1, 2}
+    assert store.win_percentage_after_first_kill_by_country(71) == [
+        {'_id': 'Brazil', 'average_win_percent': 77.5, 'total_players': 2},
+        {'_id': 'France', 'average_win_percent': 72.0, 'total_players': 1},
+    ]
+    assert store.average_kills_by_country(0) == [
+        {'_id': 'Brazil', 'average_kills': 2000.0, 'total_players': 2},
+        {'_id': 'France', 'average_kills': 1250.0, 'total_players': 2},
+    ]
+    assert [row['nickname'] for row in store.top_kill_per_round_low_headshot(50)] == ['delta', 'alpha', 'charlie']
+    teams = store.total_kills_by_weapon_per_team()
+    assert [(row['_id'], row['rifle_kills'], row['sniper_kills']) for row in teams] == [
+        ('T2', 1900, 920), ('T1', 1800, 150)]
+    assert [(row['nickname'], row['kill_to_death_diff'])
+            for row in store.kill_death_difference_by_maps_and_kills(50, 1500)] == [('bravo', 500), ('charlie', -100)]
+
+
+def test_kd_ratio_by_age_group(store):
+    groups = {row['_id']: (row['average_kd_ratio'], row['total_players']) for row in store.kd_ratio_by_age_group()}
+    # Jogador sem idade cai em "Other", como no $bucket
+    assert groups == {18: (1.25, 1), 25: (1.20, 1), 30: (0.95, 1), 'Other': (1.25, 1)}
+
+# ======================
+# CSV do repositório
+# ======================
+# Os valores esperados são calculados com o pandas diretamente sobre o CSV normalizado
+
+def test_csv_leaderboard(csv_store, players):
+    expected = players.sort_values(['rating', 'player_id'], ascending=[False, True]).head(5)
+    result = csv_store.leaderboard(['rating'], 5)['rating']
+    assert [row['player_id'] for row in result] == expected['player_id'].tolist()
+    assert result[0]['nickname'] == 'ZywOo'
+
+
+def test_csv_kill_difference(csv_store, players):
+    for threshold in (0, 500, 1000):
+        kills = players.loc[players['maps_played'] > threshold, 'total_kills']
+        assert csv_store.kill_difference_among_players_with_maps_above(threshold) == [
+            {'_id': None, 'kill_difference': int(kills.max() - kills.min())}]
+
+
+def test_csv_average_kills_by_country(csv_store, players):
+    selected = players[players['maps_played'] > 500]
+    expected = selected.groupby('country')['total_kills'].agg(['mean', 'size'])
+    result = csv_store.average_kills_by_country(500)
+    assert len(result) == len(expected)
+    for row in result:
+        assert row['average_kills'] == pytest.approx(expected.loc[row['_id'], 'mean'])
+        assert row['total_players'] == expected.loc[row['_id'], 'size']
+    averages = [row['average_kills'] for row in result]
+    assert averages == sorted(averages, reverse=True)
+
+
+def test_csv_win_percentage_by_country(csv_store, players):
+    selected = players[players['team_win_percent_after_first_kill'] > 74]
+    expected = selected.groupby('country')['team_win_percent_after_first_kill'].agg(['mean', 'size'])
+    result = {row['_id']: row for row in csv_store.win_percentage_after_first_kill_by_country(74)}
+    assert set(result) == set(expected.index)
+    for country, row in result.items():
+        assert row['average_win_percent'] == pytest.approx(expected.loc[country, 'mean'])
+        assert row['total_players'] == expected.loc[country, 'size']
+
+
+def test_csv_kd_ratio_by_age_group(csv_store, players):
+    groups = pd.cut(players['age'], AGE_BOUNDARIES, right=False, labels=AGE_BOUNDARIES[:-1])
+    expected = players.groupby(groups.astype(object).fillna('Other'))['kills_per_death'].agg(['mean', 'size'])
+    result = {row['_id']: row for row in csv_store.kd_ratio_by_age_group()}
+    assert set(result) == set(expected.index)
+    for group, row in result.items():
+        assert row['average_kd_ratio'] == pytest.approx(expected.loc[group, 'mean'])
+        assert row['total_players'] == expected.loc[group, 'size']
+
+
+def test_csv_total_kills_by_weapon_per_team(csv_store, players):
+    expected = players.groupby('current_team', dropna=False)[['rifle_kills', 'sniper_kills']].sum()
+    expected.index = [_key(team) for team in expected.index]
+    result = csv_store.total_kills_by_weapon_per_team()
+    assert len(result) == len(expected)
+    for row in result:
+        team = _key(row['_id'])
+        assert (row['rifle_kills'], row['sniper_kills']) == tuple(expected.loc[team])
+    rifle_kills = [row['rifle_kills'] for row in result]
+    assert rifle_kills == sorted(rifle_kills, reverse=True)
+
+
+def test_csv_players_with_opening_kills_and_rating_above(csv_store, players):
+    expected = players[(players['total_opening_kills'] > 500) & (players['rating'] > 1.0)]
+    result = csv_store.players_with_opening_kills_and_rating_above(500, 1.0)
+    assert sorted(row['player_id'] for row in result) == sorted(expected['player_id'])
@@ -0,0 +1,138 @@
+import asyncio
+from collections import OrderedDict
+
+import mongomock
+import pytest
+
+import historico
+import modelo
+import queries_async
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(historico, 'CHECKPOINT_INTERVAL', 2)
+    return mongomock.MongoClient()['csgo_test']
+
+
+class AsyncCursor:
+    """Cursor do mongomock com a interface assíncrona usada por historico.py (sort + to_list)."""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self.cursor = self.cursor.sort(*args, **kwargs)
+        return self
+
+    async def to_list(self, length=None):
+        return list(self.cursor)
+
+
+class AsyncCollection:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def find_one(self, *args, **kwargs):
+        return self.collection.find_one(*args, **kwargs)
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self.collection.find(*args, **kwargs))
+
+
+@pytest.fixture
+def async_db(db, monkeypatch):
+    """O mesmo banco do mongomock, servido às funções assíncronas no lugar do cliente do queries_async."""
+    client = {'csgo_test': {name: AsyncCollection(db[name])
+                            for name in (historico.HISTORY_COLLECTION, historico.VERSIONS_COLLECTION)}}
+    monkeypatch.setattr(queries_async, 'get_client', lambda: client)
+    monkeypatch.setattr(queries_async, 'DB_NAME', 'csgo_test')
+    monkeypatch.setattr(historico, '_stores', OrderedDict())
+    return db
+
+
+def load(db, version, rows):
+    """Substitui a coleção de jogadores pelas linhas informadas e registra a versão."""
+    db.players.delete_many({})
+    db.players.insert_many([modelo.to_document(row) for row in rows])
+    historico.record_version(db, version)
+
+
+def series(db, player_id, fields=('rating',)):
+    deltas = list(db[historico.HISTORY_COLLECTION].find({'player_id': player_id}).sort('version', 1))
+    versions = list(db[historico.VERSIONS_COLLECTION].find({}).sort('_id', 1))
+    return [(point['version'], *(point[field] for field in fields))
+            for point in historico.stat_series(player_id, deltas, versions, fields)]
+
+
+def test_diff_and_replay_roundtrip():
+    previous = {1: {'nickname': 'a', 'rating': 1.0}, 2: {'nickname': 'b', 'rating': 0.9}}
+    current = {1: {'nickname': 'a', 'rating': 1.1}, 3: {'nickname': 'c'}}
+    deltas = historico.diff(previous, current)
+    assert {(delta['player_id'], delta['kind']) for delta in deltas} == {(1, 'set'), (2, 'delete'), (3, 'set')}
+    state = historico.replay([{'player_id': player_id, 'kind': 'checkpoint', 'fields': fields}
+                              for player_id, fields in previous.items()] + deltas)
+    assert state == current
+
+
+def test_incremental_versions_reconstruct(db):
+    load(db, 1, [{'player_id': 1, 'nickname': 'a', 'rating': 1.0}, {'player_id': 2, 'nickname': 'b', 'rating': 0.9}])
+    load(db, 2, [{'player_id': 1, 'nickname': 'a', 'rating': 1.2}, {'player_id': 2, 'nickname': 'b', 'rating': 0.9}])
+    assert historico.reconstruct(db, 1)[1]['rating'] == 1.0
+    assert historico.reconstruct(db, 2)[1]['rating'] == 1.2
+    assert series(db, 1) == [(1, 1.0), (2, 1.2)]
+
+
+def test_delete_on_checkpoint_version(db):
+    # Versão 3 é checkpoint (CHECKPOINT_INTERVAL = 2) e remove o jogador 2
+    load(db, 1, [{'player_id': 1, 'nickname': 'a', 'rating': 1.0}, {'player_id': 2, 'nickname': 'b', 'rating': 0.9}])
+    load(db, 2, [{'player_id': 1, 'nickname': 'a', 'rating': 1.0}, {'player_id': 2, 'nickname': 'b', 'rating': 0.8}])
+    load(db, 3, [{'player_id': 1, 'nickname': 'a', 'rating': 1.1}])
+    assert db[historico.VERSIONS_COLLECTION].find_one({'_id': 3})['checkpoint']
+
+    assert set(historico.reconstruct(db, 3)) == {1}
+    assert series(db, 2) == [(1, 0.9), (2, 0.8)]
+    assert series(db, 1) == [(1, 1.0), (2, 1.0), (3, 1.1)]
+
+
+def test_player_back_after_delete_on_checkpoint(db):
+    load(db, 1, [{'player_id': 1, 'nickname': 'a', 'rating': 1.0}, {'player_id': 2, 'nickname': 'b', 'rating': 0.9}])
+    load(db, 2, [{'player_id': 1, 'nickname': 'a', 'rating': 1.0}])
+    load(db, 3, [{'player_id': 1, 'nickname': 'a', 'rating': 1.0}])
+    load(db, 4, [{'player_id': 1, 'nickname': 'a', 'rating': 1.0}, {'player_id': 2, 'nickname': 'b', 'rating': 1.3}])
+    assert series(db, 2) == [(1, 0.9), (4, 1.3)]
+
+
+def test_player_stat_history(async_db):
+    load(async_db, 1, [{'player_id': 1, 'nickname': 'a', 'rating': 1.0}])
+    load(async_db, 2, [{'player_id': 1, 'nickname': 'a', 'rating': 1.1},
+                       {'player_id': 2, 'nickname': 'b', 'rating': 0.9, 'maps_played': 10}])
+    load(async_db, 3, [{'player_id': 2, 'nickname': 'b', 'rating': 1.0, 'maps_played': 12}])
+
+    history = asyncio.run(historico.player_stat_history(2, ('rating', 'maps_played')))
+    assert [(row['version'], row['rating'], row['maps_played']) for row in history] == [(2, 0.9, 10), (3, 1.0, 12)]
+    assert all(row['recorded_at'] is not None for row in history)
+    # O jogador 1 sai na versão 3: ela não entra na série
+    assert [row['version'] for row in asyncio.run(historico.player_stat_history(1))] == [1, 2]
+    assert asyncio.run(historico.player_stat_history(99)) == []
+
+
+def test_cached_query_as_of_uses_older_version(async_db, monkeypatch):
+    load(async_db, 1, [{'player_id': 1, 'nickname': 'a', 'rating': 1.0}, {'player_id': 2, 'nickname': 'b', 'rating': 0.9}])
+    load(async_db, 3, [{'player_id': 1, 'nickname': 'a', 'rating': 0.8}, {'player_id': 2, 'nickname': 'b', 'rating': 1.2}])
+
+    # Com as_of a consulta não passa pelo MongoDB nem pelo cache, só pelo histórico
+    async def unexpected(*args, **kwargs):
+        raise AssertionError("consulta com as_of não deveria rodar no MongoDB")
+    monkeypatch.setattr(queries_async, 'run_plan', unexpected)
+
+    def top(as_of):
+        result = asyncio.run(queries_async.leaderboard(['rating'], 1, as_of=as_of))
+        return [(row['player_id'], row['value']) for row in result['rating']]
+
+    assert top(1) == [(1, 1.0)]
+    # Versão 2 não foi registrada: vale a última até ela
+    assert top(2) == [(1, 1.0)]
+    assert top(3) == [(2, 1.2)]
+    with pytest.raises(ValueError):
+        asyncio.run(queries_async.leaderboard(['rating'], 1, as_of=0))
@@ -0,0 +1,46 @@
+import asyncio
+from types import SimpleNamespace
+
+from cache_consultas import QueryCache
+from instrumentacao import QueryMonitor
+
+
+def aggregate_event():
+    return SimpleNamespace(command_name='aggregate', command={'aggregate': 'players', 'pipeline': []},
+                           database_name='csgo_test')
+
+
+def test_hits_come_from_cache_and_commands_from_innermost_call():
+    monitor = QueryMonitor(slow_query_log='', explain_sample_rate=0)
+    cache = QueryCache(on_hit=monitor.cache_hit)
+
+    @monitor.instrumented
+    @cache.cached
+    async def inner(value):
+        monitor.started(aggregate_event())
+        return [value]
+
+    @monitor.instrumented
+    @cache.cached
+    async def outer(value):
+        return await inner(value)
+
+    # Sem cache e sem comandos, como no backend colunar
+    @monitor.instrumented
+    async def columnar(value):
+        return [value]
+
+    async def scenario():
+        await outer(1)
+        await outer(1)
+        await inner(1)
+        await columnar(1)
+
+    asyncio.run(scenario())
+    stats = monitor.stats()
+    assert (stats['outer']['calls'], stats['outer']['cache_hits']) == (2, 1)
+    assert (stats['inner']['calls'], stats['inner']['cache_hits']) == (2, 1)
+    assert stats['columnar']['cache_hits'] == 0
+    # O comando de inner não é repetido na chamada externa
+    assert [sample['commands'] for sample in monitor._samples['outer']] == [0, 0]
+    assert [sample['commands'] for sample in monitor._samples['inner']] == [1, 0]
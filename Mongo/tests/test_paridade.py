@@ -0,0 +1,87 @@
+import mongomock
+import pandas as pd
+import pytest
+
+import agregados
+import backend_colunar
+import insercao_banco
+import modelo
+import registro_consultas
+from backend_colunar import PARITY_CASES, UNORDERED, ColumnarPlayers
+
+from test_backend_colunar import CSV_PATH
+
+# Estágios que o mongomock não implementa: os casos que dependem deles ficam de fora, com o motivo
+UNSUPPORTED = {
+    'get_top_killers': "leaderboard com $unionWith, que o mongomock não implementa",
+    'leaderboard': "$unionWith não é implementado pelo mongomock",
+}
+# Casos em que o mongomock diverge do servidor: $group sobre nenhum documento devolve um grupo vazio
+# no mongomock, e nenhum documento no MongoDB (que é o que o backend colunar reproduz)
+MONGOMOCK_DIFFERENCES = [
+    ('kill_difference_among_players_with_maps_above', (10 ** 9,),
+     "$group sem documentos de entrada devolve um grupo no mongomock e nada no MongoDB"),
+]
+
+
+@pytest.fixture(scope='module')
+def db():
+    """Banco mongomock com o CSV carregado como em insercao_banco.py e os resumos de agregados.py."""
+    db = mongomock.MongoClient()['csgo_test']
+    documents = insercao_banco.dataframe_to_documents(pd.read_csv(CSV_PATH))
+    db[registro_consultas.PLAYERS_COLLECTION].insert_many(documents)
+    # Mesmo $group de agregados.refresh_rollup; o $merge final não existe no mongomock, então o
+    # resultado é gravado com insert_many
+    for name, rollup in agregados.ROLLUPS.items():
+        groups = list(db[registro_consultas.PLAYERS_COLLECTION].aggregate([
+            {'$group': {'_id': rollup['group_id'], **rollup['accumulators']}}]))
+        db[name].insert_many(groups)
+    return db
+
+
+@pytest.fixture(scope='module')
+def store(db):
+    return ColumnarPlayers.from_collection(db[registro_consultas.PLAYERS_COLLECTION])
+
+
+def run_plan(db, name, *args):
+    """Versão síncrona de queries_async.run_plan."""
+    plan = registro_consultas.get_plan(name)
+    spec = plan.build(*args)
+    collection = db[plan.collection]
+    if plan.operation == 'aggregate':
+        return list(collection.aggregate(spec['pipeline']))
+    cursor = collection.find(spec['filter'], spec.get('projection'))
+    if spec.get('sort'):
+        cursor = cursor.sort(spec['sort'])
+    if spec.get('limit'):
+        cursor = cursor.limit(spec['limit'])
+    return list(cursor)
+
+
+def mongo_result(db, name, *args):
+    """Resultado do plano no formato devolvido por queries_async (mesmo pós-processamento)."""
+    if name == 'percentage_maps_with_kills_above':
+        player_id, kill_threshold = args
+        return mongo_result(db, 'player_stats', [player_id], kill_threshold)[player_id].get('percentage_rounds_above')
+    if name == 'player_stats':
+        player_ids, kill_threshold = list(dict.fromkeys(args[0])), args[1]
+        found = {document['player_id']: modelo.player_summary(document, kill_threshold)
+                 for document in run_plan(db, name, player_ids, kill_threshold)}
+        return {player_id: found.get(player_id, {'player_id': player_id, 'missing': True})
+                for player_id in player_ids}
+    return run_plan(db, name, *args)
+
+
+@pytest.mark.parametrize('name, args', [(name, args) for name, cases in PARITY_CASES.items() for args in cases])
+def test_columnar_matches_mongo_pipeline(db, store, name, args):
+    if name in UNSUPPORTED:
+        pytest.skip(UNSUPPORTED[name])
+    for case_name, case_args, reason in MONGOMOCK_DIFFERENCES:
+        if (case_name, case_args) == (name, args):
+            pytest.skip(reason)
+    expected = mongo_result(db, name, *args)
+    actual = getattr(store, name)(*args)
+    if name in UNORDERED:
+        expected, actual = backend_colunar._canonical(expected), backend_colunar._canonical(actual)
+    assert backend_colunar._same(expected, actual), (expected, actual)
@@ -0,0 +1,25 @@
+import pandas as pd
+import pytest
+
+from percentis import PercentileIndex
+from test_backend_colunar import CSV_PATH, build_store
+
+
+@pytest.fixture(scope='module')
+def index():
+    return PercentileIndex.build(build_store(pd.read_csv(CSV_PATH)))
+
+
+@pytest.mark.parametrize('field', ['maps_played', 'rating', 'age'])
+@pytest.mark.parametrize('low, high', [(0, 100), (90, 100), (40, 60), (33.3, 33.4), (50, 50), (0, 0.01), (70, 20)])
+def test_between_matches_rank(index, field, low, high):
+    # Colunas com muitos empates: o trecho retornado tem de bater com o percentil de cada jogador
+    expected = set()
+    for player_id in index.store.columns['player_id'].tolist():
+        entry = index.rank(player_id, field)
+        if entry['percentile'] is not None and low <= entry['percentile'] <= high:
+            expected.add(player_id)
+    entries = index.between(field, low, high)
+    assert all(low <= entry['percentile'] <= high for entry in entries)
+    assert {entry['player_id'] for entry in entries} == expected
+    assert [entry['value'] for entry in entries] == sorted((entry['value'] for entry in entries), reverse=True)